@@ -0,0 +1,316 @@
+"""与界面无关的分析函数：只做计算并返回数据（DataFrame / ndarray / 数值）
+
+utils.py 中的绘图函数、Streamlit 页面以及批处理脚本和 API 服务都调用这里，
+不依赖 streamlit 和 matplotlib，可以在任何进程中复用、并行或缓存结果。
+"""
+import hashlib
+import warnings
+
+import numpy as np
+import pandas as pd
+
+TOP_PROTEINS = 10
+TOP_COMPARTMENTS = 20
+LABEL_THRESHOLD = 0.05
+
+
+class AnalysisError(ValueError):
+    pass
+
+
+def require_columns(df, *columns):
+    missing = [col for col in columns if col not in df.columns]
+    if missing:
+        raise AnalysisError(f"Unknown columns: {', '.join(map(str, missing))}")
+
+
+def compartment_cumulative(compartment, cond, mass_fraction_df, compartment_df, tables=None, top_n=TOP_PROTEINS):
+    """某细胞器相关蛋白在条件 cond 下按质量分数降序排列的累积曲线
+
+    返回 {'total': 总质量分数, 'top': 前 top_n 个蛋白 [gene, cond],
+          'curve': 全部蛋白 [gene, cond, cumulative_mass]}
+    有预计算的累积表（见 compartment_tables.py）时直接查表。
+    """
+    if tables is not None and (compartment, cond) in tables:
+        curve, total = tables.lookup(compartment, cond)
+        return {'total': total, 'top': curve[['gene', cond]].head(top_n), 'curve': curve}
+    from compartment_engine import CompartmentEngine
+
+    engine = CompartmentEngine.from_annotation(mass_fraction_df['gene'], compartment_df)
+    if compartment not in engine or cond not in mass_fraction_df.columns:
+        raise AnalysisError(f"{compartment}或{cond}列不存在")
+    selected = mass_fraction_df.iloc[engine.members(compartment)]
+    curve = selected[['gene', cond]].sort_values(by=cond, ascending=False)
+    top = curve.head(top_n)
+    curve = curve.assign(cumulative_mass=curve[cond].cumsum())
+    return {'total': selected[cond].sum(), 'top': top, 'curve': curve}
+
+
+def top_compartments(data, column, n=TOP_COMPARTMENTS):
+    """按蛋白质量比例降序的前 n 个细胞器 [compartment, column]"""
+    require_columns(data, 'compartment', column)
+    return data[['compartment', column]].sort_values(by=column, ascending=False).head(n)
+
+
+def labeled_compartments(data, column1, column2, threshold=LABEL_THRESHOLD, max_labels=None):
+    """两个条件下比例都不低于 threshold 的细胞器（散点图中需要标注的点）
+
+    指定 max_labels 时按两个条件比例之和降序只保留前 max_labels 个。
+    """
+    require_columns(data, 'compartment', column1, column2)
+    mask = (data[column1] >= threshold) & (data[column2] >= threshold)
+    labels = data.loc[mask, list(dict.fromkeys(['compartment', column1, column2]))]
+    if max_labels is not None:
+        order = np.argsort(-(labels[column1].to_numpy() + labels[column2].to_numpy()), kind='stable')
+        labels = labels.iloc[order[:max_labels]]
+    return labels
+
+
+def log_pair_rows(df, column1, column2):
+    """两个条件的 log 值，只保留两者都为有限值的基因；返回 (行号, x, y)"""
+    require_columns(df, column1, column2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = np.log(df[column1].to_numpy(dtype=np.float64))
+        y = np.log(df[column2].to_numpy(dtype=np.float64))
+    rows = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    return rows, x[rows], y[rows]
+
+
+def log_pair(df, column1, column2):
+    """两个条件的 log 值，只保留两者都为有限值的基因"""
+    _, x, y = log_pair_rows(df, column1, column2)
+    return x, y
+
+
+def log_correlation(df, column1, column2, correlations=None):
+    """两个条件 log 质量分数的 Pearson 相关系数；有预计算矩阵（见 correlation.py）时直接查表"""
+    if correlations is not None and (column1, column2) in correlations:
+        return correlations.lookup(column1, column2)
+    x, y = log_pair(df, column1, column2)
+    return np.corrcoef(x, y)[0, 1]
+
+
+def density_downsample(x, y, max_points, bins=64, seed=0):
+    """按点密度抽样，返回保留的下标（升序）
+
+    在 bins x bins 网格上统计每格点数，求一个统一的每格上限，使保留的总点数不超过 max_points：
+    稀疏区域（包括离群点）全部保留，只有密集格子被随机抽稀。同样的输入总是得到同样的结果。
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if max_points is None or n <= max_points:
+        return np.arange(n)
+
+    def cell_index(values):
+        low, high = values.min(), values.max()
+        scaled = (values - low) / (high - low) if high > low else np.zeros_like(values)
+        return np.minimum((scaled * bins).astype(np.int64), bins - 1)
+
+    cells = cell_index(x) * bins + cell_index(y)
+    counts = np.bincount(cells, minlength=bins * bins)
+
+    # 二分查找每格上限 cap，使 sum(min(counts, cap)) <= max_points
+    low, high = 0, int(counts.max())
+    while low < high:
+        cap = (low + high + 1) // 2
+        if np.minimum(counts, cap).sum() <= max_points:
+            low = cap
+        else:
+            high = cap - 1
+    cap = max(low, 1)
+
+    # 每格内按随机顺序编号，保留编号小于 cap 的点
+    order = np.random.default_rng(seed).permutation(n)
+    order = order[np.argsort(cells[order], kind='stable')]
+    sorted_cells = cells[order]
+    starts = np.searchsorted(sorted_cells, sorted_cells, side='left')
+    rank = np.arange(n) - starts
+    return np.sort(order[rank < cap])
+
+
+def group_statistics(df, label, conditions):
+    """每行（基因或细胞器）在一组条件中的均值、标准差（ddof=1）和变异系数，整块矩阵一次计算
+
+    缺失值不参与计算；返回 [label, mean, std, cv, n]。
+    """
+    conditions = list(conditions)
+    require_columns(df, label, *conditions)
+    values = df[conditions].to_numpy(dtype=np.float64)
+    valid = np.isfinite(values)
+    n = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(valid, values, 0.0).sum(axis=1) / n
+        squares = np.where(valid, (values - mean[:, None]) ** 2, 0.0).sum(axis=1)
+        std = np.sqrt(squares / (n - 1))
+        std[n < 2] = np.nan
+        cv = std / mean
+    return pd.DataFrame({label: df[label].to_numpy(), 'mean': mean, 'std': std, 'cv': cv, 'n': n})
+
+
+def group_fold_change(a, b, label):
+    """两组条件的均值之比（B / A）及 log2 倍数变化，返回每行一条记录；a / b 为两组的 group_statistics 结果"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fold = b['mean'].to_numpy() / a['mean'].to_numpy()
+        log2_fold = np.log2(fold)
+    return pd.DataFrame({
+        label: a[label],
+        'mean_a': a['mean'], 'cv_a': a['cv'],
+        'mean_b': b['mean'], 'cv_b': b['cv'],
+        'fold_change': fold, 'log2_fold_change': log2_fold,
+    })
+
+
+def compartment_totals(mass_fraction_df, compartment_df, conditions):
+    """各细胞器注释蛋白在每个条件下的质量分数之和，返回 [compartment, 条件...]（只含有成员的细胞器，按名称排序）"""
+    from compartment_engine import CompartmentEngine
+
+    conditions = list(conditions)
+    require_columns(mass_fraction_df, 'gene', *conditions)
+    engine = CompartmentEngine.from_annotation(mass_fraction_df['gene'], compartment_df)
+    table = engine.ratio_table(mass_fraction_df[conditions].to_numpy().T, conditions)
+    return table[engine.sizes() > 0].sort_values('compartment', ignore_index=True)
+
+
+def group_comparison(df, label, group_a, group_b=()):
+    """一组时返回每行统计量，两组时返回倍数变化表；以及绘图用的 {组名: 统计量}"""
+    stats = {f'Group A ({len(group_a)})': group_statistics(df, label, group_a)}
+    if group_b:
+        stats[f'Group B ({len(group_b)})'] = group_statistics(df, label, group_b)
+        stats_a, stats_b = stats.values()
+        return group_fold_change(stats_a, stats_b, label), stats
+    return next(iter(stats.values())), stats
+
+
+def benjamini_hochberg(p_values):
+    """Benjamini-Hochberg 校正后的 q 值，NaN 不参与排序并保持为 NaN"""
+    p_values = np.asarray(p_values, dtype=np.float64)
+    q_values = np.full(p_values.shape, np.nan)
+    valid = np.flatnonzero(np.isfinite(p_values))
+    if len(valid) == 0:
+        return q_values
+    order = valid[np.argsort(p_values[valid])]
+    ranked = p_values[order] * len(valid) / np.arange(1, len(valid) + 1)
+    # 从大到小取累计最小值，保证 q 值随 p 值单调
+    q_values[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1.0)
+    return q_values
+
+
+def welch_test(log_a, log_b):
+    """逐行 Welch t 检验，log_a / log_b 为 (行数, 条件数)，NaN 表示缺失；返回 (t, p)"""
+    from scipy.stats import t as t_distribution
+
+    n_a = np.isfinite(log_a).sum(axis=1)
+    n_b = np.isfinite(log_b).sum(axis=1)
+    # 有效值少于 2 个的行 nanvar / nanmean 会警告（np.errstate 管不到），这些行下面置为 NaN
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        var_a = np.nanvar(log_a, axis=1, ddof=1) / n_a
+        var_b = np.nanvar(log_b, axis=1, ddof=1) / n_b
+        se = var_a + var_b
+        t = (np.nanmean(log_b, axis=1) - np.nanmean(log_a, axis=1)) / np.sqrt(se)
+        dof = se ** 2 / (var_a ** 2 / (n_a - 1) + var_b ** 2 / (n_b - 1))
+    usable = (n_a >= 2) & (n_b >= 2) & np.isfinite(t) & (se > 0)
+    t = np.where(usable, t, np.nan)
+    p = np.where(usable, 2 * t_distribution.sf(np.abs(t), np.where(usable, dof, 1.0)), np.nan)
+    return t, p
+
+
+def rank_test(values_a, values_b):
+    """逐行 Mann-Whitney U 检验（正态近似，含并列校正），返回 (U, p)
+
+    缺失值按 0（未检出）参与排序；质量分数的秩与 log 后相同。
+    """
+    from scipy.stats import mannwhitneyu
+
+    values_a = np.nan_to_num(values_a, nan=0.0)
+    values_b = np.nan_to_num(values_b, nan=0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = mannwhitneyu(values_b, values_a, axis=1, method='asymptotic')
+    return result.statistic, result.pvalue
+
+
+DIFFERENTIAL_TESTS = {'welch': welch_test, 'rank': rank_test}
+
+
+def differential_abundance(df, group_a, group_b, test='welch', label='gene'):
+    """两组条件之间逐基因的差异丰度：log2 倍数变化（B / A）、检验统计量、p 值和 BH 校正的 q 值
+
+    全部基因作为一个矩阵一次计算。log2 倍数变化为两组 log2 质量分数均值之差，
+    质量分数为 0 或缺失的条件不参与均值和 Welch 检验。返回按 p 值排序的表。
+    """
+    group_a, group_b = list(group_a), list(group_b)
+    if test not in DIFFERENTIAL_TESTS:
+        raise AnalysisError(f"Unknown test '{test}', expected one of: {', '.join(DIFFERENTIAL_TESTS)}")
+    if not group_a or not group_b:
+        raise AnalysisError("Both groups need at least one condition")
+    overlap = sorted(set(group_a) & set(group_b))
+    if overlap:
+        raise AnalysisError(f"Conditions in both groups: {', '.join(overlap)}")
+    require_columns(df, label, *group_a, *group_b)
+
+    values_a = df[group_a].to_numpy(dtype=np.float64)
+    values_b = df[group_b].to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        # 某组全部缺失的基因均值为 NaN，不需要 "Mean of empty slice" 警告
+        warnings.simplefilter('ignore', RuntimeWarning)
+        log_a = np.log2(np.where(values_a > 0, values_a, np.nan))
+        log_b = np.log2(np.where(values_b > 0, values_b, np.nan))
+        mean_a = np.nanmean(log_a, axis=1)
+        mean_b = np.nanmean(log_b, axis=1)
+    if test == 'welch':
+        statistic, p_values = welch_test(log_a, log_b)
+    else:
+        statistic, p_values = rank_test(values_a, values_b)
+
+    result = pd.DataFrame({
+        label: df[label].to_numpy(),
+        'log2_mean_a': mean_a,
+        'log2_mean_b': mean_b,
+        'log2_fold_change': mean_b - mean_a,
+        'statistic': statistic,
+        'p_value': p_values,
+        'q_value': benjamini_hochberg(p_values),
+        'n_a': np.isfinite(log_a).sum(axis=1),
+        'n_b': np.isfinite(log_b).sum(axis=1),
+    })
+    return result.sort_values('p_value', kind='stable', na_position='last').reset_index(drop=True)
+
+
+def significant(result, fdr=0.05, min_log2_fold_change=1.0):
+    """q 值不超过 fdr 且 |log2 倍数变化| 不小于阈值的行"""
+    return (result['q_value'] <= fdr) & (result['log2_fold_change'].abs() >= min_log2_fold_change)
+
+
+def group_key(*groups):
+    """一组或多组条件的短摘要，用于缓存键"""
+    return hashlib.sha1(repr([list(group) for group in groups]).encode()).hexdigest()[:12]
+
+
+def correlation_view(correlations, clustered=False, conditions=None):
+    """热图使用的 (相关系数矩阵, 条件标签)，clustered 时按层次聚类顺序重排
+
+    conditions: 只显示这些条件（例如按元数据筛选的结果），默认全部
+    """
+    values = correlations.values
+    labels = np.array(correlations.conditions)
+    if conditions is not None:
+        keep = np.flatnonzero(np.isin(labels, list(conditions)))
+        values = values[np.ix_(keep, keep)]
+        labels = labels[keep]
+    if clustered:
+        from correlation import cluster_order
+
+        order = cluster_order(values)
+        values = values[np.ix_(order, order)]
+        labels = labels[order]
+    return values, labels
+
+
+def most_correlated(correlations, column, n=20, conditions=None):
+    """与 column 相关性最高的 n 个条件；给出 conditions 时只在其中查找"""
+    if conditions is None:
+        return pd.DataFrame(correlations.most_correlated(column, n), columns=['condition', 'correlation'])
+    ranked = pd.DataFrame(correlations.most_correlated(column, len(correlations.conditions)),
+                          columns=['condition', 'correlation'])
+    return ranked[ranked['condition'].isin(set(conditions))].head(n).reset_index(drop=True)
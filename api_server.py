@@ -0,0 +1,421 @@
+"""供分析脚本调用的 HTTP/JSON 查询服务（asyncio，单进程，长连接 + gzip 压缩）
+
+    python api_server.py [--host 127.0.0.1] [--port 8503] [--db lu_web_v3.db] [--store matrix_store] [--reload 30]
+
+数据在启动时加载一次（有矩阵存储时为内存映射），查询在线程池中执行，不阻塞事件循环。
+每隔 --reload 秒检查数据版本，ingest.py 导入新快照后在后台加载并整体替换，正在处理的请求仍使用旧数据。
+所有接口返回 JSON；请求头带 Accept-Encoding: gzip 时压缩较大的响应；HTTP/1.1 默认保持连接。
+
+接口:
+    GET  /health                                  数据版本、基因数、条件数
+    GET  /metrics                                 各接口耗时直方图和响应计数（Prometheus 文本格式，见 metrics.py）
+    GET  /search?q=YAL&limit=20                   基因检索（精确 > 前缀 > 子串，支持别名）
+    GET  /genes/<gene>?conditions=P1,P2           单个基因在各条件下的质量分数
+    GET  /genes?genes=YAL001C,YAL002W&conditions=P1,P2
+    GET  /genes/<gene>/coexpressed?k=20           全部条件上 log 谱最相似的蛋白质（Pearson 相关系数、共同有效条件数）
+    POST /genes    {"genes": [...], "conditions": [...], "metadata": {...}}
+                                                  批量查询，按列组织: {"genes", "conditions", "values", "missing"}
+    GET  /conditions?meta.medium=YPD              条件列表及 physiology_collection 元数据
+    GET  /conditions/<P1>?genes=...&pattern=YAL   单个条件的一列（可按基因筛选）
+    GET  /compartments                            细胞器列表及注释基因数
+    GET  /compartments/<name>?conditions=P1,P2    细胞器汇总：注释蛋白的质量分数之和、ProMassRatio、最高的蛋白
+
+条件参数与 data_server.py 的 /slice 相同：conditions=P1,P2 或 meta.<列名>=取值 / 下限:上限。
+"""
+import argparse
+import asyncio
+import gzip
+import json
+from urllib.parse import parse_qs, unquote, urlparse
+
+import numpy as np
+
+from coexpression import TOP_K, CoexpressionIndex
+from compartment_engine import CompartmentEngine
+from condition_metadata import ConditionFacets, load_condition_metadata
+from data_server import slice_params_from_json, slice_params_from_query
+from db import DB_PATH, get_pool
+from gene_search import EXACT, GeneSearchIndex, load_aliases
+from matrix_store import STORE_DIR, active_store, data_version, is_condition, load_tables
+from metrics import METRICS, count, span
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 16 * 1024 * 1024
+KEEPALIVE_TIMEOUT = 30
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+SEARCH_LIMIT = 100
+TOP_GENES = 10
+RELOAD_INTERVAL = 30
+
+ROUTES = {"health", "search", "genes", "conditions", "compartments"}
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class QueryError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _json_values(values):
+    """ndarray -> 列表，NaN / inf 转为 null（JSON 不支持 NaN）"""
+    values = np.asarray(values, dtype=np.float64)
+    result = values.astype(object)
+    result[~np.isfinite(values)] = None
+    return result.tolist()
+
+
+class ProteomeData:
+    """查询服务使用的内存数据：基因 x 条件矩阵、细胞器成员、条件元数据和检索索引"""
+
+    def __init__(self, db_path=DB_PATH, store_dir=STORE_DIR):
+        # 只解析一次 CURRENT，保证各文件来自同一个快照
+        store_dir = active_store(store_dir)
+        mass_fraction_df, compartment_df, promass_df = load_tables(db_path, store_dir)
+        self.version = data_version(db_path, store_dir)
+        self.genes = mass_fraction_df['gene'].tolist()
+        self.conditions = [c for c in mass_fraction_df.columns if is_condition(c)]
+        self.condition_pos = {c: j for j, c in enumerate(self.conditions)}
+        # 矩阵存储时为内存映射的转置视图，不复制
+        self.values = mass_fraction_df[self.conditions].to_numpy()
+        self.gene_rows = {g: i for i, g in enumerate(self.genes)}
+        self.index = GeneSearchIndex(self.genes, load_aliases())
+        self.coexpression = CoexpressionIndex.from_matrix(self.values.T, self.genes)
+
+        engine = CompartmentEngine.from_annotation(self.genes, compartment_df)
+        self.compartments = {name: engine.members(name).astype(np.int64)
+                             for name, size in zip(engine.compartments, engine.sizes()) if size}
+        ratio_columns = [c for c in promass_df.columns if is_condition(c)]
+        self.promass = promass_df.set_index('compartment')[ratio_columns]
+
+        pool = get_pool(db_path)
+        try:
+            with pool.connection() as conn:
+                self.metadata = load_condition_metadata(conn, store_dir)
+            self.facets = ConditionFacets(self.metadata)
+        except Exception as e:
+            print(f"Condition metadata not available: {e}")
+            self.metadata = None
+            self.facets = None
+
+    def resolve_gene(self, name):
+        row = self.gene_rows.get(name)
+        if row is not None:
+            return row
+        rows, ranks = self.index.search_ranked(name, limit=1)
+        if len(rows) and ranks[0] == EXACT:
+            return int(rows[0])
+        return None
+
+    def resolve_conditions(self, conditions=None, metadata_filters=None):
+        selected = self.conditions
+        if conditions:
+            unknown = [c for c in conditions if c not in self.condition_pos]
+            if unknown:
+                raise QueryError(400, f"Unknown conditions: {', '.join(unknown)}")
+            wanted = set(conditions)
+            selected = [c for c in selected if c in wanted]
+        if metadata_filters:
+            if self.facets is None:
+                raise QueryError(400, "Condition metadata is not available")
+            try:
+                matched = set(self.facets.resolve(metadata_filters))
+            except KeyError as e:
+                raise QueryError(400, f"Unknown metadata column {e}")
+            selected = [c for c in selected if c in matched]
+        return selected
+
+    def columns(self, conditions):
+        return np.array([self.condition_pos[c] for c in conditions], dtype=np.int64)
+
+
+class QueryService:
+    def __init__(self, data):
+        self.data = data
+
+    # ---- 路由 ----
+
+    def dispatch(self, method, target, body):
+        """返回 (状态码, 可 JSON 序列化的对象)"""
+        url = urlparse(target)
+        parts = [unquote(p) for p in url.path.split("/") if p]
+        query = parse_qs(url.query)
+        try:
+            if method == "POST":
+                if parts != ["genes"]:
+                    raise QueryError(405 if parts else 404, "POST is only supported on /genes")
+                return 200, self.genes_batch(slice_params_from_json(self._json_body(body)))
+            if method not in ("GET", "HEAD"):
+                raise QueryError(405, f"Unsupported method {method}")
+            if parts == ["health"]:
+                return 200, self.health()
+            if parts == ["search"]:
+                return 200, self.search(query)
+            if parts == ["genes"]:
+                return 200, self.genes_batch(slice_params_from_query(query))
+            if len(parts) == 2 and parts[0] == "genes":
+                return 200, self.gene(parts[1], slice_params_from_query(query))
+            if len(parts) == 3 and parts[0] == "genes" and parts[2] == "coexpressed":
+                return 200, self.coexpressed(parts[1], query)
+            if parts == ["conditions"]:
+                return 200, self.condition_list(slice_params_from_query(query))
+            if len(parts) == 2 and parts[0] == "conditions":
+                return 200, self.condition_column(parts[1], slice_params_from_query(query))
+            if parts == ["compartments"]:
+                return 200, self.compartment_list()
+            if len(parts) == 2 and parts[0] == "compartments":
+                return 200, self.compartment(parts[1], slice_params_from_query(query))
+            raise QueryError(404, f"Unknown path {url.path}")
+        except QueryError as e:
+            return e.status, {"error": str(e)}
+
+    @staticmethod
+    def _json_body(body):
+        try:
+            parsed = json.loads(body or b"{}")
+        except ValueError:
+            raise QueryError(400, "Invalid JSON body")
+        if not isinstance(parsed, dict):
+            raise QueryError(400, "JSON body must be an object")
+        return parsed
+
+    # ---- 接口 ----
+
+    def health(self):
+        data = self.data
+        return {"version": data.version, "genes": len(data.genes), "conditions": len(data.conditions)}
+
+    def search(self, query):
+        text = query.get("q", [""])[0].strip()
+        if not text:
+            raise QueryError(400, "Missing query parameter q")
+        try:
+            limit = int(query.get("limit", [SEARCH_LIMIT])[0])
+        except ValueError:
+            raise QueryError(400, "limit must be an integer")
+        data = self.data
+        rows = data.index.search(text, limit=max(1, min(limit, SEARCH_LIMIT)))
+        return {"query": text, "genes": [data.genes[i] for i in rows]}
+
+    def gene(self, name, params):
+        data = self.data
+        row = data.resolve_gene(name)
+        if row is None:
+            raise QueryError(404, f"Unknown gene {name}")
+        conditions = data.resolve_conditions(params['conditions'], params['metadata_filters'])
+        values = data.values[row, data.columns(conditions)]
+        return {"gene": data.genes[row], "values": dict(zip(conditions, _json_values(values)))}
+
+    def coexpressed(self, name, query):
+        data = self.data
+        row = data.resolve_gene(name)
+        if row is None:
+            raise QueryError(404, f"Unknown gene {name}")
+        try:
+            k = int(query.get("k", [TOP_K])[0])
+        except ValueError:
+            raise QueryError(400, "k must be an integer")
+        gene = data.genes[row]
+        if gene not in data.coexpression:
+            raise QueryError(400, f"{gene} is quantified in too few conditions")
+        top, scores, shared = data.coexpression.query([row], max(1, min(k, SEARCH_LIMIT)))
+        return {"gene": gene, "genes": [data.genes[i] for i in top[0]], "correlation": _json_values(scores[0]),
+                "shared_conditions": shared[0].tolist()}
+
+    def genes_batch(self, params):
+        data = self.data
+        names = params['genes'] or []
+        if not isinstance(names, list) or not names:
+            raise QueryError(400, "Provide a non-empty list of genes")
+        rows, found, missing = [], [], []
+        for name in names:
+            row = data.resolve_gene(str(name))
+            if row is None:
+                missing.append(name)
+            else:
+                rows.append(row)
+                found.append(data.genes[row])
+        conditions = data.resolve_conditions(params['conditions'], params['metadata_filters'])
+        block = data.values[np.ix_(np.array(rows, dtype=np.int64), data.columns(conditions))]
+        return {"genes": found, "conditions": conditions, "values": [_json_values(r) for r in block],
+                "missing": missing}
+
+    def condition_list(self, params):
+        data = self.data
+        conditions = data.resolve_conditions(params['conditions'], params['metadata_filters'])
+        result = {"conditions": conditions}
+        if data.metadata is not None:
+            metadata = data.metadata.reindex(conditions)
+            result["metadata"] = json.loads(metadata.reset_index().to_json(orient="records"))
+        return result
+
+    def condition_column(self, condition, params):
+        data = self.data
+        if condition not in data.condition_pos:
+            raise QueryError(404, f"Unknown condition {condition}")
+        rows = np.arange(len(data.genes))
+        if params['genes']:
+            rows = np.array([r for r in map(data.resolve_gene, params['genes']) if r is not None], dtype=np.int64)
+        if params['pattern']:
+            matched = data.index.search(params['pattern'])
+            rows = rows[np.isin(rows, matched)]
+        values = data.values[rows, data.condition_pos[condition]]
+        result = {"condition": condition, "genes": [data.genes[i] for i in rows], "values": _json_values(values)}
+        if data.metadata is not None and condition in data.metadata.index:
+            result["metadata"] = json.loads(data.metadata.loc[[condition]].to_json(orient="records"))[0]
+        return result
+
+    def compartment_list(self):
+        return {"compartments": [{"compartment": name, "genes": len(rows)}
+                                 for name, rows in sorted(self.data.compartments.items())]}
+
+    def compartment(self, name, params):
+        data = self.data
+        rows = data.compartments.get(name)
+        if rows is None:
+            raise QueryError(404, f"Unknown compartment {name}")
+        conditions = data.resolve_conditions(params['conditions'], params['metadata_filters'])
+        block = data.values[np.ix_(rows, data.columns(conditions))]
+        # 按条件取注释蛋白中质量分数最高的几个
+        top = np.argsort(-np.nan_to_num(block, nan=-np.inf), axis=0)[:TOP_GENES]
+        result = {
+            "compartment": name,
+            "genes": len(rows),
+            "conditions": conditions,
+            "total_mass_fraction": _json_values(np.nansum(block, axis=0)),
+            "top_genes": {c: [data.genes[rows[i]] for i in top[:, j]] for j, c in enumerate(conditions)},
+        }
+        if name in data.promass.index:
+            ratio = data.promass.loc[name].reindex(conditions).to_numpy(dtype=np.float64)
+            result["mass_ratio"] = _json_values(ratio)
+        return result
+
+    # ---- HTTP ----
+
+    def encode(self, status, payload, accept_encoding):
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if len(body) >= GZIP_MIN_BYTES and "gzip" in accept_encoding:
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+            headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+        return body, headers
+
+    def respond(self, method, target, body, accept_encoding):
+        """在线程池中执行：查询 + 序列化 + 压缩"""
+        path = urlparse(target).path
+        if path == "/metrics":
+            return 200, METRICS.prometheus_text().encode("utf-8"), {"Content-Type": "text/plain; version=0.0.4"}
+        # 按第一段路径统计，未知路径归为 other，避免标签数量无限增长
+        route = path.strip("/").split("/", 1)[0]
+        with span('api_request', route=route if route in ROUTES else 'other'):
+            try:
+                status, payload = self.dispatch(method, target, body)
+            except Exception as e:
+                print(f"Error handling {method} {target}: {e}")
+                status, payload = 500, {"error": "Internal server error"}
+            response = (status,) + self.encode(status, payload, accept_encoding)
+        count('api_responses', status=status)
+        return response
+
+    async def handle_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, asyncio.LimitOverrunError,
+                        ConnectionError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        key, value = line.split(":", 1)
+                        headers[key.strip().lower()] = value.strip()
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    status, body, extra = 400, b'{"error":"Invalid Content-Length"}', {}
+                    keep_alive = False
+                elif length > MAX_BODY_BYTES:
+                    status, body, extra = 413, b'{"error":"Request body too large"}', {}
+                    keep_alive = False
+                else:
+                    request_body = await reader.readexactly(length) if length else b""
+                    status, body, extra = await loop.run_in_executor(
+                        None, self.respond, method, target, request_body, headers.get("accept-encoding", ""))
+
+                response = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                            f"Content-Length: {len(body)}",
+                            f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                response += [f"{key}: {value}" for key, value in extra.items()]
+                writer.write(("\r\n".join(response) + "\r\n\r\n").encode("latin-1"))
+                if method != "HEAD":
+                    writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def reload_loop(self, db_path, store_dir, interval):
+        """数据版本变化（导入新快照或重建存储）时在线程池中加载新数据，完成后替换 self.data"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if data_version(db_path, store_dir) == self.data.version:
+                    continue
+                data = await loop.run_in_executor(None, ProteomeData, db_path, store_dir)
+            except Exception as e:
+                print(f"Error reloading data: {e}")
+                continue
+            self.data = data
+            print(f"Reloaded data version {data.version}")
+
+    async def serve(self, host, port, db_path=DB_PATH, store_dir=STORE_DIR, reload_interval=RELOAD_INTERVAL):
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        print(f"Serving queries on http://{host}:{port}")
+        reloader = asyncio.create_task(self.reload_loop(db_path, store_dir, reload_interval)) if reload_interval > 0 else None
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if reloader is not None:
+                reloader.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/JSON query service over the proteome data")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8503)
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--reload", type=float, default=RELOAD_INTERVAL,
+                        help="seconds between data version checks (0 disables reloading)")
+    args = parser.parse_args()
+
+    service = QueryService(ProteomeData(args.db, args.store))
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.db, args.store, args.reload))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,134 +1,379 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import seaborn as sns
-import base64
 import os
-from functools import lru_cache
-from concurrent.futures import ThreadPoolExecutor
-from utils import plot_cumulative_mass_fraction, plot_distribution, plot_scatter, plot_distribution_5, plot_log_scatter_5
+import sqlite3
+import time
+from urllib.parse import urlencode
+from utils import plot_cumulative_mass_fraction, plot_distribution, plot_scatter, plot_distribution_5, plot_log_scatter_5, plot_log_scatter_5_interactive, plot_correlation_heatmap, plot_group_comparison, plot_differential_abundance, plot_coexpression
+from matrix_store import DB_PATH, STORE_DIR, active_store, store_is_current, load_tables, data_version, load_ingested_metadata
+from gene_search import GeneSearchIndex, load_aliases
+from compartment_tables import build_cumulative_tables, load_cumulative_tables
+from figure_cache import FigureCache, FIGURE_CACHE_DIR
+from correlation import build_correlation_matrix, load_correlation_matrix
+from coexpression import TOP_K, CoexpressionIndex
+from compartment_engine import parse_gene_sets
+from distributions import load_log_distributions
+from export import EXPORT_TABLES, EXPORT_FORMATS, ExportError, iter_export
+from db import get_pool
+from analysis import AnalysisError, most_correlated
+from condition_metadata import ConditionFacets, index_by_condition
+from metrics import METRICS, cached, serve_metrics, span, timed
+from result_cache import RESULT_CACHE_PATH, ResultCache, record_request, shared_result
+from data_loader import load_labels, load_conditions, load_columns, load_rows, load_page, page_frame, PAGE_SIZE, load_compartment_annotation
 
 # 设置页面标题和布局
 st.set_page_config(page_title="Protein Mass Fraction Analysis", layout="wide")
 
-executor = ThreadPoolExecutor(max_workers=2)
+# 性能计数（见 metrics.py）：记录本次运行的耗时明细。ADMIN_TOKEN 设置后，带 ?admin=<ADMIN_TOKEN>
+# 访问时在侧边栏显示耗时面板；METRICS_PORT 设置后在该端口提供 Prometheus 格式的 /metrics；
+# METRICS_LOG 设置后每次运行的明细追加到该文件（JSON Lines）
+METRICS.start_trace()
+RUN_STARTED = time.perf_counter()
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+METRICS_LOG = os.environ.get("METRICS_LOG")
 
-# 全局变量来存储文件内容
-file_content = None
+@st.cache_resource
+def start_metrics_server():
+    port = os.environ.get("METRICS_PORT")
+    return serve_metrics(int(port), os.environ.get("METRICS_HOST", "127.0.0.1")) if port else None
 
-def prepare_file():
-    global file_content
-    # 使用相对路径，适用于云部署
-    file_path = "protein_database.rar"
-    try:
-        if os.path.exists(file_path):
-            with open(file_path, 'rb') as f:
-                file_content = f.read()
-            print(f"Successfully loaded {len(file_content)} bytes from {file_path}")
-        else:
-            print(f"File {file_path} not found")
-            file_content = None
-    except Exception as e:
-        print(f"Error loading file {file_path}: {str(e)}")
-        file_content = None
+start_metrics_server()
 
-# 在后台异步准备文件
-executor.submit(prepare_file)
+# 下载服务地址（data_server.py），文件以流的形式分块发送，支持断点续传；
+# 未设置时没有下载服务，由 Streamlit 在用户点击后直接发送文件（见 Download 页）
+DOWNLOAD_BASE_URL = os.environ.get("DOWNLOAD_BASE_URL", "").rstrip("/") or None
+RAR_PATH = "protein_database.rar"
+RATIO_SOURCES = ["Stored table", "Recompute from annotation", "Custom gene sets"]
+COLUMN_BLOCK = 25  # 宽表每次显示的条件列数
 
 @st.cache_data
-@lru_cache(maxsize=5)
 def get_rar_download_link(rar_path):
     try:
         # 先检查文件是否存在
         if not os.path.exists(rar_path):
             return '<p style="color: red;">文件不存在。请联系 <a href="mailto:hongzhonglu@sjtu.edu.cn">hongzhonglu@sjtu.edu.cn</a> 获取完整数据集。</p>'
-        
-        # 检查file_content是否已加载
-        if file_content is not None:
-            file_size_mb = len(file_content) / (1024 * 1024)
-            b64 = base64.b64encode(file_content).decode()
-            filename = "protein_database.rar"
-            href = f'<a href="data:application/x-rar-compressed;base64,{b64}" download="{filename}">📥 Download Protein Database (RAR) - {file_size_mb:.1f} MB</a>'
-            return href
-        else:
-            # 如果file_content为空，尝试直接读取文件
-            try:
-                with open(rar_path, 'rb') as f:
-                    content = f.read()
-                file_size_mb = len(content) / (1024 * 1024)
-                b64 = base64.b64encode(content).decode()
-                filename = "protein_database.rar"
-                href = f'<a href="data:application/x-rar-compressed;base64,{b64}" download="{filename}">📥 Download Protein Database (RAR) - {file_size_mb:.1f} MB</a>'
-                return href
-            except Exception as read_error:
-                return f'<p style="color: orange;">读取文件时出错: {str(read_error)}。请联系 <a href="mailto:hongzhonglu@sjtu.edu.cn">hongzhonglu@sjtu.edu.cn</a> 获取完整数据集。</p>'
+
+        # 只读取文件大小，文件内容由下载服务直接从磁盘发送
+        file_size_mb = os.path.getsize(rar_path) / (1024 * 1024)
+        filename = os.path.basename(rar_path)
+        href = f'<a href="{DOWNLOAD_BASE_URL}/download/{filename}" download="{filename}">📥 Download Protein Database (RAR) - {file_size_mb:.1f} MB</a>'
+        return href
     except Exception as e:
         return f'<p style="color: red;">下载功能出错: {str(e)}。请联系 <a href="mailto:hongzhonglu@sjtu.edu.cn">hongzhonglu@sjtu.edu.cn</a> 获取完整数据集。</p>'
 
-# 数据库连接
-@st.cache_resource
-def get_db_connection():
-    # 使用相对路径，适用于云部署
-    db_path = "lu_web_v3.db"
-    if os.path.exists(db_path):
-        # 添加check_same_thread=False参数来解决SQLite线程安全问题
-        return sqlite3.connect(db_path, check_same_thread=False)
-    else:
-        st.error("Database file not found!")
-        return None
+def show_rar_download_button(rar_path):
+    """没有下载服务时的下载按钮：点击 Prepare 后才读取文件，不在每次运行时把整个 RAR 读入内存"""
+    if not os.path.exists(rar_path):
+        st.markdown(get_rar_download_link(rar_path), unsafe_allow_html=True)
+        return
+    file_size_mb = os.path.getsize(rar_path) / (1024 * 1024)
+    if st.button(f"Prepare Protein Database (RAR) - {file_size_mb:.1f} MB"):
+        with open(rar_path, 'rb') as f:
+            st.download_button("📥 Download Protein Database (RAR)", f, file_name=os.path.basename(rar_path),
+                               mime="application/x-rar-compressed")
 
-# 创建新的数据库连接函数，用于临时查询
-def create_db_connection():
-    """创建新的数据库连接，避免线程安全问题"""
-    db_path = "lu_web_v3.db"
-    if os.path.exists(db_path):
-        return sqlite3.connect(db_path, check_same_thread=False)
-    else:
+def export_bytes(table, fmt, columns):
+    """没有下载服务时在应用内生成导出文件（与 /export 接口相同的 export.iter_export）"""
+    pool = get_db_pool()
+    if pool is None:
         return None
+    with pool.connection() as conn:
+        return b"".join(iter_export(conn, table, fmt, columns))
 
-# 读取映射数据
-@st.cache_data
-def load_mapping_data():
+# 数据库连接：进程内共享的只读连接池（见 db.py）
+def get_db_pool():
+    pool = get_pool(DB_PATH)
+    if pool is None:
+        st.error("Database file not found!")
+    return pool
+
+# 读取映射数据（加上增量导入的新条件，见 ingest.py）
+@cached(st.cache_data)
+def load_mapping_data(store):
     """加载映射数据，带缓存"""
-    conn = create_db_connection()
-    if conn is None:
+    pool = get_db_pool()
+    if pool is None:
         return None
-    
+
     try:
-        mapping_df = pd.read_sql('SELECT * FROM physiology_collection', conn)
-        conn.close()
-        return mapping_df
+        with pool.connection() as conn:
+            mapping_df = pd.read_sql('SELECT * FROM physiology_collection', conn)
     except Exception as e:
-        if conn:
-            conn.close()
         st.error(f"Error loading mapping data: {str(e)}")
         return None
+    ingested = load_ingested_metadata(store)
+    return pd.concat([mapping_df, ingested], ignore_index=True) if ingested is not None else mapping_df
 
-# 读取数据
-@st.cache_data
-def load_data():
-    conn = get_db_connection()
-    if conn is None:
+# 读取全部数据：只在需要整张矩阵构建派生表（累积表、相关系数）且没有离线结果时使用，
+# 页面显示通过下面的按需读取函数只取所需的行和列
+# 使用 cache_resource 而不是 cache_data：cache_data 每次返回副本，会把内存映射的矩阵复制一遍
+@cached(st.cache_resource)
+@timed('load')
+def load_data(store):
+    # 优先使用 matrix_store.py 预先构建的内存映射矩阵（多个工作进程共享同一份页缓存），否则读取数据库
+    if get_db_pool() is None:
         return None, None, None
-    
+
     try:
-        mass_fraction_df = pd.read_sql('SELECT * FROM mass_fraction_combine', conn)
-        compartment_df = pd.read_sql('SELECT * FROM compartment_annotation_refine', conn)
-        promass_df = pd.read_sql('SELECT * FROM ProMassRatio_across_compartment_combine', conn)
-        return mass_fraction_df, compartment_df, promass_df
+        return load_tables(DB_PATH, store)
     except Exception as e:
         st.error(f"Error loading data: {str(e)}")
         return None, None, None
 
-# 加载数据
-data_result = load_data()
-if data_result[0] is None:
+# 按需读取（见 data_loader.py）：单条件图只读一列。
+# 下面的缓存函数都以当前快照目录 store 为参数，导入新数据后自动使用新的缓存项
+@cached(st.cache_data)
+def get_conditions(store):
+    return load_conditions('mass_fraction_combine', DB_PATH, store)
+
+@cached(st.cache_data)
+def get_columns(table, columns, store):
+    return load_columns(table, list(columns), DB_PATH, store)
+
+# 结果表按页读取（见 data_loader.load_page）：排序、分页和列投影在数据层完成，只序列化可见的行和列。
+# query 为空时为全表，否则为搜索结果（按匹配程度排列）
+@cached(st.cache_data)
+def get_page(table, query, columns, sort_by, ascending, page, store, page_size=PAGE_SIZE):
+    positions = get_search_index(store).search(query) if query else None
+    return load_page(table, positions, list(columns), sort_by, ascending, page, page_size, DB_PATH, store)
+
+@cached(st.cache_data)
+def get_compartment_annotation(store):
+    return load_compartment_annotation(DB_PATH, store)
+
+# 以条件编号为索引的元数据（见 condition_metadata.py），用于按实验设置选择条件
+@cached(st.cache_data)
+def get_condition_metadata(store):
+    mapping_df = load_mapping_data(store)
+    return index_by_condition(mapping_df) if mapping_df is not None else None
+
+# 元数据分面索引，每个进程构建一次
+@cached(st.cache_resource)
+@timed('load')
+def get_condition_facets(store):
+    metadata = get_condition_metadata(store)
+    return ConditionFacets(metadata) if metadata is not None else None
+
+# 选择框中显示的条件说明，例如 “P3 · YPD, 25, osmotic, W303, 0.337”
+# 下拉框每个选项都会调用一次，不计入缓存命中统计
+@st.cache_data
+def get_condition_labels(store):
+    metadata = get_condition_metadata(store)
+    if metadata is None:
+        return {}
+    summary = metadata.astype(str).apply(', '.join, axis=1)
+    return {condition: f"{condition} · {text}" for condition, text in summary.items()}
+
+def condition_label(condition):
+    return get_condition_labels(STORE).get(condition, condition)
+
+def facet_filter(key):
+    """按元数据各列筛选条件：取值较少的列多选，数值列取区间，取值很多的文本列按包含的文字筛选；
+    返回满足全部筛选的条件
+
+    每个取值后显示的条件数已考虑前面各列的筛选。
+    """
+    facets = get_condition_facets(STORE)
+    filters = {}
+    for column, (kind, options) in facets.facets().items():
+        if kind == 'values':
+            counts = facets.counts(column, filters)
+            chosen = st.multiselect(column, options, key=f"{key}_{column}",
+                                    format_func=lambda value, counts=counts: f"{value} ({counts[value]})")
+            if chosen:
+                filters[column] = chosen
+        elif kind == 'text':
+            text = st.text_input(f"{column} contains", key=f"{key}_{column}").strip()
+            if text:
+                filters[column] = text
+                st.caption(f"{len(facets.matching(column, text))} of {options} values match")
+        else:
+            low, high = options
+            chosen = st.slider(column, low, high, (low, high), key=f"{key}_{column}")
+            if chosen != (low, high):
+                filters[column] = chosen
+    return facets.resolve(filters)
+
+def filtered_conditions():
+    """计算页侧边栏的条件筛选；各模块的条件选择都只列出筛选结果"""
+    if get_condition_facets(STORE) is None:
+        return CONDITIONS
+    with st.sidebar.expander("Filter conditions by metadata"):
+        matched = set(facet_filter("filter"))
+        conditions = [c for c in CONDITIONS if c in matched]
+        st.caption(f"{len(conditions)} of {len(CONDITIONS)} conditions")
+    if not conditions:
+        st.sidebar.warning("No conditions match the metadata filter; showing all conditions.")
+        return CONDITIONS
+    return conditions
+
+def select_condition_group(label, key, options):
+    """多条件模式下选择一组条件：直接勾选编号，或按 physiology_collection 元数据筛选"""
+    modes = ["Conditions", "Metadata"] if get_condition_facets(STORE) is not None else ["Conditions"]
+    mode = st.radio(f"{label}: select by", modes, horizontal=True, key=f"{key}_mode")
+    if mode == "Conditions":
+        return st.multiselect(label, options, key=key, format_func=condition_label)
+    matched = set(facet_filter(key))
+    conditions = [c for c in options if c in matched]
+    st.caption(f"{len(conditions)} conditions: {', '.join(conditions[:30])}{' ...' if len(conditions) > 30 else ''}")
+    return conditions
+
+def condition_groups(options, optional_b=True):
+    group_a = select_condition_group("Group A", "group_a", options)
+    group_b = select_condition_group("Group B (optional, for fold change B / A)" if optional_b else "Group B", "group_b",
+                                     options)
+    return group_a, group_b
+
+def table_controls(key, total, sort_options, default_order, scope=None):
+    """分页表格的排序列、方向和页码，返回 (sort_by, ascending, page)；page 从 0 开始
+
+    scope（如搜索词）变化或总行数减少时回到第一页。
+    """
+    pages = max(1, -(-total // PAGE_SIZE))
+    if st.session_state.get(f"{key}_scope") != scope or st.session_state.get(f"{key}_page", 1) > pages:
+        st.session_state[f"{key}_scope"] = scope
+        st.session_state[f"{key}_page"] = 1
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        sort_by = st.selectbox("Sort by", [None, *sort_options], key=f"{key}_sort",
+                               format_func=lambda c: default_order if c is None else c)
+    with col2:
+        ascending = st.radio("Order", ["Descending", "Ascending"], horizontal=True, key=f"{key}_order") == "Ascending"
+    with col3:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=f"{key}_page")
+    return sort_by, ascending, int(page) - 1
+
+def column_window(key, conditions):
+    """宽表按 COLUMN_BLOCK 个条件一组显示，只读取所选的一组列"""
+    blocks = [conditions[i:i + COLUMN_BLOCK] for i in range(0, len(conditions), COLUMN_BLOCK)]
+    block = st.selectbox("Conditions shown", range(len(blocks)), key=f"{key}_columns",
+                         format_func=lambda i: f"{blocks[i][0]} – {blocks[i][-1]}")
+    return blocks[block]
+
+def show_page(df, total, page):
+    st.dataframe(df, hide_index=True)
+    start = page * PAGE_SIZE
+    st.caption(f"Rows {start + 1 if total else 0}–{start + len(df)} of {total}")
+
+def paged_matrix(key, table, query, total, default_order):
+    """质量分数表的分页视图：所选的一组条件列 + 排序 + 分页"""
+    columns = column_window(key, CONDITIONS)
+    sort_by, ascending, page = table_controls(key, total, ['gene', *CONDITIONS], default_order, scope=query)
+    if sort_by not in (None, 'gene') and sort_by not in columns:
+        columns = [sort_by, *columns]  # 排序列不在当前组中时一并显示
+    page_df, total = get_page(table, query, tuple(columns), sort_by, ascending, page, STORE)
+    show_page(page_df, total, page)
+
+# 计算结果的跨进程共享缓存（见 result_cache.py），重启后仍然有效；文件不可写时只用进程内缓存
+@st.cache_resource
+def get_result_cache():
+    try:
+        return ResultCache(os.environ.get("RESULT_CACHE_PATH", RESULT_CACHE_PATH))
+    except sqlite3.Error as e:
+        print(f"Result cache disabled: {str(e)}")
+        return None
+
+# 差异丰度结果按（排序后的）组定义和检验方法缓存；请求在进程内缓存之外计数（命中也计数，参数无效时不计），
+# 供 result_cache.py warm 使用
+def get_differential_abundance(group_a, group_b, test, store):
+    result = get_shared_differential_abundance(group_a, group_b, test, store)
+    record_request(get_result_cache(), 'differential_abundance', group_a, group_b, test)
+    return result
+
+@cached(st.cache_data)
+def get_shared_differential_abundance(group_a, group_b, test, store):
+    return shared_result(get_result_cache(), 'differential_abundance', store, group_a, group_b, test)
+
+# 基因检索索引，每个进程构建一次
+@cached(st.cache_resource)
+@timed('load')
+def get_search_index(store):
+    return GeneSearchIndex(load_labels('mass_fraction_combine', DB_PATH, store), load_aliases())
+
+# 细胞器累积质量分数表：优先读取离线构建结果，否则在首次使用时构建
+@cached(st.cache_resource)
+@timed('load')
+def get_cumulative_tables(store):
+    tables = load_cumulative_tables(store) if store_is_current(DB_PATH, store) else None
+    if tables is None:
+        mass_fraction_df, compartment_df, _ = load_data(store)
+        tables = build_cumulative_tables(mass_fraction_df, compartment_df)
+    return tables
+
+# 细胞器比例表：按注释或自定义基因集合由质量分数表重新计算（见 compartment_engine.py），结果跨进程共享
+def get_ratio_table(store, gene_sets=None, split_shared=False):
+    table = get_shared_ratio_table(store, gene_sets, split_shared)
+    record_request(get_result_cache(), 'ratio_table', gene_sets, split_shared)
+    return table
+
+@cached(st.cache_data)
+def get_shared_ratio_table(store, gene_sets=None, split_shared=False):
+    return shared_result(get_result_cache(), 'ratio_table', store, gene_sets, split_shared)
+
+# 共表达查询：全部基因的归一化 log 谱（约 6 MB），首次使用时构建
+@cached(st.cache_resource)
+@timed('load')
+def get_coexpression_index(store):
+    mass_fraction_df = load_data(store)[0]
+    return CoexpressionIndex.from_frame(mass_fraction_df) if mass_fraction_df is not None else None
+
+# 全部条件两两相关系数：优先读取离线结果，否则首次使用时分块计算
+@cached(st.cache_resource)
+@timed('load')
+def get_correlations(store):
+    correlations = load_correlation_matrix(store) if store_is_current(DB_PATH, store) else None
+    if correlations is None:
+        correlations = build_correlation_matrix(load_data(store)[0])
+    return correlations
+
+# 各条件 log 分布的直方图和 KDE：优先读取离线结果，否则绘图时只对所选条件即时计算
+@cached(st.cache_resource)
+def get_log_distributions(store):
+    return load_log_distributions(store) if store_is_current(DB_PATH, store) else None
+
+# 管理面板：本次运行的耗时明细、启动以来各区间的累计耗时和缓存命中率
+def show_admin_panel():
+    spans, counters = METRICS.summary()
+    with st.sidebar.expander("Performance", expanded=True):
+        st.caption("This run")
+        st.dataframe(pd.DataFrame([
+            {'span': '  ' * depth + name + ''.join(f' [{v}]' for v in labels.values()), 'ms': seconds * 1e3}
+            for depth, name, labels, seconds in METRICS.trace()
+        ]), hide_index=True)
+        summary = pd.DataFrame(spans)
+        if not summary.empty:
+            for col in ('total', 'mean', 'max'):
+                summary[f'{col}_ms'] = summary.pop(col) * 1e3
+            st.caption("Since start")
+            st.dataframe(summary.fillna(''), hide_index=True)
+        requests = pd.DataFrame([c for c in counters if c['name'] == 'cache_requests'])
+        if not requests.empty:
+            st.caption("Cache hit rate")
+            requests = requests.pivot_table(index='cache', columns='result', values='value', fill_value=0)
+            requests = requests.reindex(columns=['hit', 'miss'], fill_value=0)
+            st.dataframe(requests.assign(hit_rate=requests['hit'] / requests.sum(axis=1)))
+        figures = {c['result']: c['value'] for c in counters if c['name'] == 'figure_cache'}
+        if figures:
+            st.caption("Figure cache: " + ", ".join(f"{k} {v}" for k, v in sorted(figures.items())))
+        if st.button("Reset counters"):
+            METRICS.reset()
+
+# 渲染结果缓存：进程内 LRU + 按数据版本划分的共享磁盘目录
+@cached(st.cache_resource)
+def get_figure_cache(store):
+    version = data_version(DB_PATH, store) or "unversioned"
+    return FigureCache(disk_dir=os.path.join(FIGURE_CACHE_DIR, version))
+
+# 数据库不可用时直接停止；具体数据由各页面按需读取
+if get_db_pool() is None:
     st.error("Failed to load data from database!")
     st.stop()
 
-mass_fraction_df, compartment_df, promass_df = data_result
+# 当前数据快照：每次运行都重新解析 CURRENT 指针，导入新数据后无需重启即切换到新版本
+STORE = active_store(STORE_DIR)
+CONDITIONS = get_conditions(STORE)
 
 # 顶部导航栏
 st.markdown("""
@@ -147,7 +392,31 @@ table_choice = st.sidebar.radio(
 if table_choice == "Download":
     st.markdown("## Download Data")
     st.markdown("Download the database in RAR format.")
-    st.markdown(get_rar_download_link("protein_database.rar"), unsafe_allow_html=True)
+    if DOWNLOAD_BASE_URL:
+        st.markdown(get_rar_download_link(RAR_PATH), unsafe_allow_html=True)
+    else:
+        show_rar_download_button(RAR_PATH)
+
+    st.markdown("### Export a Table")
+    st.markdown("Export a single table (optionally a subset of its columns) as CSV or Parquet.")
+    export_table = st.selectbox("Table", EXPORT_TABLES)
+    export_format = st.radio("Format", list(EXPORT_FORMATS), horizontal=True)
+    export_columns = st.text_input("Columns (comma separated, empty for all)", "")
+    columns = [col.strip() for col in export_columns.split(",") if col.strip()]
+    if DOWNLOAD_BASE_URL:
+        export_url = f"{DOWNLOAD_BASE_URL}/export/{export_table}.{export_format}"
+        if columns:
+            export_url += "?" + urlencode({"columns": ",".join(columns)})
+        st.markdown(f'<a href="{export_url}">📥 Export {export_table}.{export_format}</a>', unsafe_allow_html=True)
+    elif st.button(f"Prepare {export_table}.{export_format}"):
+        try:
+            data = export_bytes(export_table, export_format, columns or None)
+        except ExportError as e:
+            st.error(str(e))
+        else:
+            if data is not None:
+                st.download_button(f"📥 Export {export_table}.{export_format}", data,
+                                   file_name=f"{export_table}.{export_format}", mime=EXPORT_FORMATS[export_format])
 
 if table_choice == "About us":
     st.markdown("## About Us")
@@ -157,25 +426,31 @@ if table_choice == "Main Page":
     search_query = st.text_input("Search proteins...")
 
     if search_query:
-        # 使用模糊匹配进行搜索
-        filtered_df = mass_fraction_df[mass_fraction_df['gene'].str.contains(search_query, case=False, na=False)]
-        if not filtered_df.empty:
+        # 使用预建索引搜索（精确 > 前缀 > 子串，支持别名）
+        with span('search'):
+            search_index = get_search_index(STORE)
+            positions = search_index.search(search_query)
+        if len(positions):
             st.subheader(f"Search Results for '{search_query}'")
-            st.dataframe(filtered_df)
+            # 只读取并显示当前页和所选的一组条件列
+            paged_matrix("results", 'mass_fraction_combine', search_query, len(positions), "Search rank")
             
             # 显示搜索结果的数量
-            st.write(f"Found {len(filtered_df)} matching proteins")
+            st.write(f"Found {len(positions)} matching proteins")
             
             # 添加可视化搜索结果的选项
             if st.checkbox("Show visualization of search results"):
                 # 选择要显示的条件
                 columns_to_plot = st.multiselect(
                     "Select conditions to visualize",
-                    [col for col in filtered_df.columns if col.startswith('P')],
-                    default=[filtered_df.columns[1]]  # 默认选择第一个P列
+                    CONDITIONS,
+                    default=CONDITIONS[:1]  # 默认选择第一个条件
                 )
                 
                 if columns_to_plot:
+                    # 求和需要全部匹配行，但只读取所选的条件列
+                    filtered_df, _ = get_page('mass_fraction_combine', search_query, tuple(columns_to_plot), None, True,
+                                              0, STORE, page_size=None)
                     sorted_columns = sorted(columns_to_plot, key=lambda col: filtered_df[col].sum(), reverse=True)
                     fig, ax = plt.subplots(figsize=(10, 6))
                     for col in sorted_columns:
@@ -186,65 +461,170 @@ if table_choice == "Main Page":
                     plt.xlabel("Condition")
                     plt.ylabel("Mass Fraction")
                     st.pyplot(fig)
+
+            # 共表达查询：在全部条件上与所选蛋白质谱最相似的蛋白质
+            if st.checkbox("Find co-varying proteins"):
+                coexpression_index = get_coexpression_index(STORE)
+                if coexpression_index is None:
+                    st.error("Failed to load data for the co-expression lookup!")
+                else:
+                    gene = st.selectbox("Protein", [search_index.genes[i] for i in positions])
+                    k = st.slider("Number of co-varying proteins", 5, 100, TOP_K, step=5)
+                    neighbors = coexpression_index.neighbors(gene, k)
+                    rows = coexpression_index.positions([gene, *neighbors['gene'][:5]])
+                    profiles_df = load_rows('mass_fraction_combine', rows, DB_PATH, STORE)
+                    plot_coexpression(gene, neighbors, profiles_df, cache=get_figure_cache(STORE))
         else:
             st.warning(f"No proteins found matching '{search_query}'")
     else:
         # 当没有搜索时显示概览数据
         st.subheader("Mass Fraction Data Overview")
-        st.dataframe(mass_fraction_df.head(100))
+        paged_matrix("overview", 'mass_fraction_combine', None, len(get_search_index(STORE).genes), "Database order")
 
         st.subheader("Mapping of P1-275 Overview")
         # 从数据库加载生理学数据集合
-        mapping_df = load_mapping_data()
+        mapping_df = load_mapping_data(STORE)
         if mapping_df is not None:
-            st.dataframe(mapping_df)
+            sort_by, ascending, page = table_controls("mapping", len(mapping_df), list(mapping_df.columns),
+                                                      "Database order")
+            show_page(page_frame(mapping_df, sort_by, ascending, page), len(mapping_df), page)
         else:
             st.info("Mapping data could not be loaded from the database.")
 
 if table_choice == "Compute":
     module = st.sidebar.selectbox(
         "Select Module",
-        ["Compartment Analysis", "Compartment Mass Ratio", "Protein Mass Distribution"]
+        ["Compartment Analysis", "Compartment Mass Ratio", "Protein Mass Distribution", "Differential Abundance",
+         "Condition Correlation"]
     )
+    conditions = filtered_conditions()
     
     if module == "Compartment Analysis": # 模块三
         st.subheader("Compartment Analysis")
+        compartment_df = get_compartment_annotation(STORE)
         compartment = st.selectbox("Select Compartment", compartment_df['compartment'].unique())
-        cond = st.selectbox("Select Condition", [f'P{i}' for i in range(1, 276)], key="cond1")
+        cond = st.selectbox("Select Condition", conditions, key="cond1", format_func=condition_label)
         
         if st.button("Generate Analysis"):
-            plot_cumulative_mass_fraction(compartment, cond, mass_fraction_df, compartment_df)
+            plot_cumulative_mass_fraction(compartment, cond, get_columns('mass_fraction_combine', (cond,), STORE), compartment_df, get_cumulative_tables(STORE),
+                                          cache=get_figure_cache(STORE))
     
     elif module == "Compartment Mass Ratio": # 模块四
         st.subheader("Compartment Mass Ratio Analysis")
-        analysis_type = st.radio("Select Analysis Type", ["Single Condition", "Two Conditions"])
-        
-        if analysis_type == "Single Condition":
-            column = st.selectbox("Select Condition", [f'P{i}' for i in range(1, 276)])
+        analysis_type = st.radio("Select Analysis Type", ["Single Condition", "Two Conditions", "Multiple Conditions"])
+        # 比例表来源：数据库中的表，或按注释 / 自定义基因集合即时重新计算
+        ratio_source = st.radio("Ratio Table", RATIO_SOURCES, horizontal=True, key="ratio_source")
+        gene_sets, split_shared = None, False
+        if ratio_source != "Stored table":
+            if ratio_source == "Custom gene sets":
+                gene_sets = parse_gene_sets(st.text_area("Gene sets (one per line, e.g. `ribosome: YGL103W, YLR075W`)",
+                                                         key="gene_sets"))
+                if not gene_sets:
+                    st.warning("Enter at least one gene set.")
+                    st.stop()
+            split_shared = st.checkbox("Split the mass of proteins annotated to several sets", key="split_shared")
+
+        def ratio_columns(columns):
+            if ratio_source == "Stored table":
+                return get_columns('ProMassRatio_across_compartment_combine', columns, STORE)
+            table = get_ratio_table(STORE, tuple((name, tuple(genes)) for name, genes in gene_sets.items())
+                                    if gene_sets is not None else None, split_shared)
+            return table[['compartment', *dict.fromkeys(columns)]]
+
+        # 重新计算的表不使用按条件缓存的图片
+        ratio_cache = get_figure_cache(STORE) if ratio_source == "Stored table" else None
+        if analysis_type == "Multiple Conditions":
+            group_a, group_b = condition_groups(conditions)
+            if st.button("Generate Comparison"):
+                plot_group_comparison(ratio_columns((*group_a, *group_b)), 'compartment', group_a, group_b,
+                                      cache=ratio_cache)
+        elif analysis_type == "Single Condition":
+            column = st.selectbox("Select Condition", conditions, format_func=condition_label)
             if st.button("Generate Plot"):
-                plot_distribution(promass_df, column)
+                plot_distribution(ratio_columns((column,)), column, cache=ratio_cache)
         else:
             col1, col2 = st.columns(2)
             with col1:
-                column1 = st.selectbox("Select First Condition", [f'P{i}' for i in range(1, 276)])
+                column1 = st.selectbox("Select First Condition", conditions, format_func=condition_label)
             with col2:
-                column2 = st.selectbox("Select Second Condition", [f'P{i}' for i in range(1, 276)])
+                column2 = st.selectbox("Select Second Condition", conditions, format_func=condition_label)
             if st.button("Generate Plot"):
-                plot_scatter(promass_df, column1, column2)  
+                plot_scatter(ratio_columns((column1, column2)), column1, column2, cache=ratio_cache)
     
     elif module == "Protein Mass Distribution":
         st.subheader("Protein Mass Distribution Analysis")
-        analysis_type = st.radio("Select Analysis Type", ["Single Condition", "Two Conditions"])
+        analysis_type = st.radio("Select Analysis Type", ["Single Condition", "Two Conditions", "Multiple Conditions"])
         
-        if analysis_type == "Single Condition":
-            column = st.selectbox("Select Condition", [f'P{i}' for i in range(1, 276)])
+        if analysis_type == "Multiple Conditions":
+            group_a, group_b = condition_groups(conditions)
+            if st.button("Generate Comparison"):
+                plot_group_comparison(get_columns('mass_fraction_combine', (*group_a, *group_b), STORE), 'gene',
+                                      group_a, group_b, compartment_df=get_compartment_annotation(STORE),
+                                      cache=get_figure_cache(STORE))
+        elif analysis_type == "Single Condition":
+            column = st.selectbox("Select Condition", conditions, format_func=condition_label)
             if st.button("Generate Plot"):
-                plot_distribution_5(mass_fraction_df, column)
+                plot_distribution_5(get_columns('mass_fraction_combine', (column,), STORE), column, cache=get_figure_cache(STORE),
+                                    distributions=get_log_distributions(STORE))
         else:
             col1, col2 = st.columns(2)
             with col1:
-                column1 = st.selectbox("Select First Condition", [f'P{i}' for i in range(1, 276)])
+                column1 = st.selectbox("Select First Condition", conditions, format_func=condition_label)
             with col2:
-                column2 = st.selectbox("Select Second Condition", [f'P{i}' for i in range(1, 276)])
+                column2 = st.selectbox("Select Second Condition", conditions, format_func=condition_label)
+            # 交互模式：WebGL 散点图在浏览器端渲染，悬停显示基因名，可叠加更多条件
+            renderer = st.radio("Renderer", ["Static image", "Interactive (WebGL)"], horizontal=True)
+            if renderer == "Interactive (WebGL)":
+                overlay = st.multiselect("Overlay more conditions (against the first condition)", conditions,
+                                         format_func=condition_label)
+                max_points = None
+                if st.checkbox("Downsample dense regions", value=bool(overlay)):
+                    max_points = st.slider("Max points per condition", 500, 6000, 2000, step=500)
             if st.button("Generate Plot"):
-                plot_log_scatter_5(mass_fraction_df, column1, column2)  
+                if renderer == "Interactive (WebGL)":
+                    plot_log_scatter_5_interactive(get_columns('mass_fraction_combine', (column1, column2, *overlay), STORE),
+                                                   column1, column2, overlay, max_points, cache=get_figure_cache(STORE),
+                                                   correlations=get_correlations(STORE),
+                                                   distributions=get_log_distributions(STORE))
+                else:
+                    plot_log_scatter_5(get_columns('mass_fraction_combine', (column1, column2), STORE), column1, column2, cache=get_figure_cache(STORE),
+                                       correlations=get_correlations(STORE), distributions=get_log_distributions(STORE))  
+
+    elif module == "Differential Abundance":
+        st.subheader("Differential Abundance Analysis")
+        group_a, group_b = condition_groups(conditions, optional_b=False)
+        tests = {"Welch t-test (log2 mass fraction)": "welch", "Rank test (Mann-Whitney U)": "rank"}
+        test = tests[st.radio("Test", list(tests), horizontal=True)]
+        col1, col2 = st.columns(2)
+        with col1:
+            fdr = st.select_slider("FDR (Benjamini-Hochberg)", [0.001, 0.01, 0.05, 0.1, 0.2], value=0.05)
+        with col2:
+            min_fold = st.slider("Minimum |log2 fold change|", 0.0, 5.0, 1.0, step=0.25)
+        if st.button("Run Test"):
+            group_a, group_b = tuple(sorted(group_a)), tuple(sorted(group_b))
+            try:
+                result = get_differential_abundance(group_a, group_b, test, STORE)
+            except AnalysisError as e:
+                st.error(str(e))
+            else:
+                plot_differential_abundance(result, group_a, group_b, test, fdr, min_fold, cache=get_figure_cache(STORE))
+
+    elif module == "Condition Correlation":
+        st.subheader("Condition Correlation Analysis")
+        correlations = get_correlations(STORE)
+        clustered = st.checkbox("Cluster conditions", value=True)
+        # 筛选了条件时只显示子集之间的相关性
+        subset = None if len(conditions) == len(CONDITIONS) else conditions
+        if st.button("Generate Heatmap"):
+            plot_correlation_heatmap(correlations, clustered, cache=get_figure_cache(STORE), conditions=subset)
+
+        column = st.selectbox("Most correlated conditions for", [c for c in conditions if c in correlations.conditions],
+                              format_func=condition_label)
+        st.dataframe(most_correlated(correlations, column, 20, conditions=subset))
+
+# 本次运行结束：记录总耗时，按需写日志、显示管理面板
+METRICS.observe('script_run', time.perf_counter() - RUN_STARTED, (('page', table_choice),))
+if METRICS_LOG:
+    METRICS.log_trace(METRICS_LOG, page=table_choice)
+if ADMIN_TOKEN and st.query_params.get("admin") == ADMIN_TOKEN:
+    show_admin_panel()
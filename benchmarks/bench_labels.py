@@ -0,0 +1,92 @@
+"""对比 plot_scatter 标签放置：iterrows + adjustText（原实现）与占用网格放置（label_placement.py）
+
+    python benchmarks/bench_labels.py [--sizes 10 25 50 100 200] [--repeat 3]
+
+构造一组细胞器比例都高于 0.05 的“密集”条件对（所有点都需要标注），分别计时
+生成图像并编码为 PNG 的总耗时。未安装 adjustText 时只测新实现。
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import scatter_figure  # noqa: E402
+
+
+def dense_pair(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(0.05, 0.5, n)
+    return pd.DataFrame({
+        'compartment': [f'compartment {i}' for i in range(n)],
+        'P1': x,
+        'P2': np.clip(x + rng.normal(0, 0.05, n), 0.05, None),
+    })
+
+
+def adjust_text_figure(data, column1, column2):
+    """原实现：逐行 iterrows 生成标签，再由 adjust_text 迭代调整"""
+    from adjustText import adjust_text
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    ax.scatter(data[column1], data[column2], color='blue', alpha=0.5)
+    max_val = max(data[column1].max(), data[column2].max())
+    ax.plot([0, max_val], [0, max_val], color='red', linestyle='--', label='y = x')
+    ax.legend()
+    texts = []
+    for i, row in data.iterrows():
+        if row[column1] >= 0.05 and row[column2] >= 0.05:
+            texts.append(ax.text(row[column1], row[column2], row['compartment'], fontsize=8, color='green'))
+    adjust_text(texts, arrowprops=dict(arrowstyle='-', color='gray', lw=0.5))
+    ax.set_xlabel(f'Protein Mass Ratio ({column1})')
+    ax.set_ylabel(f'Protein Mass Ratio ({column2})')
+    ax.grid(True)
+    plt.tight_layout()
+    return fig
+
+
+def render_time(build, data, repeat):
+    timings, labels = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fig = build(data, 'P1', 'P2')
+        fig.savefig(io.BytesIO(), format='png', bbox_inches='tight', dpi=200)
+        timings.append(time.perf_counter() - start)
+        labels = len(fig.axes[0].texts)
+        plt.close(fig)
+    return min(timings), labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare scatter label placement strategies")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[10, 25, 50, 100, 200])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    try:
+        import adjustText  # noqa: F401
+        baseline = adjust_text_figure
+    except ImportError:
+        baseline = None
+        print("adjustText is not installed; timing the grid placement only\n")
+
+    print(f"{'points':>7} {'adjustText s':>13} {'labels':>7} {'grid s':>8} {'labels':>7} {'speedup':>8}")
+    for n in args.sizes:
+        data = dense_pair(n)
+        grid_t, grid_labels = render_time(scatter_figure, data, args.repeat)
+        if baseline is None:
+            print(f"{n:>7} {'-':>13} {'-':>7} {grid_t:>8.3f} {grid_labels:>7} {'-':>8}")
+            continue
+        base_t, base_labels = render_time(baseline, data, args.repeat)
+        print(f"{n:>7} {base_t:>13.3f} {base_labels:>7} {grid_t:>8.3f} {grid_labels:>7} {base_t / grid_t:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
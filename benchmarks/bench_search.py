@@ -0,0 +1,72 @@
+"""对比 pandas str.contains 全表扫描与 GeneSearchIndex 的搜索耗时
+
+    python benchmarks/bench_search.py [lu_web_v3.db]
+
+数据库不存在时使用随机生成的酵母系统名。
+"""
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gene_search import GeneSearchIndex, load_aliases  # noqa: E402
+
+QUERIES = ["Y", "YA", "YAL", "YAL001C", "01", "001C", "W", "TFC3", "NOTAGENE"]
+REPEAT = 50
+
+
+def synthetic_genes(n=6000, seed=0):
+    rng = np.random.default_rng(seed)
+    genes = set()
+    while len(genes) < n:
+        chrom = chr(ord('A') + rng.integers(0, 16))
+        genes.add(f"Y{chrom}{rng.choice(['L', 'R'])}{rng.integers(1, 500):03d}{rng.choice(['C', 'W'])}")
+    return sorted(genes)
+
+
+def load_genes(db_path):
+    if os.path.exists(db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            return pd.read_sql('SELECT gene FROM mass_fraction_combine', conn)['gene'].tolist()
+        finally:
+            conn.close()
+    return synthetic_genes()
+
+
+def best_time(fn, repeat=REPEAT):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) > 1 else "lu_web_v3.db"
+    genes = load_genes(db_path)
+    gene_series = pd.Series(genes)
+
+    start = time.perf_counter()
+    index = GeneSearchIndex(genes, load_aliases())
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"{len(genes)} genes, index built in {build_ms:.1f} ms\n")
+
+    print(f"{'query':<10} {'hits':>6} {'pandas ms':>10} {'index ms':>10} {'top-20 ms':>10} {'speedup':>8}")
+    for query in QUERIES:
+        scan = lambda: gene_series[gene_series.str.contains(query, case=False, na=False)]  # noqa: E731
+        hits = len(index.search(query))
+        pandas_t = best_time(scan)
+        index_t = best_time(lambda: index.search(query))
+        top_t = best_time(lambda: index.search(query, limit=20))
+        print(f"{query:<10} {hits:>6} {pandas_t * 1000:>10.3f} {index_t * 1000:>10.3f} "
+              f"{top_t * 1000:>10.3f} {pandas_t / index_t:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
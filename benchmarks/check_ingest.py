@@ -0,0 +1,179 @@
+"""检查增量导入与完整重建的结果是否一致
+
+    python benchmarks/check_ingest.py [--genes 2000] [--conditions 60] [--new-genes 100] [--new-conditions 5]
+
+在临时目录用 synthetic_db.py 的合成数据构建两份存储：
+    incremental  去掉最后 --new-genes 个基因和 --new-conditions 个条件建库，构建矩阵存储及
+                 相关系数 / log 分布 / 累积表，再用 ingest.py 导入新基因、新条件（含注释和元数据）
+    full         用完整数据建库并构建同样的结果
+逐项比较矩阵和三个派生结果，给出最大差异；超出容差时以非零状态退出。
+KDE 网格在增量导入时可能沿用旧网格，密度插值到完整重建的网格上再比较，差异相对于峰值密度。
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from compartment_tables import TABLES_FILE, build_cumulative_tables, load_cumulative_tables  # noqa: E402
+from correlation import CORRELATION_FILE, correlation_matrix, load_correlation_matrix  # noqa: E402
+from distributions import DISTRIBUTION_FILE, load_log_distributions, log_distributions  # noqa: E402
+from ingest import ingest  # noqa: E402
+from matrix_store import (MATRIX_TABLES, active_store, build_store, load_store, open_matrix,  # noqa: E402
+                          store_version)
+from synthetic_db import synthetic_tables  # noqa: E402
+
+# 相关系数由充分统计量重新组合，只差浮点舍入；KDE 为相对峰值的差异
+TOLERANCES = {
+    'matrix': 0.0,
+    'correlation': 1e-9,
+    'correlation_counts': 0.0,
+    'histogram': 0.0,
+    'kde': 1e-3,
+    'cumulative': 0.0,
+}
+
+
+def write_db(db_path, tables):
+    conn = sqlite3.connect(db_path)
+    try:
+        for table, df in tables.items():
+            df.to_sql(table, conn, index=False)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def build_artifacts(store_dir):
+    """与 correlation.py / distributions.py / compartment_tables.py 的离线构建相同"""
+    version = store_version(store_dir)
+    matrix, _, conditions = open_matrix('mass_fraction_combine', store_dir)
+    correlation_matrix(matrix, conditions, version=version).save(os.path.join(store_dir, CORRELATION_FILE))
+    log_distributions(matrix, conditions, version=version).save(os.path.join(store_dir, DISTRIBUTION_FILE))
+    mass_fraction_df, compartment_df, _ = load_store(store_dir)
+    build_cumulative_tables(mass_fraction_df, compartment_df, version=version).save(
+        os.path.join(store_dir, TABLES_FILE))
+
+
+def split_tables(tables, n_new_genes, n_new_conditions):
+    """返回 (基础数据库的表, 导入用的 CSV 表)"""
+    mass_fraction = tables['mass_fraction_combine']
+    conditions = [c for c in mass_fraction.columns if c != 'gene']
+    old_conditions, new_conditions = conditions[:-n_new_conditions], conditions[-n_new_conditions:]
+    old_genes = mass_fraction['gene'].iloc[:-n_new_genes]
+    new_genes = set(mass_fraction['gene'].iloc[-n_new_genes:])
+
+    annotation = tables['compartment_annotation_refine']
+    promass = tables['ProMassRatio_across_compartment_combine']
+    metadata = tables['physiology_collection']
+    base = {
+        'mass_fraction_combine': mass_fraction.loc[mass_fraction['gene'].isin(old_genes), ['gene', *old_conditions]],
+        'compartment_annotation_refine': annotation[~annotation['gene'].isin(new_genes)],
+        'ProMassRatio_across_compartment_combine': promass[['compartment', *old_conditions]],
+        'physiology_collection': metadata[metadata['condition'].isin(old_conditions)],
+    }
+    # 已有基因只给出新条件的值，新基因给出全部条件
+    added = mass_fraction.copy()
+    added.loc[added['gene'].isin(old_genes), old_conditions] = np.nan
+    inputs = {
+        'mass_fraction': added,
+        'promass': promass[['compartment', *new_conditions]],
+        'annotation': annotation[annotation['gene'].isin(new_genes)],
+        'metadata': metadata[metadata['condition'].isin(new_conditions)],
+    }
+    return base, inputs
+
+
+def max_difference(a, b):
+    """两个数组的最大绝对差；NaN 位置必须一致，否则为 inf"""
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    if a.shape != b.shape or not np.array_equal(np.isnan(a), np.isnan(b)):
+        return np.inf
+    finite = ~np.isnan(a)
+    return float(np.abs(a[finite] - b[finite]).max()) if finite.any() else 0.0
+
+
+def compare(incremental_dir, full_dir):
+    """返回 [(检查项, 最大差异)]"""
+    results = []
+    for table in MATRIX_TABLES:
+        inc_matrix, inc_rows, inc_conditions = open_matrix(table, incremental_dir)
+        full_matrix, full_rows, full_conditions = open_matrix(table, full_dir)
+        same_labels = inc_rows == full_rows and inc_conditions == full_conditions
+        results.append((f'matrix[{table}]', max_difference(inc_matrix, full_matrix) if same_labels else np.inf))
+
+    inc, full = load_correlation_matrix(incremental_dir), load_correlation_matrix(full_dir)
+    same = inc.conditions == full.conditions
+    results.append(('correlation', max_difference(inc.values, full.values) if same else np.inf))
+    results.append(('correlation_counts', max_difference(inc.counts, full.counts) if same else np.inf))
+
+    inc, full = load_log_distributions(incremental_dir), load_log_distributions(full_dir)
+    histogram, kde = 0.0, 0.0
+    for condition in full.conditions:
+        a, b = inc.lookup(condition), full.lookup(condition)
+        histogram = max(histogram, max_difference(a['counts'], b['counts']), max_difference(a['edges'], b['edges']))
+        i, j = inc._pos[condition], full._pos[condition]
+        if full.n[j] > 1:
+            density = np.interp(full.grid, inc.grid, inc.density[i])
+            kde = max(kde, float(np.abs(density - full.density[j]).max() / full.density[j].max()))
+    results += [('histogram', histogram), ('kde', kde)]
+
+    inc, full = load_cumulative_tables(incremental_dir), load_cumulative_tables(full_dir)
+    cumulative = 0.0 if sorted(inc.compartments) == sorted(full.compartments) and inc.conditions == full.conditions \
+        else np.inf
+    for compartment in full.compartments if np.isfinite(cumulative) else []:
+        c, d = inc._compartment_pos[compartment], full._compartment_pos[compartment]
+        inc_slice = slice(inc.offsets[c], inc.offsets[c + 1])
+        full_slice = slice(full.offsets[d], full.offsets[d + 1])
+        cumulative = max(cumulative,
+                         max_difference(inc.rows[inc_slice], full.rows[full_slice]),
+                         max_difference(inc.order[:, inc_slice], full.order[:, full_slice]),
+                         max_difference(inc.cumulative[:, inc_slice], full.cumulative[:, full_slice]),
+                         max_difference(inc.top_values[:, c], full.top_values[:, d]),
+                         max_difference(inc.totals[:, c], full.totals[:, d]))
+    results.append(('cumulative', cumulative))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare incremental ingestion against a full rebuild")
+    parser.add_argument("--genes", type=int, default=2000)
+    parser.add_argument("--conditions", type=int, default=60)
+    parser.add_argument("--new-genes", type=int, default=100)
+    parser.add_argument("--new-conditions", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    tables = synthetic_tables(args.genes, args.conditions, args.seed)
+    base, inputs = split_tables(tables, args.new_genes, args.new_conditions)
+    with tempfile.TemporaryDirectory() as tmp:
+        incremental_dir, full_dir = os.path.join(tmp, 'incremental'), os.path.join(tmp, 'full')
+        write_db(os.path.join(tmp, 'base.db'), base)
+        build_store(os.path.join(tmp, 'base.db'), incremental_dir)
+        build_artifacts(incremental_dir)
+        ingest(incremental_dir, figure_cache_dir=None,
+               **{name: pd.DataFrame(df).reset_index(drop=True) for name, df in inputs.items()})
+
+        write_db(os.path.join(tmp, 'full.db'), tables)
+        build_store(os.path.join(tmp, 'full.db'), full_dir)
+        build_artifacts(full_dir)
+
+        results = compare(active_store(incremental_dir), full_dir)
+
+    failed = False
+    for name, difference in results:
+        limit = TOLERANCES[name.split('[')[0]]
+        ok = difference <= limit
+        failed |= not ok
+        print(f"{name:<52} max diff {difference:.3g}  (tolerance {limit:g})  {'ok' if ok else 'MISMATCH'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""api_server.py 压力测试：多个长连接并发发送请求，报告吞吐量和延迟分位数
+
+    python benchmarks/load_test_api.py [--url http://127.0.0.1:8503] [--connections 16] [--duration 10]
+
+每个连接循环发送一组混合请求（基因查询、批量查询、条件切片、细胞器汇总、检索），
+请求带 Accept-Encoding: gzip，复用同一 TCP 连接。结果以 JSON 输出。
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from urllib.parse import quote, urlparse
+
+BATCH_GENES = 200
+
+
+async def fetch_json(reader, writer, host, method, path, body=b""):
+    """在已建立的连接上发送一个请求，返回 (状态码, 响应字节数)"""
+    request = (f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nAccept-Encoding: gzip\r\n"
+               f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n").encode("latin-1") + body
+    writer.write(request)
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    length = 0
+    for line in lines[1:]:
+        if line.lower().startswith("content-length:"):
+            length = int(line.split(":", 1)[1])
+    await reader.readexactly(length)
+    return status, length
+
+
+def build_requests(genes, conditions, compartments, seed=0):
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(50):
+        gene = rng.choice(genes)
+        picked = rng.sample(conditions, min(5, len(conditions)))
+        requests.append(("GET", f"/genes/{quote(gene)}?conditions={','.join(picked)}", b""))
+        requests.append(("GET", f"/conditions/{rng.choice(conditions)}?pattern={quote(gene[:3])}", b""))
+        requests.append(("GET", f"/compartments/{quote(rng.choice(compartments))}?conditions={','.join(picked)}", b""))
+        requests.append(("GET", f"/search?q={quote(gene[:4])}&limit=20", b""))
+        body = json.dumps({"genes": rng.sample(genes, min(BATCH_GENES, len(genes))), "conditions": picked})
+        requests.append(("POST", "/genes", body.encode("utf-8")))
+    rng.shuffle(requests)
+    return requests
+
+
+async def worker(host, port, requests, deadline, latencies, stats):
+    reader, writer = await asyncio.open_connection(host, port)
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            method, path, body = requests[i % len(requests)]
+            i += 1
+            start = time.perf_counter()
+            status, length = await fetch_json(reader, writer, host, method, path, body)
+            latencies.append(time.perf_counter() - start)
+            stats["bytes"] += length
+            if status != 200:
+                stats["errors"] += 1
+    finally:
+        writer.close()
+
+
+async def discover(host, port):
+    """从服务取得基因、条件和细胞器列表，用于构造请求"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        async def get(path):
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode("latin-1"))
+            await writer.drain()
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = int([line for line in head.decode("latin-1").split("\r\n")
+                          if line.lower().startswith("content-length:")][0].split(":", 1)[1])
+            return json.loads(await reader.readexactly(length))
+
+        conditions = (await get("/conditions"))["conditions"]
+        compartments = [c["compartment"] for c in (await get("/compartments"))["compartments"]]
+        genes = []
+        for prefix in ["YA", "YB", "YC", "YD", "YE", "YF", "YG", "YH"]:
+            genes += (await get(f"/search?q={prefix}&limit=100"))["genes"]
+        return genes, conditions, compartments
+    finally:
+        writer.close()
+
+
+async def run(url, connections, duration):
+    parsed = urlparse(url)
+    host, port = parsed.hostname, parsed.port or 80
+    genes, conditions, compartments = await discover(host, port)
+    if not genes:
+        raise SystemExit("No genes returned by /search; is the server running on the right database?")
+    requests = build_requests(genes, conditions, compartments)
+
+    latencies, stats = [], {"bytes": 0, "errors": 0}
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*[worker(host, port, requests[i:] + requests[:i], deadline, latencies, stats)
+                           for i in range(connections)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+
+    return {
+        "url": url,
+        "connections": connections,
+        "duration_s": elapsed,
+        "requests": len(latencies),
+        "errors": stats["errors"],
+        "requests_per_s": len(latencies) / elapsed,
+        "mb_per_s": stats["bytes"] / elapsed / 1024 / 1024,
+        "latency_ms": {
+            "mean": statistics.mean(latencies) * 1000,
+            "p50": percentile(50),
+            "p95": percentile(95),
+            "p99": percentile(99),
+            "max": latencies[-1] * 1000,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for api_server.py")
+    parser.add_argument("--url", default="http://127.0.0.1:8503")
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.url, args.connections, args.duration))
+    print(f"{report['requests_per_s']:.0f} req/s, p50 {report['latency_ms']['p50']:.1f} ms, "
+          f"p99 {report['latency_ms']['p99']:.1f} ms, {report['errors']} errors", file=sys.stderr)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""热点路径基准测试：数据加载、基因搜索、细胞器累积曲线的数据计算和 utils.py 中的五个绘图函数
+
+    python benchmarks/run_benchmarks.py [--db lu_web_v3.db] [--repeat 5] [--out result.json]
+    python benchmarks/run_benchmarks.py --compare baseline.json --out result.json
+
+未指定 --db 时在临时目录生成合成数据库（见 synthetic_db.py，默认 6000 基因 x 275 条件）。
+无需启动 Streamlit，使用 Agg 后端绘图。每个测试在单独的子进程中运行，记录:
+    wall_ms        首次耗时及重复 --repeat 次的最小值 / 中位数
+    peak_rss_mb    子进程峰值常驻内存（含准备数据）
+    rss_growth_mb  计时阶段峰值内存的增长
+    alloc_peak_mb  tracemalloc 统计的单次调用 Python 分配峰值
+结果以 JSON 输出，可用 --compare 与之前提交的结果对比。
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SEARCH_QUERY = "YAL"
+
+
+def peak_rss_mb():
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def _case_inputs(db_path, store_dir):
+    from matrix_store import load_tables
+
+    mass_fraction_df, compartment_df, promass_df = load_tables(db_path, store_dir)
+    conditions = [c for c in mass_fraction_df.columns if c != 'gene']
+    return mass_fraction_df, compartment_df, promass_df, conditions[0], conditions[1]
+
+
+def setup_case(name, db_path, store_dir, sql_store_dir):
+    """准备数据（不计时），返回被计时的无参函数"""
+    import utils
+    from data_loader import load_columns, load_rows
+    from figure_cache import FigureCache
+    from matrix_store import load_tables
+
+    if name == 'load_tables[sql]':
+        return lambda: load_tables(db_path, sql_store_dir)
+    if name == 'load_tables[store]':
+        return lambda: load_tables(db_path, store_dir)
+    if name == 'load_columns[sql]':
+        return lambda: load_columns('mass_fraction_combine', ['P1'], db_path, sql_store_dir)
+    if name == 'load_columns[store]':
+        return lambda: load_columns('mass_fraction_combine', ['P1'], db_path, store_dir)
+
+    mass_fraction_df, compartment_df, promass_df, c1, c2 = _case_inputs(db_path, store_dir)
+    # 两种搜索都从已加载的表中取出匹配行，只比较查找本身；search[index,load_rows] 为应用中的实际路径
+    if name == 'search[pandas]':
+        return lambda: mass_fraction_df[mass_fraction_df['gene'].str.contains(SEARCH_QUERY, case=False, na=False)]
+    if name in ('search[index]', 'search[index,load_rows]'):
+        from gene_search import GeneSearchIndex, load_aliases
+
+        index = GeneSearchIndex(mass_fraction_df['gene'], load_aliases(os.path.join(ROOT, 'gene_aliases.csv')))
+        if name == 'search[index]':
+            return lambda: mass_fraction_df.iloc[index.search(SEARCH_QUERY)]
+        return lambda: load_rows('mass_fraction_combine', index.search(SEARCH_QUERY), db_path, store_dir)
+
+    compartment = compartment_df['compartment'].iloc[0]
+    tables = None
+    if name.endswith('[tables]'):
+        from compartment_tables import build_cumulative_tables
+
+        tables = build_cumulative_tables(mass_fraction_df, compartment_df)
+    # 累积曲线的数据部分（不含绘图）：预计算表只加速这一步，绘图耗时由 matplotlib 决定
+    if name in ('compartment_cumulative', 'compartment_cumulative[tables]'):
+        from analysis import compartment_cumulative
+
+        return lambda: compartment_cumulative(compartment, c1, mass_fraction_df, compartment_df, tables)
+
+    # 绘图函数：每次使用新的内存缓存，计时包含绘图和 PNG 编码，不会命中缓存
+    plots = {
+        'plot_cumulative_mass_fraction': lambda cache: utils.plot_cumulative_mass_fraction(
+            compartment, c1, mass_fraction_df, compartment_df, cache=cache),
+        'plot_cumulative_mass_fraction[tables]': lambda cache: utils.plot_cumulative_mass_fraction(
+            compartment, c1, mass_fraction_df, compartment_df, tables, cache=cache),
+        'plot_distribution': lambda cache: utils.plot_distribution(promass_df, c1, cache=cache),
+        'plot_scatter': lambda cache: utils.plot_scatter(promass_df, c1, c2, cache=cache),
+        'plot_distribution_5': lambda cache: utils.plot_distribution_5(mass_fraction_df, c1, cache=cache),
+        'plot_log_scatter_5': lambda cache: utils.plot_log_scatter_5(mass_fraction_df, c1, c2, cache=cache),
+    }
+    plot = plots[name]
+    return lambda: plot(FigureCache())
+
+
+CASES = [
+    'load_tables[sql]',
+    'load_tables[store]',
+    'load_columns[sql]',
+    'load_columns[store]',
+    'search[pandas]',
+    'search[index]',
+    'search[index,load_rows]',
+    'compartment_cumulative',
+    'compartment_cumulative[tables]',
+    'plot_cumulative_mass_fraction',
+    'plot_cumulative_mass_fraction[tables]',
+    'plot_distribution',
+    'plot_scatter',
+    'plot_distribution_5',
+    'plot_log_scatter_5',
+]
+
+
+def run_case(name, db_path, store_dir, sql_store_dir, repeat):
+    """在子进程中执行：先计时，再单独开启 tracemalloc 统计分配（避免影响计时）"""
+    # 没有 Streamlit 服务时 st.* 会提示缺少 ScriptRunContext；log(0) 的警告来自被测函数本身
+    warnings.simplefilter('ignore', RuntimeWarning)
+    import matplotlib
+    matplotlib.use('Agg')
+    import streamlit.logger
+    streamlit.logger.set_log_level('error')
+
+    fn = setup_case(name, db_path, store_dir, sql_store_dir)
+    gc.collect()
+    rss_before = peak_rss_mb()
+
+    start = time.perf_counter()
+    fn()
+    first = time.perf_counter() - start
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    rss_after = peak_rss_mb()
+
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'wall_ms': {
+            'first': first * 1000,
+            'min': min(timings) * 1000,
+            'median': statistics.median(timings) * 1000,
+        },
+        'repeat': repeat,
+        'peak_rss_mb': rss_after,
+        'rss_growth_mb': rss_after - rss_before,
+        'alloc_peak_mb': peak / 1024 / 1024,
+        'alloc_retained_mb': current / 1024 / 1024,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    print(f"{'case':<40} {'base ms':>10} {'now ms':>10} {'ratio':>7} {'base MB':>9} {'now MB':>9}", file=sys.stderr)
+    for name, now in results['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        ratio = now['wall_ms']['median'] / base['wall_ms']['median'] if base['wall_ms']['median'] else float('nan')
+        print(f"{name:<40} {base['wall_ms']['median']:>10.2f} {now['wall_ms']['median']:>10.2f} {ratio:>6.2f}x "
+              f"{base['alloc_peak_mb']:>9.2f} {now['alloc_peak_mb']:>9.2f}", file=sys.stderr)
+
+
+def main():
+    from matrix_store import build_store
+    from synthetic_db import make_synthetic_db
+
+    parser = argparse.ArgumentParser(description="Benchmark data loading, search and plotting")
+    parser.add_argument("--db", help="database to benchmark (default: generate a synthetic one)")
+    parser.add_argument("--genes", type=int, default=6000)
+    parser.add_argument("--conditions", type=int, default=275)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cases", nargs="*", default=CASES, choices=CASES, metavar="CASE")
+    parser.add_argument("--out", help="write JSON here (default: stdout)")
+    parser.add_argument("--compare", help="previous JSON result to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="yeast-bench-") as workdir:
+        db_path = args.db
+        if db_path is None:
+            db_path = make_synthetic_db(os.path.join(workdir, "synthetic.db"), args.genes, args.conditions)
+        db_path = os.path.abspath(db_path)
+        store_dir = os.path.join(workdir, "matrix_store")
+        build_store(db_path, store_dir)
+        # 不存在的目录，使 load_tables / data_loader 走 SQL 路径
+        sql_store_dir = os.path.join(workdir, "no_store")
+
+        results = {}
+        for name in args.cases:
+            # 每个测试一个新进程，峰值内存互不影响
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                results[name] = pool.submit(run_case, name, db_path, store_dir, sql_store_dir, args.repeat).result()
+            print(f"{name:<40} {results[name]['wall_ms']['median']:>10.2f} ms", file=sys.stderr)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'db': args.db or f"synthetic {args.genes}x{args.conditions}",
+        },
+        'results': results,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""共表达查询：在全部条件上 log 质量分数谱最相似的蛋白质
+
+每个基因的 log 质量分数谱（质量分数为 0 或缺失的条件视为缺失）减去自身均值、除以范数，
+保存为 (基因数, 条件数) 的 float32 矩阵的一行；缺失条件按均值填补，中心化后为 0，不参与相关。
+两行的点积即两个基因谱的 Pearson 相关系数，查询一组基因只需一次矩阵乘法加 argpartition，
+约 6000 基因 x 275 条件时为毫秒级，不需要近似最近邻结构。
+
+有效条件少于 MIN_CONDITIONS 的基因不参与查询（谱置为零向量）。结果同时给出两个基因
+共同有效的条件数，填补较多的基因对相关系数偏小，可据此判断可靠性。
+"""
+import numpy as np
+import pandas as pd
+
+from correlation import _log_block
+from matrix_store import is_condition
+
+MIN_CONDITIONS = 10
+TOP_K = 20
+CHUNK_GENES = 1024
+CHUNK_QUERIES = 256
+
+
+def normalized_profiles(matrix, min_conditions=MIN_CONDITIONS, chunk_genes=CHUNK_GENES):
+    """matrix 为条件优先的 (条件数, 基因数) 矩阵，返回 (profiles, valid)
+
+    profiles 为 (基因数, 条件数) 的中心化单位向量，valid 为每个基因的有效条件掩码。
+    """
+    n_conditions, n_genes = matrix.shape
+    profiles = np.zeros((n_genes, n_conditions), dtype=np.float32)
+    valid = np.zeros((n_genes, n_conditions), dtype=bool)
+    for start in range(0, n_genes, chunk_genes):
+        logs, mask = _log_block(matrix, start, start + chunk_genes)
+        logs, mask = logs.T, mask.T > 0
+        n = mask.sum(axis=1)
+        mean = logs.sum(axis=1) / np.maximum(n, 1)
+        centered = np.where(mask, logs - mean[:, None], 0.0)
+        norm = np.sqrt((centered ** 2).sum(axis=1))
+        keep = (n >= min_conditions) & (norm > 0)
+        stop = start + len(logs)
+        profiles[start:stop][keep] = centered[keep] / norm[keep, None]
+        valid[start:stop] = mask
+    return profiles, valid
+
+
+class CoexpressionIndex:
+    def __init__(self, genes, profiles, valid):
+        self.genes = list(genes)
+        self.profiles = profiles
+        self.valid = valid
+        self.usable = profiles.any(axis=1)
+        self._valid_f32 = valid.astype(np.float32)
+        self._pos = {g: i for i, g in enumerate(self.genes)}
+
+    @classmethod
+    def from_matrix(cls, matrix, genes, min_conditions=MIN_CONDITIONS):
+        return cls(genes, *normalized_profiles(matrix, min_conditions))
+
+    @classmethod
+    def from_frame(cls, mass_fraction_df, min_conditions=MIN_CONDITIONS):
+        conditions = [col for col in mass_fraction_df.columns if is_condition(col)]
+        return cls.from_matrix(mass_fraction_df[conditions].to_numpy().T, mass_fraction_df['gene'], min_conditions)
+
+    def __contains__(self, gene):
+        row = self._pos.get(gene)
+        return row is not None and bool(self.usable[row])
+
+    def positions(self, genes):
+        return [self._pos[g] for g in genes]
+
+    def query(self, rows, k=TOP_K):
+        """rows 为基因所在行；返回 (近邻行, 相关系数, 共同有效条件数)，均为 (查询数, k)，按相关系数降序"""
+        rows = np.asarray(rows, dtype=np.int64)
+        k = max(0, min(k, int(self.usable.sum()) - 1))
+        neighbors = np.zeros((len(rows), k), dtype=np.int64)
+        scores = np.zeros((len(rows), k), dtype=np.float32)
+        shared = np.zeros((len(rows), k), dtype=np.int32)
+        if k == 0:
+            return neighbors, scores, shared
+        for start in range(0, len(rows), CHUNK_QUERIES):
+            chunk = rows[start:start + CHUNK_QUERIES]
+            # 一次矩阵乘法得到这批基因与全部基因的相关系数
+            similarity = self.profiles[chunk] @ self.profiles.T
+            similarity[:, ~self.usable] = -np.inf
+            similarity[np.arange(len(chunk)), chunk] = -np.inf
+            top = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(similarity, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            top = np.take_along_axis(top, order, axis=1)
+            neighbors[start:start + len(chunk)] = top
+            scores[start:start + len(chunk)] = np.take_along_axis(top_scores, order, axis=1)
+            shared[start:start + len(chunk)] = np.einsum('qc,qkc->qk', self._valid_f32[chunk], self._valid_f32[top])
+        return neighbors, scores, shared
+
+    def neighbors(self, gene, k=TOP_K):
+        """与 gene 共表达最强的 k 个蛋白质；gene 有效条件不足时返回空表"""
+        if gene not in self:
+            return pd.DataFrame({'gene': [], 'correlation': [], 'shared_conditions': []})
+        top, scores, shared = self.query([self._pos[gene]], k)
+        return pd.DataFrame({'gene': [self.genes[i] for i in top[0]], 'correlation': scores[0],
+                             'shared_conditions': shared[0]})
@@ -0,0 +1,101 @@
+"""细胞器汇总引擎：基因 -> 细胞器的稀疏成员矩阵
+
+由 compartment_annotation_refine（或任意自定义基因集合 / 其他注释）构建 (细胞器数, 基因数) 的
+CSR 稀疏矩阵，全部细胞器 x 全部条件的汇总只需一次稀疏-稠密矩阵乘法：
+
+    totals = membership @ mass_fraction            (细胞器数, 基因数) @ (基因数, 条件数)
+
+按数据库注释计算的结果即 ProMassRatio_across_compartment_combine（各细胞器注释蛋白质量分数之和），
+因此可以对自定义基因集合或其他注释在毫秒级重新计算比例表，而不必保存过时的副本。
+split_shared=True 时属于多个细胞器的蛋白按细胞器数均分质量，各细胞器之和不再重复计算。
+"""
+import numpy as np
+import pandas as pd
+
+from matrix_store import is_condition
+
+CHUNK_CONDITIONS = 64
+
+
+class CompartmentEngine:
+    def __init__(self, genes, compartments, membership):
+        self.genes = list(genes)
+        self.compartments = list(compartments)
+        self.membership = membership
+        self._pos = {c: i for i, c in enumerate(self.compartments)}
+
+    @classmethod
+    def from_gene_sets(cls, genes, gene_sets, split_shared=False):
+        """gene_sets 为 {细胞器 / 集合名: 基因列表}；不在 genes 中的基因忽略"""
+        from scipy.sparse import csr_matrix  # scipy.sparse 导入较慢，用到时才导入
+
+        gene_rows = {g: i for i, g in enumerate(genes)}
+        compartments, row_ids, col_ids = [], [], []
+        for name, members in gene_sets.items():
+            cols = sorted({gene_rows[g] for g in members if g in gene_rows})
+            row_ids.extend([len(compartments)] * len(cols))
+            col_ids.extend(cols)
+            compartments.append(name)
+        weights = np.ones(len(col_ids))
+        if split_shared and col_ids:
+            weights /= np.bincount(col_ids, minlength=len(gene_rows))[col_ids]
+        membership = csr_matrix((weights, (row_ids, col_ids)), shape=(len(compartments), len(gene_rows)))
+        return cls(genes, compartments, membership)
+
+    @classmethod
+    def from_annotation(cls, genes, compartment_df, split_shared=False):
+        """细胞器按在注释中首次出现的顺序排列"""
+        members = compartment_df[['compartment', 'gene']].dropna()
+        gene_sets = {name: group.to_numpy() for name, group in members.groupby('compartment', sort=False)['gene']}
+        return cls.from_gene_sets(genes, gene_sets, split_shared)
+
+    def __contains__(self, compartment):
+        return compartment in self._pos
+
+    def sizes(self):
+        """各细胞器的成员基因数"""
+        return np.diff(self.membership.indptr)
+
+    def members(self, compartment):
+        """细胞器成员基因的行号（升序）"""
+        i = self._pos[compartment]
+        return self.membership.indices[self.membership.indptr[i]:self.membership.indptr[i + 1]]
+
+    def totals(self, matrix):
+        """matrix 为条件优先的 (条件数, 基因数) 矩阵（可以是内存映射），返回 (细胞器数, 条件数)；缺失值按 0 计"""
+        n_conditions = matrix.shape[0]
+        result = np.zeros((len(self.compartments), n_conditions))
+        for start in range(0, n_conditions, CHUNK_CONDITIONS):
+            block = np.nan_to_num(np.asarray(matrix[start:start + CHUNK_CONDITIONS], dtype=np.float64))
+            result[:, start:start + len(block)] = self.membership @ block.T
+        return result
+
+    def ratio_table(self, matrix, conditions):
+        """与 ProMassRatio_across_compartment_combine 结构相同的表 [compartment, 条件...]"""
+        table = pd.DataFrame(self.totals(matrix), columns=list(conditions))
+        table.insert(0, 'compartment', self.compartments)
+        return table
+
+
+def compartment_ratio_table(mass_fraction_df, compartment_df=None, conditions=None, gene_sets=None,
+                            split_shared=False):
+    """由质量分数表重新计算细胞器比例表；gene_sets 给出时按自定义基因集合汇总，否则按注释"""
+    conditions = list(conditions) if conditions is not None else \
+        [col for col in mass_fraction_df.columns if is_condition(col)]
+    genes = mass_fraction_df['gene']
+    engine = CompartmentEngine.from_gene_sets(genes, gene_sets, split_shared) if gene_sets is not None \
+        else CompartmentEngine.from_annotation(genes, compartment_df, split_shared)
+    return engine.ratio_table(mass_fraction_df[conditions].to_numpy().T, conditions)
+
+
+def parse_gene_sets(text):
+    """每行一个集合：`名称: 基因1, 基因2 ...`（基因之间用逗号或空白分隔），返回 {名称: [基因...]}"""
+    gene_sets = {}
+    for line in text.splitlines():
+        if ':' not in line:
+            continue
+        name, genes = line.split(':', 1)
+        genes = [g for g in genes.replace(',', ' ').split() if g]
+        if name.strip() and genes:
+            gene_sets.setdefault(name.strip(), []).extend(genes)
+    return gene_sets
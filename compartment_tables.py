@@ -0,0 +1,189 @@
+"""细胞器 x 条件的累积质量分数预计算表
+
+对每个细胞器、每个条件预先完成“筛选成员基因 -> 排序 -> 累加”，点击 Generate Analysis
+时只需按 (compartment, cond) 取出对应切片。增量导入新条件时只为新条件计算，成员基因有变化
+（新增基因或注释）的细胞器才整体重算（见 update_cumulative_tables）。
+
+离线构建（需先运行 matrix_store.py）:
+    python compartment_tables.py [matrix_store]
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from compartment_engine import CompartmentEngine
+from matrix_store import STORE_DIR, active_store, is_condition, load_store, store_version
+
+TABLES_FILE = "cumulative_tables.npz"
+TOP_N = 10
+
+
+class CumulativeTables:
+    """所有细胞器的成员基因连续存放，offsets 给出每个细胞器所在的区段
+
+    rows:       成员基因在 mass_fraction_df 中的行号 (M,)
+    order:      每个条件下按质量分数降序排列的区段内位置 (条件数, M)，int16/int32
+    cumulative: 排序后的累积质量分数 (条件数, M)，float32
+    top_values: 前 TOP_N 个蛋白的原始质量分数 (条件数, 细胞器数, TOP_N)
+    totals:     细胞器总质量分数 (条件数, 细胞器数)
+    """
+
+    def __init__(self, compartments, conditions, genes, rows, offsets, order, cumulative, top_values, totals,
+                 version=None):
+        self.compartments = list(compartments)
+        self.conditions = list(conditions)
+        self.genes = np.asarray(genes, dtype=object)
+        self.rows = rows
+        self.offsets = offsets
+        self.order = order
+        self.cumulative = cumulative
+        self.top_values = top_values
+        self.totals = totals
+        self.version = version
+        self._compartment_pos = {c: i for i, c in enumerate(self.compartments)}
+        self._condition_pos = {c: i for i, c in enumerate(self.conditions)}
+
+    def __contains__(self, key):
+        compartment, cond = key
+        return compartment in self._compartment_pos and cond in self._condition_pos
+
+    def lookup(self, compartment, cond):
+        """返回 (sorted_df, total)；sorted_df 列为 gene, cond, cumulative_mass，已按 cond 降序"""
+        c = self._compartment_pos[compartment]
+        j = self._condition_pos[cond]
+        start, end = self.offsets[c], self.offsets[c + 1]
+        order = self.order[j, start:end]
+        cumulative = self.cumulative[j, start:end]
+        values = np.diff(cumulative, prepend=np.float32(0))
+        values[np.isnan(cumulative)] = np.nan
+        # 累积值为 float32，差分会损失精度；前 TOP_N 个直接用保存的原始值
+        top = self.top_values[j, c, :min(TOP_N, len(values))]
+        values[:len(top)] = top
+        sorted_df = pd.DataFrame({
+            'gene': self.genes[self.rows[start:end][order]],
+            cond: values,
+            'cumulative_mass': cumulative,
+        })
+        return sorted_df, float(self.totals[j, c])
+
+    def save(self, path):
+        np.savez(path, compartments=np.array(self.compartments, dtype=str),
+                 conditions=np.array(self.conditions, dtype=str), genes=self.genes.astype(str),
+                 rows=self.rows, offsets=self.offsets, order=self.order, cumulative=self.cumulative,
+                 top_values=self.top_values, totals=self.totals, version=np.array(self.version or ''))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['compartments'].tolist(), data['conditions'].tolist(), data['genes'].tolist(),
+                       data['rows'], data['offsets'], data['order'], data['cumulative'], data['top_values'],
+                       data['totals'], version=str(data['version']) or None)
+
+
+def compartment_members(genes, compartment_df):
+    """细胞器列表及每个细胞器的成员基因行号 {compartment: rows}"""
+    engine = CompartmentEngine.from_annotation(genes, compartment_df)
+    return engine.compartments, {c: engine.members(c).astype(np.int32) for c in engine.compartments}
+
+
+def compartment_block(values):
+    """values 为 (条件数, 成员数)，返回 (order, cumulative, top, totals)"""
+    # NaN 排在最后，与 sort_values 一致
+    order = np.argsort(-values, axis=1, kind='stable')
+    sorted_values = np.take_along_axis(values, order, axis=1)
+    cumulative = np.nancumsum(sorted_values, axis=1)
+    cumulative[np.isnan(sorted_values)] = np.nan
+    top = np.full((values.shape[0], TOP_N), np.nan)
+    top[:, :min(TOP_N, values.shape[1])] = sorted_values[:, :TOP_N]
+    return order, cumulative.astype(np.float32), top, np.nansum(values, axis=1)
+
+
+def assemble_tables(compartments, conditions, genes, rows, blocks, version=None):
+    """rows / blocks 按 compartments 顺序给出每个细胞器的成员行号和 compartment_block 结果"""
+    offsets = np.concatenate([[0], np.cumsum([len(r) for r in rows])]).astype(np.int64)
+    # 区段内位置一般不超过几千，用 int16 存储即可
+    max_members = max(np.diff(offsets), default=0)
+    order_dtype = np.int16 if max_members <= np.iinfo(np.int16).max else np.int32
+    n = len(conditions)
+    return CumulativeTables(
+        compartments, conditions, np.asarray(genes, dtype=object),
+        rows=np.concatenate(rows) if rows else np.empty(0, dtype=np.int32),
+        offsets=offsets,
+        order=np.concatenate([b[0] for b in blocks], axis=1).astype(order_dtype) if blocks
+        else np.empty((n, 0), dtype=order_dtype),
+        cumulative=np.concatenate([b[1] for b in blocks], axis=1) if blocks else np.empty((n, 0), dtype=np.float32),
+        top_values=np.stack([b[2] for b in blocks], axis=1).astype(np.float32) if blocks
+        else np.empty((n, 0, TOP_N), dtype=np.float32),
+        totals=np.stack([b[3] for b in blocks], axis=1) if blocks else np.empty((n, 0)),
+        version=version,
+    )
+
+
+def build_cumulative_tables(mass_fraction_df, compartment_df, version=None):
+    conditions = [col for col in mass_fraction_df.columns if is_condition(col)]
+    # 条件优先的矩阵，与 matrix_store 的磁盘布局一致
+    matrix = mass_fraction_df[conditions].to_numpy(dtype=np.float64).T
+    return cumulative_tables(matrix, conditions, mass_fraction_df['gene'].to_numpy(dtype=object), compartment_df,
+                             version=version)
+
+
+def cumulative_tables(matrix, conditions, genes, compartment_df, version=None):
+    """matrix 为条件优先的 (条件数, 基因数) 矩阵"""
+    compartments, members = compartment_members(genes, compartment_df)
+    rows = [members[c] for c in compartments]
+    blocks = [compartment_block(np.asarray(matrix[:, r], dtype=np.float64)) for r in rows]
+    return assemble_tables(compartments, conditions, genes, rows, blocks, version=version)
+
+
+def update_cumulative_tables(tables, matrix, conditions, genes, compartment_df, version=None):
+    """在已有表上追加条件（矩阵末尾的行）；成员基因不变的细胞器只计算新条件，其余整体重算
+
+    matrix / conditions / genes 为追加后的完整数据，旧的条件和基因保持原有顺序、位于前面。
+    """
+    n_old = len(tables.conditions)
+    if list(conditions[:n_old]) != tables.conditions:
+        return cumulative_tables(matrix, conditions, genes, compartment_df, version=version)
+    compartments, members = compartment_members(genes, compartment_df)
+    rows, blocks = [], []
+    for compartment in compartments:
+        member_rows = members[compartment]
+        c = tables._compartment_pos.get(compartment)
+        unchanged = c is not None and np.array_equal(tables.rows[tables.offsets[c]:tables.offsets[c + 1]],
+                                                     member_rows)
+        if not unchanged:
+            block = compartment_block(np.asarray(matrix[:, member_rows], dtype=np.float64))
+        else:
+            start, end = tables.offsets[c], tables.offsets[c + 1]
+            old = (tables.order[:, start:end], tables.cumulative[:, start:end], tables.top_values[:, c],
+                   tables.totals[:, c])
+            if len(conditions) > n_old:
+                new = compartment_block(np.asarray(matrix[n_old:, member_rows], dtype=np.float64))
+                block = tuple(np.concatenate([o, n.astype(o.dtype)], axis=0) for o, n in zip(old, new))
+            else:
+                block = old
+        rows.append(member_rows)
+        blocks.append(block)
+    return assemble_tables(compartments, conditions, genes, rows, blocks, version=version)
+
+
+def load_cumulative_tables(store_dir=STORE_DIR):
+    """读取离线构建的表；不存在或与矩阵存储版本不一致时返回 None"""
+    store_dir = active_store(store_dir)
+    path = os.path.join(store_dir, TABLES_FILE)
+    if not os.path.exists(path):
+        return None
+    tables = CumulativeTables.load(path)
+    if tables.version != store_version(store_dir):
+        return None
+    return tables
+
+
+if __name__ == "__main__":
+    store_dir = active_store(sys.argv[1] if len(sys.argv) > 1 else STORE_DIR)
+    mass_fraction_df, compartment_df, _ = load_store(store_dir)
+    tables = build_cumulative_tables(mass_fraction_df, compartment_df, version=store_version(store_dir))
+    tables.save(os.path.join(store_dir, TABLES_FILE))
+    print(f"Cumulative tables for {len(tables.compartments)} compartments x {len(tables.conditions)} conditions "
+          f"written to {os.path.join(store_dir, TABLES_FILE)}")
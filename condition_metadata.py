@@ -0,0 +1,153 @@
+"""条件（P1-P275）元数据：physiology_collection 表按条件编号索引
+
+physiology_collection 中用于标识条件的列取第一个取值全部形如 P<数字> 的列；
+若没有这样的列，则按行顺序对应 P1, P2, ...
+
+ConditionFacets 为每一列建立倒排索引（取值 -> 条件掩码）和数值列的有序数组，
+多列组合筛选只需几次掩码运算即可得到条件集合。
+"""
+import numpy as np
+import pandas as pd
+
+from matrix_store import is_condition, load_ingested_metadata
+
+METADATA_TABLE = 'physiology_collection'
+
+
+def condition_id_column(mapping_df):
+    for col in mapping_df.columns:
+        values = mapping_df[col].dropna().astype(str)
+        if len(values) and values.map(is_condition).all():
+            return col
+    return None
+
+
+def index_by_condition(mapping_df):
+    """返回以条件编号为索引的元数据表"""
+    id_column = condition_id_column(mapping_df)
+    if id_column is None:
+        return mapping_df.set_axis([f'P{i}' for i in range(1, len(mapping_df) + 1)]).rename_axis('condition')
+    return mapping_df.set_index(mapping_df[id_column].astype(str).rename('condition')).drop(columns=id_column)
+
+
+def load_condition_metadata(conn, store_dir=None):
+    """给出 store_dir 时附加该快照增量导入的条件（见 ingest.py）"""
+    mapping_df = pd.read_sql(f'SELECT * FROM {METADATA_TABLE}', conn)
+    ingested = load_ingested_metadata(store_dir) if store_dir is not None else None
+    if ingested is not None:
+        mapping_df = pd.concat([mapping_df, ingested], ignore_index=True)
+    return index_by_condition(mapping_df)
+
+
+MAX_FACET_VALUES = 30
+
+
+def normalize(value):
+    return str(value).strip().lower()
+
+
+class ConditionFacets:
+    """条件元数据的分面索引
+
+    每列：规范化取值（去空白、小写）-> 布尔掩码；能转换为数值的列另存排序后的数值和对应位置，
+    区间查询用二分查找。取值不超过 MAX_FACET_VALUES 个的列作为多选分面，其余数值列作为区间分面，
+    其余文本列（如菌株、样品描述）作为文本分面，按 "包含" 匹配规范化取值，再合并对应的掩码。
+    """
+
+    def __init__(self, metadata, max_values=MAX_FACET_VALUES):
+        self.conditions = np.array(metadata.index.astype(str))
+        self.columns = list(metadata.columns)
+        self.max_values = max_values
+        self._masks = {}    # 列 -> {规范化取值: 掩码}
+        self._labels = {}   # 列 -> {规范化取值: 显示用的原始取值}
+        self._numeric = {}  # 列 -> (排序后的数值, 对应行号)
+        for column in self.columns:
+            values = metadata[column]
+            codes, uniques = pd.factorize(values.map(normalize))
+            self._masks[column] = {value: codes == code for code, value in enumerate(uniques)}
+            labels = {}
+            for value, label in zip(values.map(normalize), values):
+                labels.setdefault(value, label)
+            self._labels[column] = labels
+            numeric = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64)
+            rows = np.flatnonzero(np.isfinite(numeric))
+            if len(rows):
+                order = rows[np.argsort(numeric[rows], kind='stable')]
+                self._numeric[column] = (numeric[order], order)
+
+    def __len__(self):
+        return len(self.conditions)
+
+    def matching(self, column, text):
+        """规范化后包含 text 的取值（显示用的原始取值，按字母序）"""
+        if column not in self._masks:
+            raise KeyError(column)
+        needle = normalize(text)
+        labels = self._labels[column]
+        return [labels[value] for value in sorted(labels) if needle in value]
+
+    def mask(self, column, wanted):
+        """单列条件的掩码；wanted 为取值列表（任一匹配）、(下限, 上限) 或字符串（取值包含该字符串）"""
+        if column not in self._masks:
+            raise KeyError(column)
+        if isinstance(wanted, str):
+            wanted = self.matching(column, wanted)
+        if isinstance(wanted, tuple):
+            low, high = wanted
+            result = np.zeros(len(self.conditions), dtype=bool)
+            if column in self._numeric:
+                sorted_values, order = self._numeric[column]
+                start = 0 if low is None else np.searchsorted(sorted_values, low, side='left')
+                end = len(sorted_values) if high is None else np.searchsorted(sorted_values, high, side='right')
+                result[order[start:end]] = True
+            return result
+        masks = self._masks[column]
+        result = np.zeros(len(self.conditions), dtype=bool)
+        for value in {normalize(v) for v in wanted}:
+            if value in masks:
+                result |= masks[value]
+        return result
+
+    def resolve_mask(self, filters):
+        result = np.ones(len(self.conditions), dtype=bool)
+        for column, wanted in filters.items():
+            result &= self.mask(column, wanted)
+        return result
+
+    def resolve(self, filters):
+        """多列之间取交集，返回条件编号列表（保持元数据中的顺序）"""
+        return self.conditions[self.resolve_mask(filters)].tolist()
+
+    def facets(self):
+        """界面使用的分面：{列名: ('values', [取值...])、('range', (最小值, 最大值)) 或 ('text', 取值个数)}"""
+        facets = {}
+        for column in self.columns:
+            labels = self._labels[column]
+            if len(labels) <= self.max_values:
+                if column in self._numeric and len(self._numeric[column][0]) == len(self.conditions):
+                    order = sorted(labels, key=lambda v: float(labels[v]))
+                else:
+                    order = sorted(labels)
+                facets[column] = ('values', [labels[v] for v in order])
+            elif column in self._numeric:
+                sorted_values = self._numeric[column][0]
+                facets[column] = ('range', (float(sorted_values[0]), float(sorted_values[-1])))
+            else:
+                facets[column] = ('text', len(labels))
+        return facets
+
+    def counts(self, column, filters=None):
+        """在满足其他列筛选的条件中，column 每个取值对应的条件数"""
+        others = {c: w for c, w in (filters or {}).items() if c != column}
+        base = self.resolve_mask(others)
+        return {self._labels[column][value]: int((mask & base).sum()) for value, mask in self._masks[column].items()}
+
+
+def filter_conditions(metadata, filters):
+    """按元数据筛选条件
+
+    filters: {列名: 取值列表、(下限, 上限) 或字符串}；取值列表按不区分大小写的字符串匹配，
+    区间用于数值列（端点为 None 表示不限），字符串匹配包含它的取值。多个列之间取交集。
+    多次筛选同一份元数据时，直接使用 ConditionFacets 避免重复建立索引。
+    """
+    return ConditionFacets(metadata).resolve(filters)
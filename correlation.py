@@ -0,0 +1,194 @@
+"""全部条件两两之间的 log 质量分数 Pearson 相关系数
+
+对每一对条件只使用两者都为有限值的基因（与 plot_log_scatter_5 中的掩码一致，
+质量分数为 0 或缺失的基因被排除）。所需的各项和按基因分块累加，一次批量矩阵乘法
+即可得到 275 x 275 的结果，内存占用只与分块大小有关。
+
+这些和（共同有效基因数、log 值之和、平方和、交叉积之和）随结果一起保存：增量导入新条件时
+只需计算新条件与全部条件之间的部分，新增基因的贡献直接累加（见 update_correlation_matrix）。
+
+离线构建（需先运行 matrix_store.py）:
+    python correlation.py [matrix_store]
+"""
+import os
+import sys
+
+import numpy as np
+
+from matrix_store import STORE_DIR, active_store, is_condition, open_matrix, store_version
+
+CORRELATION_FILE = "correlation.npz"
+CHUNK_GENES = 1024
+
+
+class CorrelationMatrix:
+    def __init__(self, conditions, values, counts, version=None, sums=None):
+        self.conditions = list(conditions)
+        self.values = values
+        self.counts = counts
+        self.version = version
+        self.sums = sums          # (sum_x, sum_xx, sum_xy)，用于增量更新；旧文件中没有
+        self._pos = {c: i for i, c in enumerate(self.conditions)}
+
+    def __contains__(self, key):
+        column1, column2 = key
+        return column1 in self._pos and column2 in self._pos
+
+    def lookup(self, column1, column2):
+        return float(self.values[self._pos[column1], self._pos[column2]])
+
+    def most_correlated(self, column, n=10):
+        """与给定条件相关性最高的 n 个条件，返回 [(condition, r), ...]"""
+        row = self.values[self._pos[column]].copy()
+        row[self._pos[column]] = np.nan
+        order = np.argsort(-np.nan_to_num(row, nan=-np.inf))[:n]
+        return [(self.conditions[i], float(row[i])) for i in order]
+
+    def save(self, path):
+        sums = dict(zip(('sum_x', 'sum_xx', 'sum_xy'), self.sums)) if self.sums is not None else {}
+        np.savez(path, conditions=np.array(self.conditions, dtype=str), values=self.values,
+                 counts=self.counts, version=np.array(self.version or ''), **sums)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            sums = (data['sum_x'], data['sum_xx'], data['sum_xy']) if 'sum_xy' in data else None
+            return cls(data['conditions'].tolist(), data['values'], data['counts'],
+                       version=str(data['version']) or None, sums=sums)
+
+
+def _log_block(matrix, start, stop):
+    """分块取 log 值，返回 (log 值，无效处为 0, 有效掩码)"""
+    block = np.asarray(matrix[:, start:stop], dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = np.log(block)
+    valid = np.isfinite(logs)
+    logs[~valid] = 0.0
+    return logs, valid.astype(np.float64)
+
+
+def log_correlation_sums(matrix, chunk_genes=CHUNK_GENES):
+    """matrix 为条件优先的 (条件数, 基因数) 矩阵，返回 (count, sum_x, sum_xx, sum_xy)，均为 (条件数, 条件数)"""
+    n_conditions, n_genes = matrix.shape
+    count = np.zeros((n_conditions, n_conditions))
+    sum_x = np.zeros((n_conditions, n_conditions))
+    sum_xx = np.zeros((n_conditions, n_conditions))
+    sum_xy = np.zeros((n_conditions, n_conditions))
+
+    for start in range(0, n_genes, chunk_genes):
+        logs, mask = _log_block(matrix, start, start + chunk_genes)
+        # sum_x[i, j] = 条件 i 在 (i, j) 共同有效基因上的 log 值之和
+        count += mask @ mask.T
+        sum_x += logs @ mask.T
+        sum_xx += (logs * logs) @ mask.T
+        sum_xy += logs @ logs.T
+    return count, sum_x, sum_xx, sum_xy
+
+
+def cross_correlation_sums(rows, cols, chunk_genes=CHUNK_GENES):
+    """两组条件（相同基因）之间的各项和，均为 (len(rows), len(cols))
+
+    返回 (count, sum_x, sum_xx, sum_y, sum_yy, sum_xy)：x 为 rows 中条件的 log 值，y 为 cols 中的。
+    """
+    shape = (rows.shape[0], cols.shape[0])
+    count, sum_x, sum_xx, sum_y, sum_yy, sum_xy = (np.zeros(shape) for _ in range(6))
+    for start in range(0, rows.shape[1], chunk_genes):
+        logs_x, mask_x = _log_block(rows, start, start + chunk_genes)
+        logs_y, mask_y = _log_block(cols, start, start + chunk_genes)
+        count += mask_x @ mask_y.T
+        sum_x += logs_x @ mask_y.T
+        sum_xx += (logs_x * logs_x) @ mask_y.T
+        sum_y += mask_x @ logs_y.T
+        sum_yy += mask_x @ (logs_y * logs_y).T
+        sum_xy += logs_x @ logs_y.T
+    return count, sum_x, sum_xx, sum_y, sum_yy, sum_xy
+
+
+def correlation_from_sums(count, sum_x, sum_xx, sum_xy):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = count * sum_xy - sum_x * sum_x.T
+        variance_x = count * sum_xx - sum_x * sum_x
+        correlation = covariance / np.sqrt(variance_x * variance_x.T)
+    correlation = np.clip(correlation, -1.0, 1.0)
+    correlation[count < 2] = np.nan
+    return correlation
+
+
+def log_correlation_matrix(matrix, chunk_genes=CHUNK_GENES):
+    """matrix 为条件优先的 (条件数, 基因数) 矩阵，返回 (相关系数矩阵, 每对条件的有效基因数)"""
+    count, sum_x, sum_xx, sum_xy = log_correlation_sums(matrix, chunk_genes)
+    return correlation_from_sums(count, sum_x, sum_xx, sum_xy), count.astype(np.int32)
+
+
+def build_correlation_matrix(mass_fraction_df, version=None):
+    conditions = [col for col in mass_fraction_df.columns if is_condition(col)]
+    return correlation_matrix(mass_fraction_df[conditions].to_numpy().T, conditions, version=version)
+
+
+def correlation_matrix(matrix, conditions, version=None):
+    count, sum_x, sum_xx, sum_xy = log_correlation_sums(matrix)
+    return CorrelationMatrix(conditions, correlation_from_sums(count, sum_x, sum_xx, sum_xy),
+                             count.astype(np.int32), version=version, sums=(sum_x, sum_xx, sum_xy))
+
+
+def update_correlation_matrix(correlations, matrix, conditions, n_genes_old, version=None):
+    """在已有结果上追加条件（矩阵末尾的行）和基因（第 n_genes_old 列之后）
+
+    matrix / conditions 为追加后的完整矩阵，旧的条件和基因保持原有顺序、位于前面。
+    只计算新条件与全部条件之间、以及新基因带来的各项和；没有保存各项和的旧结果返回 None。
+    """
+    n_old, n_all = len(correlations.conditions), len(conditions)
+    if correlations.sums is None or list(conditions[:n_old]) != correlations.conditions:
+        return None
+    count = np.zeros((n_all, n_all))
+    sum_x, sum_xx, sum_xy = (np.zeros((n_all, n_all)) for _ in range(3))
+    count[:n_old, :n_old] = correlations.counts
+    for total, old in zip((sum_x, sum_xx, sum_xy), correlations.sums):
+        total[:n_old, :n_old] = old
+
+    if n_all > n_old:
+        # 新条件 x 全部条件（只在旧基因上），再按对称关系填入对应的列
+        old_genes = matrix[:, :n_genes_old]
+        c, x, xx, y, yy, xy = cross_correlation_sums(old_genes[n_old:], old_genes)
+        count[n_old:], sum_x[n_old:], sum_xx[n_old:], sum_xy[n_old:] = c, x, xx, xy
+        count[:, n_old:], sum_x[:, n_old:], sum_xx[:, n_old:], sum_xy[:, n_old:] = c.T, y.T, yy.T, xy.T
+
+    if matrix.shape[1] > n_genes_old:
+        # 各项和对基因可加：新基因的贡献直接累加
+        for total, added in zip((count, sum_x, sum_xx, sum_xy), log_correlation_sums(matrix[:, n_genes_old:])):
+            total += added
+
+    return CorrelationMatrix(conditions, correlation_from_sums(count, sum_x, sum_xx, sum_xy),
+                             count.astype(np.int32), version=version, sums=(sum_x, sum_xx, sum_xy))
+
+
+def load_correlation_matrix(store_dir=STORE_DIR):
+    """读取离线计算结果；不存在或与矩阵存储版本不一致时返回 None"""
+    store_dir = active_store(store_dir)
+    path = os.path.join(store_dir, CORRELATION_FILE)
+    if not os.path.exists(path):
+        return None
+    correlations = CorrelationMatrix.load(path)
+    if correlations.version != store_version(store_dir):
+        return None
+    return correlations
+
+
+def cluster_order(values):
+    """层次聚类（平均连接，距离 1 - r）得到的叶节点顺序，用于聚类热图"""
+    from scipy.cluster.hierarchy import leaves_list, linkage
+    from scipy.spatial.distance import squareform
+
+    distance = 1.0 - np.nan_to_num(values, nan=0.0)
+    distance = (distance + distance.T) / 2
+    np.fill_diagonal(distance, 0.0)
+    return leaves_list(linkage(squareform(np.clip(distance, 0, None), checks=False), method='average'))
+
+
+if __name__ == "__main__":
+    store_dir = active_store(sys.argv[1] if len(sys.argv) > 1 else STORE_DIR)
+    matrix, _, conditions = open_matrix('mass_fraction_combine', store_dir)
+    correlations = correlation_matrix(matrix, conditions, version=store_version(store_dir))
+    correlations.save(os.path.join(store_dir, CORRELATION_FILE))
+    print(f"{len(conditions)} x {len(conditions)} correlation matrix written to "
+          f"{os.path.join(store_dir, CORRELATION_FILE)}")
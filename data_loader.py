@@ -0,0 +1,150 @@
+"""按需读取数据：只取页面需要的表、行和列
+
+有与数据库版本一致的矩阵存储时从内存映射矩阵中切片，否则通过只读连接池查询，
+并把列投影 / 行筛选放进 SQL。单条件图只读取一列，而不是全部 275 列；结果表按页读取
+（load_page），排序、分页和列投影都在这里完成，页面只序列化可见的行和列。
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+from db import DB_PATH, get_pool
+from matrix_store import (ANNOTATION_TABLE, MATRIX_TABLES, STORE_DIR, is_condition, load_annotation,
+                          open_matrix, store_is_current)
+from metrics import span, timed
+
+PAGE_SIZE = 50
+
+
+def _use_store(db_path, store_dir):
+    return store_is_current(db_path, store_dir)
+
+
+def _read_sql(db_path, sql, params=()):
+    with span('db_read'), get_pool(db_path).connection() as conn:
+        return pd.read_sql(sql, conn, params=params)
+
+
+def load_labels(table, db_path=DB_PATH, store_dir=STORE_DIR):
+    """行标签列表（基因或细胞器），顺序与表中行顺序一致"""
+    if _use_store(db_path, store_dir):
+        return open_matrix(table, store_dir)[1]
+    label = MATRIX_TABLES[table]
+    return _read_sql(db_path, f'SELECT "{label}" FROM "{table}" ORDER BY rowid')[label].tolist()
+
+
+def load_conditions(table, db_path=DB_PATH, store_dir=STORE_DIR):
+    if _use_store(db_path, store_dir):
+        return open_matrix(table, store_dir)[2]
+    with get_pool(db_path).connection() as conn:
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+    return [col for col in columns if is_condition(col)]
+
+
+@timed('data')
+def load_columns(table, columns, db_path=DB_PATH, store_dir=STORE_DIR):
+    """行标签 + 指定条件列；不存在的列被忽略（由调用方给出提示）"""
+    label = MATRIX_TABLES[table]
+    columns = list(dict.fromkeys(columns))  # 两个条件相同时只读一次
+    if _use_store(db_path, store_dir):
+        matrix, rows, conditions = open_matrix(table, store_dir)
+        positions = {c: j for j, c in enumerate(conditions)}
+        data = {label: rows}
+        data.update({col: matrix[positions[col]] for col in columns if col in positions})
+        return pd.DataFrame(data)
+    available = set(load_conditions(table, db_path, store_dir))
+    select = ', '.join(f'"{col}"' for col in [label] + [c for c in columns if c in available])
+    return _read_sql(db_path, f'SELECT {select} FROM "{table}" ORDER BY rowid')
+
+
+@timed('data')
+def load_rows(table, positions, db_path=DB_PATH, store_dir=STORE_DIR):
+    """按行号取整行（全部条件列），顺序与 positions 一致"""
+    positions = np.asarray(positions, dtype=np.int64)
+    label = MATRIX_TABLES[table]
+    if _use_store(db_path, store_dir):
+        matrix, rows, conditions = open_matrix(table, store_dir)
+        df = pd.DataFrame(np.asarray(matrix[:, positions]).T, columns=conditions)
+        df.insert(0, label, [rows[i] for i in positions])
+        return df
+    # 行号 -> rowid（rowid 不一定连续），再按 rowid 取行
+    rowids = _read_sql(db_path, f'SELECT rowid AS _row FROM "{table}" ORDER BY rowid')['_row'].to_numpy()[positions]
+    df = _read_sql(db_path, f'SELECT rowid AS _row, * FROM "{table}" WHERE rowid IN '
+                            f'(SELECT value FROM json_each(?))', (json.dumps(rowids.tolist()),))
+    return df.set_index('_row').reindex(rowids).reset_index(drop=True)
+
+
+def sort_order(keys, ascending=True):
+    """稳定排序的下标；数值中的 NaN 无论升降序都排在最后"""
+    keys = np.asarray(keys)
+    if keys.dtype.kind == 'f':
+        return np.argsort(keys if ascending else -keys, kind='stable')
+    order = np.argsort(keys, kind='stable')
+    return order if ascending else order[::-1]
+
+
+@timed('data')
+def load_page(table, positions=None, columns=None, sort_by=None, ascending=True, page=0, page_size=PAGE_SIZE,
+              db_path=DB_PATH, store_dir=STORE_DIR):
+    """positions 中的行（默认全部行，保持给定顺序）按 sort_by 排序后的第 page 页（从 0 开始）
+
+    只读取行标签和 columns 列（默认全部条件列，不存在的列忽略）；sort_by 可以是行标签列或任一条件列，
+    不必在 columns 中。page_size 为 None 时返回全部行。返回 (df, 总行数)。
+    """
+    label = MATRIX_TABLES[table]
+    conditions = load_conditions(table, db_path, store_dir)
+    available = set(conditions)
+    columns = conditions if columns is None else [c for c in dict.fromkeys(columns) if c in available]
+    if sort_by is not None and sort_by != label and sort_by not in available:
+        sort_by = None
+    start, stop = (0, None) if page_size is None else (page * page_size, (page + 1) * page_size)
+
+    if _use_store(db_path, store_dir):
+        matrix, rows, all_conditions = open_matrix(table, store_dir)
+        positions = np.arange(len(rows)) if positions is None else np.asarray(positions, dtype=np.int64)
+        condition_pos = {c: j for j, c in enumerate(all_conditions)}
+        if sort_by == label:
+            positions = positions[sort_order(np.array(rows, dtype=object)[positions].astype(str), ascending)]
+        elif sort_by is not None:
+            # 排序只需读取一个条件在这些行上的值
+            positions = positions[sort_order(np.asarray(matrix[condition_pos[sort_by], positions],
+                                                        dtype=np.float64), ascending)]
+        visible = positions[start:stop]
+        block = np.asarray(matrix[np.ix_([condition_pos[c] for c in columns], visible)])
+        df = pd.DataFrame(block.T, columns=columns)
+        df.insert(0, label, [rows[i] for i in visible])
+        return df, len(positions)
+
+    rowids = _read_sql(db_path, f'SELECT rowid AS _row FROM "{table}" ORDER BY rowid')['_row'].to_numpy()
+    if positions is not None:
+        rowids = rowids[np.asarray(positions, dtype=np.int64)]
+    select = ', '.join(f'"{col}"' for col in [label] + columns)
+    if sort_by is None:
+        visible = rowids[start:stop]
+        df = _read_sql(db_path, f'SELECT rowid AS _row, {select} FROM "{table}" WHERE rowid IN '
+                                f'(SELECT value FROM json_each(?))', (json.dumps(visible.tolist()),))
+        return df.set_index('_row').reindex(visible).reset_index(drop=True), len(rowids)
+    direction = 'ASC' if ascending else 'DESC'
+    df = _read_sql(db_path, f'SELECT {select} FROM "{table}" WHERE rowid IN (SELECT value FROM json_each(?)) '
+                            f'ORDER BY "{sort_by}" IS NULL, "{sort_by}" {direction}, rowid LIMIT ? OFFSET ?',
+                   (json.dumps(rowids.tolist()), -1 if page_size is None else page_size, start))
+    return df, len(rowids)
+
+
+def page_frame(df, sort_by=None, ascending=True, page=0, page_size=PAGE_SIZE):
+    """已在内存中的表（如元数据表）按同样的规则排序、分页"""
+    if sort_by is not None and sort_by in df.columns:
+        values = df[sort_by]
+        keys = values.to_numpy(dtype=np.float64) if pd.api.types.is_numeric_dtype(values) \
+            else values.astype(str).to_numpy()
+        df = df.iloc[sort_order(keys, ascending)]
+    if page_size is not None:
+        df = df.iloc[page * page_size:(page + 1) * page_size]
+    return df
+
+
+def load_compartment_annotation(db_path=DB_PATH, store_dir=STORE_DIR):
+    if _use_store(db_path, store_dir):
+        return load_annotation(store_dir)
+    return _read_sql(db_path, f'SELECT * FROM "{ANNOTATION_TABLE}"')
@@ -0,0 +1,282 @@
+"""数据下载服务：与 Streamlit 应用并行运行，提供流式、可断点续传的文件下载和按表导出
+
+    python data_server.py [--host 0.0.0.0] [--port 8502]
+
+接口:
+    GET/HEAD /download/protein_database.rar          分块读取磁盘文件，支持 Range / If-Range / ETag
+    GET      /export/<table>.<csv|parquet|arrow>     逐批从 SQLite 读取并以 chunked 编码发送
+             ?columns=gene,P1,P2                    只导出指定列
+    GET      /slice/<table>.<csv|parquet|arrow>      行 x 条件切片，只 SELECT 所需的列
+             ?genes=YAL001C,YAL002W                 基因（或细胞器）列表
+             &pattern=YAL                           模糊匹配
+             &conditions=P1,P2                      条件编号
+             &meta.medium=YPD,SC&meta.growth_rate=0.1:0.3   按 physiology_collection 筛选条件
+    POST     /slice/<table>.<fmt>                   同上，参数放在 JSON 请求体中:
+             {"genes": [...], "pattern": "...", "conditions": [...],
+              "metadata": {"medium": ["YPD"], "growth_rate": [0.1, 0.3]}}
+"""
+import argparse
+import email.utils
+import json
+import os
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from export import EXPORT_FORMATS, ExportError, iter_export, iter_slice
+from db import DB_PATH, get_pool
+
+RAR_PATH = "protein_database.rar"
+DOWNLOAD_FILES = {os.path.basename(RAR_PATH): RAR_PATH}
+READ_CHUNK = 256 * 1024
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+METADATA_PREFIX = "meta."
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+
+def file_etag(stat):
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """解析单个字节区间，返回 (start, end)（含 end）；格式不支持时返回 None，越界时抛出 ValueError"""
+    match = RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N 表示最后 N 个字节
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _split_list(values):
+    return [item.strip() for value in values for item in value.split(",") if item.strip()]
+
+
+def _metadata_filter(value):
+    """"lo:hi" 表示数值区间（端点可省略），否则为逗号分隔的取值列表"""
+    if ":" in value:
+        low, high = value.split(":", 1)
+        try:
+            return (float(low) if low else None, float(high) if high else None)
+        except ValueError:
+            pass
+    return _split_list([value])
+
+
+def slice_params_from_query(query):
+    return {
+        'genes': _split_list(query["genes"]) if "genes" in query else None,
+        'pattern': query.get("pattern", [None])[0],
+        'conditions': _split_list(query.get("conditions", [])) or None,
+        'metadata_filters': {key[len(METADATA_PREFIX):]: _metadata_filter(values[0])
+                             for key, values in query.items() if key.startswith(METADATA_PREFIX)} or None,
+    }
+
+
+def _string_list(body, key):
+    """JSON 中的标签列表：必须是字符串列表（或省略）"""
+    value = body.get(key)
+    if value is None:
+        return None
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise ExportError(f"'{key}' must be a list of strings")
+    return value
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def slice_params_from_json(body):
+    """校验 JSON 请求体并转换为 iter_slice 的参数；类型不对时抛出 ExportError"""
+    if not isinstance(body, dict):
+        raise ExportError("JSON body must be an object")
+    pattern = body.get("pattern")
+    if pattern is not None and not isinstance(pattern, str):
+        raise ExportError("'pattern' must be a string")
+    wanted_metadata = body.get("metadata")
+    wanted_metadata = {} if wanted_metadata is None else wanted_metadata
+    if not isinstance(wanted_metadata, dict):
+        raise ExportError("'metadata' must be an object")
+    metadata = {}
+    for column, wanted in wanted_metadata.items():
+        # 两个数字（或 null）组成的列表视为区间，其余为取值列表；单个取值可以不写成列表
+        if (isinstance(wanted, list) and len(wanted) == 2 and all(v is None or _is_number(v) for v in wanted)
+                and any(_is_number(v) for v in wanted)):
+            metadata[column] = tuple(wanted)
+            continue
+        values = wanted if isinstance(wanted, list) else [wanted]
+        if not values or not all(isinstance(v, str) or _is_number(v) for v in values):
+            raise ExportError(f"metadata '{column}' must be a list of values or a [low, high] range")
+        metadata[column] = [str(v) for v in values]
+    return {
+        'genes': _string_list(body, "genes"),
+        'pattern': pattern,
+        'conditions': _string_list(body, "conditions"),
+        'metadata_filters': metadata or None,
+    }
+
+
+class DataRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    db_path = DB_PATH
+
+    def do_HEAD(self):
+        self.do_GET(send_body=False)
+
+    def do_GET(self, send_body=True):
+        path = unquote(urlparse(self.path).path)
+        if path.startswith("/download/"):
+            self.send_file(path[len("/download/"):], send_body)
+        elif path.startswith("/export/"):
+            self.send_export(path[len("/export/"):], send_body)
+        elif path.startswith("/slice/"):
+            params = slice_params_from_query(parse_qs(urlparse(self.path).query))
+            self.send_slice(path[len("/slice/"):], params, send_body)
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        path = unquote(urlparse(self.path).path)
+        if not path.startswith("/slice/"):
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_error(400, "Invalid Content-Length")
+            return
+        if length > MAX_BODY_BYTES:
+            self.send_error(413)
+            return
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_error(400, "Invalid JSON body")
+            return
+        try:
+            params = slice_params_from_json(body)
+        except ExportError as e:
+            self.send_error(400, "Bad request", explain=str(e))
+            return
+        self.send_slice(path[len("/slice/"):], params, True)
+
+    def send_file(self, name, send_body):
+        file_path = DOWNLOAD_FILES.get(name)
+        if file_path is None or not os.path.exists(file_path):
+            self.send_error(404, "Not found", explain=f"File not found: {name}")
+            return
+        stat = os.stat(file_path)
+        size = stat.st_size
+        etag = file_etag(stat)
+        last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+
+        if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        byte_range = None
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        # If-Range 与当前版本不一致时忽略 Range，返回完整文件
+        if range_header and (if_range is None or if_range in (etag, last_modified)):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+        start, end = byte_range if byte_range else (0, size - 1)
+        self.send_response(206 if byte_range else 200)
+        if byte_range:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Type", "application/x-rar-compressed")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Content-Disposition", f'attachment; filename="{name}"')
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        self.send_header("Cache-Control", "public, max-age=0, must-revalidate")
+        self.end_headers()
+        if not send_body:
+            return
+
+        with open(file_path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(READ_CHUNK, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    def send_export(self, name, send_body):
+        table, _, fmt = name.rpartition(".")
+        query = parse_qs(urlparse(self.path).query)
+        columns = _split_list(query.get("columns", []))
+        self.send_stream(table, fmt, send_body,
+                         lambda conn: iter_export(conn, table, fmt, columns or None))
+
+    def send_slice(self, name, params, send_body):
+        table, _, fmt = name.rpartition(".")
+        self.send_stream(table, fmt, send_body, lambda conn: iter_slice(conn, table, fmt, **params))
+
+    def send_stream(self, table, fmt, send_body, make_chunks):
+        """参数校验失败返回 400；成功后以 chunked 编码逐块发送"""
+        pool = get_pool(self.db_path)
+        if pool is None:
+            self.send_error(503, "Database not available")
+            return
+        with pool.connection() as conn:
+            try:
+                chunks = make_chunks(conn)
+            except ExportError as e:
+                # 错误信息含用户给出的表名 / 列名，放在响应体中（状态行只能是 latin-1）
+                self.send_error(400, "Bad request", explain=str(e))
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", EXPORT_FORMATS[fmt])
+            self.send_header("Content-Disposition", f'attachment; filename="{table}.{fmt}"')
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            if send_body:
+                for chunk in chunks:
+                    if chunk:
+                        self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming download and export server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+
+    DataRequestHandler.db_path = args.db
+    server = ThreadingHTTPServer((args.host, args.port), DataRequestHandler)
+    print(f"Serving downloads on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""lu_web_v3.db 的只读连接池
+
+所有查询通过 get_pool().connection() 取得连接：连接以 URI mode=ro&immutable=1 打开，
+并设置 mmap_size / cache_size，用完归还池中复用，不再每次查询都重新打开、关闭文件。
+每个连接同一时间只被一个线程使用，多个会话可以并发查询。
+
+immutable=1 表示运行期间数据库文件不会被修改；更新数据时应替换文件并重启服务
+（或使用 ingest.py 的版本快照）。
+
+首次部署时建立索引（需要可写权限）:
+    python db.py [lu_web_v3.db]
+"""
+import os
+import queue
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from urllib.parse import quote
+
+DB_PATH = "lu_web_v3.db"
+POOL_SIZE = 8
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KB = 64 * 1024
+
+INDEXES = {
+    'idx_mass_fraction_gene': ('mass_fraction_combine', 'gene'),
+    'idx_compartment_annotation_compartment': ('compartment_annotation_refine', 'compartment'),
+    'idx_compartment_annotation_gene': ('compartment_annotation_refine', 'gene'),
+    'idx_promass_compartment': ('ProMassRatio_across_compartment_combine', 'compartment'),
+}
+
+
+def connect_readonly(db_path=DB_PATH):
+    uri = f"file:{quote(os.path.abspath(db_path))}?mode=ro&immutable=1"
+    # 连接会在线程间传递（每次只由一个线程持有），因此关闭同线程检查
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, db_path=DB_PATH, size=POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return connect_readonly(self.db_path)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        # 连接数已达上限，等待其他线程归还
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path=DB_PATH):
+    """每个数据库文件一个进程内共享的连接池；文件不存在时返回 None"""
+    if not os.path.exists(db_path):
+        return None
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = _pools[db_path] = ConnectionPool(db_path)
+        return pool
+
+
+def ensure_indexes(db_path=DB_PATH):
+    """为 gene / compartment 列建立索引（只需执行一次）"""
+    conn = sqlite3.connect(db_path)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for name, (table, column) in INDEXES.items():
+            if table in tables:
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ("{column}")')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    ensure_indexes(db_path)
+    print(f"Indexes ensured on {db_path}")
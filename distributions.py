@@ -0,0 +1,225 @@
+"""预计算每个条件 log 质量分数的直方图和核密度估计（KDE）
+
+直方图分箱与 seaborn.histplot 默认相同（numpy 'auto' 规则，按条件各自分箱）。
+KDE 使用 Scott 带宽（与 seaborn / scipy.stats.gaussian_kde 默认一致），在固定的 log 网格上
+先线性分箱，再用 FFT 与高斯核卷积：全部条件一次批量计算，每个条件只存 GRID_POINTS 个密度值。
+绘图时只需这几百个数，不再对几千个基因重新计算密度。增量导入时只重新计算有变化的条件
+（网格仍能覆盖时沿用原网格，见 update_log_distributions）。
+
+离线构建（需先运行 matrix_store.py）:
+    python distributions.py [matrix_store]
+"""
+import os
+import sys
+import warnings
+
+import numpy as np
+
+from matrix_store import STORE_DIR, active_store, is_condition, open_matrix, store_version
+
+DISTRIBUTION_FILE = "distributions.npz"
+GRID_POINTS = 256
+
+
+class LogDistributions:
+    def __init__(self, conditions, grid, density, counts, edges, offsets, n, low, high, version=None):
+        self.conditions = list(conditions)
+        self.grid = grid          # 所有条件共用的 log 网格
+        self.density = density    # (条件数, GRID_POINTS) 概率密度
+        self.counts = counts      # 直方图计数，按 offsets 拼接
+        self.edges = edges        # 直方图分箱边界，第 i 个条件为 edges[offsets[i] + i: offsets[i + 1] + i + 1]
+        self.offsets = offsets
+        self.n = n                # 有限 log 值的基因数
+        self.low = low
+        self.high = high
+        self.version = version
+        self._pos = {c: i for i, c in enumerate(self.conditions)}
+
+    def __contains__(self, column):
+        return column in self._pos
+
+    def lookup(self, column):
+        """返回 {'counts', 'edges', 'grid', 'curve', 'n'}
+
+        curve 已换算成计数尺度（密度 x 基因数 x 分箱宽度），并截取到数据范围内，
+        与 seaborn.histplot(kde=True) 画出的曲线一致。
+        """
+        i = self._pos[column]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        counts = self.counts[start:end]
+        edges = self.edges[start + i:end + i + 1]
+        inside = (self.grid >= self.low[i]) & (self.grid <= self.high[i])
+        binwidth = float(np.mean(np.diff(edges))) if len(edges) > 1 else 1.0
+        return {
+            'counts': counts,
+            'edges': edges,
+            'grid': self.grid[inside],
+            'curve': self.density[i, inside] * self.n[i] * binwidth,
+            'n': int(self.n[i]),
+        }
+
+    def save(self, path):
+        np.savez(path, conditions=np.array(self.conditions, dtype=str), grid=self.grid, density=self.density,
+                 counts=self.counts, edges=self.edges, offsets=self.offsets, n=self.n, low=self.low,
+                 high=self.high, version=np.array(self.version or ''))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['conditions'].tolist(), data['grid'], data['density'], data['counts'], data['edges'],
+                       data['offsets'], data['n'], data['low'], data['high'], version=str(data['version']) or None)
+
+
+def kde_support(logs):
+    """每个条件的 (有效数, 最小值, 最大值, Scott 带宽)，不可用的带宽为 NaN"""
+    valid = np.isfinite(logs)
+    n = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        # 有效值少于 2 个的条件 nanstd 会警告，其带宽本就不使用
+        warnings.simplefilter('ignore', RuntimeWarning)
+        low = np.where(valid, logs, np.inf).min(axis=1)
+        high = np.where(valid, logs, -np.inf).max(axis=1)
+        std = np.nanstd(np.where(valid, logs, np.nan), axis=1, ddof=1)
+        bandwidth = std * np.power(n, -0.2)
+    usable = (n > 1) & (bandwidth > 0)
+    return n, low, high, np.where(usable, bandwidth, np.nan)
+
+
+def grid_covers(grid, logs):
+    """grid 两端是否为这些条件留足了 4 倍带宽"""
+    n, low, high, bandwidth = kde_support(logs)
+    pad = 4 * np.nan_to_num(bandwidth)
+    has = n > 0
+    return bool(np.all(low[has] - pad[has] >= grid[0]) and np.all(high[has] + pad[has] <= grid[-1]))
+
+
+def binned_kde(logs, grid_points=GRID_POINTS, grid=None):
+    """logs 为 (条件数, 基因数)，非有限值表示缺失；返回 (网格, 密度, 有效数, 最小值, 最大值)
+
+    所有条件共用一个网格（两端各留 4 倍最大带宽），线性分箱后做 FFT 卷积。
+    给出 grid 时沿用该网格（调用方需先用 grid_covers 确认能覆盖）。
+    """
+    valid = np.isfinite(logs)
+    n, low, high, bandwidth = kde_support(logs)
+    usable = np.isfinite(bandwidth)
+
+    if grid is None:
+        pad = 4 * np.nanmax(bandwidth) if usable.any() else 1.0
+        lo = (low[n > 0].min() if (n > 0).any() else 0.0) - pad
+        hi = (high[n > 0].max() if (n > 0).any() else 0.0) + pad
+        grid = np.linspace(lo, hi, grid_points)
+    else:
+        grid = np.asarray(grid, dtype=np.float64)
+        grid_points, lo = len(grid), grid[0]
+    step = grid[1] - grid[0]
+
+    # 线性分箱：每个值按距离分给相邻的两个网格点
+    size = 2 * grid_points  # 补零，避免循环卷积首尾相接
+    rows, cols = np.nonzero(valid)
+    position = (logs[rows, cols] - lo) / step
+    left = np.clip(np.floor(position).astype(np.int64), 0, grid_points - 2)
+    weight = position - left
+    flat = rows * size + left
+    binned = np.bincount(flat, weights=1 - weight, minlength=len(n) * size)
+    binned += np.bincount(flat + 1, weights=weight, minlength=len(n) * size)
+    binned = binned.reshape(len(n), size)
+
+    # 高斯核的傅里叶变换为 exp(-2 pi^2 h^2 f^2)，每个条件使用自己的带宽
+    frequencies = np.fft.rfftfreq(size, d=step)
+    kernel = np.exp(-2 * (np.pi * frequencies[None, :] * np.nan_to_num(bandwidth)[:, None]) ** 2)
+    smoothed = np.fft.irfft(np.fft.rfft(binned, axis=1) * kernel, n=size, axis=1)[:, :grid_points]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        density = np.clip(smoothed, 0, None) / (n[:, None] * step)
+    density[~usable] = 0.0
+    return grid, density, n, low, high
+
+
+def histogram_bins(logs):
+    """每个条件按 numpy 'auto' 规则分箱，返回拼接后的 (counts, edges, offsets)"""
+    counts, edges, offsets = [], [], [0]
+    for row in logs:
+        values = row[np.isfinite(row)]
+        if len(values) == 0:
+            # 没有有效值的条件：空分段（0 个分箱、1 个边界），绘图时显示 "No data"
+            row_counts, row_edges = np.zeros(0, dtype=np.int64), np.zeros(1)
+        else:
+            row_counts, row_edges = np.histogram(values, bins='auto')
+        counts.append(row_counts)
+        edges.append(row_edges)
+        offsets.append(offsets[-1] + len(row_counts))
+    return (np.concatenate(counts).astype(np.int32), np.concatenate(edges).astype(np.float32),
+            np.array(offsets, dtype=np.int64))
+
+
+def log_distributions(matrix, conditions, version=None, grid=None):
+    """matrix 为条件优先的 (条件数, 基因数) 质量分数矩阵"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = np.log(np.asarray(matrix, dtype=np.float64))
+    grid, density, n, low, high = binned_kde(logs, grid=grid)
+    counts, edges, offsets = histogram_bins(logs)
+    return LogDistributions(conditions, grid.astype(np.float32), density.astype(np.float32), counts, edges,
+                            offsets, n.astype(np.int32), low.astype(np.float32), high.astype(np.float32),
+                            version=version)
+
+
+def update_log_distributions(distributions, matrix, conditions, changed, version=None):
+    """只重新计算 changed 中的条件（新条件，或新增基因后取值有变化的条件），其余沿用已有结果
+
+    matrix / conditions 为完整的条件优先矩阵；原网格不能覆盖变化的条件时全部重新计算。
+    """
+    positions = {c: i for i, c in enumerate(conditions)}
+    changed = [c for c in conditions if c in set(changed) or c not in distributions]
+    if not changed:
+        return LogDistributions(distributions.conditions, distributions.grid, distributions.density,
+                                distributions.counts, distributions.edges, distributions.offsets, distributions.n,
+                                distributions.low, distributions.high, version=version)
+    values = np.asarray(matrix[[positions[c] for c in changed]], dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = np.log(values)
+    if not grid_covers(distributions.grid, logs):
+        return log_distributions(matrix, conditions, version=version)
+    fresh = log_distributions(values, changed, grid=distributions.grid)
+
+    def piece(source, i):
+        start, end = source.offsets[i], source.offsets[i + 1]
+        return (source.counts[start:end], source.edges[start + i:end + i + 1], source.density[i],
+                source.n[i], source.low[i], source.high[i])
+
+    pieces = [piece(fresh, fresh._pos[c]) if c in fresh else piece(distributions, distributions._pos[c])
+              for c in conditions]
+    counts, edges, density, n, low, high = zip(*pieces)
+    offsets = np.concatenate([[0], np.cumsum([len(c) for c in counts])]).astype(np.int64)
+    return LogDistributions(conditions, distributions.grid, np.stack(density), np.concatenate(counts),
+                            np.concatenate(edges), offsets, np.array(n), np.array(low), np.array(high),
+                            version=version)
+
+
+def column_distribution(values, column):
+    """没有预计算结果时，只对单个条件即时计算（与预计算结果使用相同方法）"""
+    return log_distributions(np.asarray(values, dtype=np.float64)[None, :], [column]).lookup(column)
+
+
+def build_log_distributions(mass_fraction_df, version=None):
+    conditions = [col for col in mass_fraction_df.columns if is_condition(col)]
+    return log_distributions(mass_fraction_df[conditions].to_numpy().T, conditions, version=version)
+
+
+def load_log_distributions(store_dir=STORE_DIR):
+    """读取离线计算结果；不存在或与矩阵存储版本不一致时返回 None"""
+    store_dir = active_store(store_dir)
+    path = os.path.join(store_dir, DISTRIBUTION_FILE)
+    if not os.path.exists(path):
+        return None
+    distributions = LogDistributions.load(path)
+    if distributions.version != store_version(store_dir):
+        return None
+    return distributions
+
+
+if __name__ == "__main__":
+    store_dir = active_store(sys.argv[1] if len(sys.argv) > 1 else STORE_DIR)
+    matrix, _, conditions = open_matrix('mass_fraction_combine', store_dir)
+    distributions = log_distributions(matrix, conditions, version=store_version(store_dir))
+    distributions.save(os.path.join(store_dir, DISTRIBUTION_FILE))
+    print(f"Histograms and KDE grids for {len(conditions)} conditions written to "
+          f"{os.path.join(store_dir, DISTRIBUTION_FILE)}")
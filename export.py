@@ -0,0 +1,203 @@
+"""按表导出数据（CSV / Parquet / Arrow），逐块生成字节流，不在内存中缓存整张表
+
+供 data_server.py 的 /export 和 /slice 接口使用，也可以在脚本中直接迭代写文件:
+
+    with open("out.csv", "wb") as f:
+        for chunk in iter_slice(conn, "mass_fraction_combine", "csv", genes=["YAL001C"], conditions=["P1"]):
+            f.write(chunk)
+
+切片导出只 SELECT 所需的条件列，行筛选（基因列表、模糊匹配）在 SQL 中完成。
+"""
+import csv
+import io
+import json
+
+from condition_metadata import filter_conditions, load_condition_metadata
+from matrix_store import MATRIX_TABLES, is_condition
+
+EXPORT_TABLES = [
+    'mass_fraction_combine',
+    'compartment_annotation_refine',
+    'ProMassRatio_across_compartment_combine',
+    'physiology_collection',
+]
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+FETCH_ROWS = 1000
+
+
+class ExportError(ValueError):
+    pass
+
+
+def table_columns(conn, table):
+    """返回 {列名: 声明类型}，保持表中的列顺序"""
+    return {row[1]: row[2] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+
+
+def _select(conn, table, columns, where=None, params=()):
+    if table not in EXPORT_TABLES:
+        raise ExportError(f"Unknown table '{table}'")
+    available = table_columns(conn, table)
+    columns = list(columns) if columns else list(available)
+    missing = [col for col in columns if col not in available]
+    if missing:
+        raise ExportError(f"Unknown columns for {table}: {', '.join(missing)}")
+    select = ', '.join(f'"{col}"' for col in columns)
+    types = [available[col] for col in columns]
+    sql = f'SELECT {select} FROM "{table}"'
+    if where:
+        sql += f' WHERE {where}'
+    return columns, types, conn.execute(sql, params)
+
+
+def iter_csv(columns, cursor):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    while True:
+        rows = cursor.fetchmany(FETCH_ROWS)
+        if not rows:
+            break
+        writer.writerows(rows)
+        yield buf.getvalue().encode('utf-8')
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """pyarrow 写入的字节先放在这里，由生成器逐块取走"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return b''.join(chunks)
+
+
+def _arrow_schema(columns, types):
+    import pyarrow as pa
+
+    # 按 SQLite 声明类型确定 schema，避免每批数据各自推断出不同类型
+    def arrow_type(declared):
+        declared = (declared or '').upper()
+        if 'INT' in declared:
+            return pa.int64()
+        if any(t in declared for t in ('REAL', 'FLOA', 'DOUB')):
+            return pa.float64()
+        return pa.string()
+
+    return pa.schema([(col, arrow_type(t)) for col, t in zip(columns, types)])
+
+
+def iter_parquet(columns, types, cursor):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(columns, types)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema)
+    while True:
+        rows = cursor.fetchmany(FETCH_ROWS)
+        if not rows:
+            break
+        # 每批数据写成一个 row group
+        writer.write_table(pa.table({col: [row[i] for row in rows] for i, col in enumerate(columns)},
+                                    schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def iter_arrow(columns, types, cursor):
+    import pyarrow as pa
+
+    schema = _arrow_schema(columns, types)
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(pa.PythonFile(sink, mode='w'), schema)
+    while True:
+        rows = cursor.fetchmany(FETCH_ROWS)
+        if not rows:
+            break
+        writer.write_batch(pa.record_batch([[row[i] for row in rows] for i in range(len(columns))],
+                                           schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ExportError("Parquet and Arrow export require pyarrow")
+
+
+def iter_export(conn, table, fmt, columns=None, where=None, params=()):
+    """校验参数后返回字节块生成器；参数错误时立即抛出 ExportError"""
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Unsupported format '{fmt}'")
+    if fmt in ('parquet', 'arrow'):
+        _require_pyarrow()
+    columns, types, cursor = _select(conn, table, columns, where, params)
+    if fmt == 'csv':
+        return iter_csv(columns, cursor)
+    if fmt == 'arrow':
+        return iter_arrow(columns, types, cursor)
+    return iter_parquet(columns, types, cursor)
+
+
+def slice_conditions(conn, table, conditions=None, metadata_filters=None):
+    """明确指定的条件与元数据筛选结果取交集；都未指定时返回全部条件"""
+    available = [col for col in table_columns(conn, table) if is_condition(col)]
+    selected = available
+    if conditions:
+        unknown = [c for c in conditions if c not in available]
+        if unknown:
+            raise ExportError(f"Unknown conditions: {', '.join(unknown)}")
+        selected = [c for c in selected if c in set(conditions)]
+    if metadata_filters:
+        try:
+            matched = set(filter_conditions(load_condition_metadata(conn), metadata_filters))
+        except KeyError as e:
+            raise ExportError(f"Unknown metadata column {e}")
+        selected = [c for c in selected if c in matched]
+    return selected
+
+
+def iter_slice(conn, table, fmt, genes=None, pattern=None, conditions=None, metadata_filters=None):
+    """导出 行（基因/细胞器）x 条件 的切片
+
+    genes:            行标签列表（mass_fraction_combine 为基因，ProMassRatio 表为细胞器）
+    pattern:          行标签模糊匹配（不区分大小写的子串）
+    conditions:       条件编号列表
+    metadata_filters: 见 condition_metadata.filter_conditions
+    """
+    if table not in MATRIX_TABLES:
+        raise ExportError(f"Slices are only available for {', '.join(MATRIX_TABLES)}")
+    label = MATRIX_TABLES[table]
+    columns = [label] + slice_conditions(conn, table, conditions, metadata_filters)
+
+    clauses, params = [], []
+    if genes is not None:
+        # 用 json_each 传入任意长度的列表，不受 SQL 参数个数限制
+        clauses.append(f'"{label}" IN (SELECT value FROM json_each(?))')
+        params.append(json.dumps(list(genes)))
+    if pattern:
+        escaped = pattern.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        clauses.append(f'"{label}" LIKE ? ESCAPE \'\\\'')
+        params.append(f'%{escaped}%')
+    return iter_export(conn, table, fmt, columns, ' AND '.join(clauses) or None, params)
@@ -0,0 +1,117 @@
+"""渲染结果缓存：按 (绘图函数, 参数) 缓存 PNG/SVG 字节
+
+内存层是按字节数限制容量的 LRU；可选的磁盘层保存在共享目录中，多个工作进程
+（以及离线批量渲染）共用。命中缓存时完全跳过 matplotlib。
+"""
+import hashlib
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import matplotlib.pyplot as plt
+
+from metrics import count, span
+
+FIGURE_CACHE_DIR = "figure_cache"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# 与 st.pyplot 的默认导出参数保持一致
+SAVEFIG_KWARGS = {'bbox_inches': 'tight', 'dpi': 200}
+
+
+def figure_key(func_name, *args, fmt='png'):
+    """生成可读且可作为文件名的缓存键，例如 plot_distribution-P1-3f2a9c1e.png"""
+    readable = '-'.join([func_name] + [re.sub(r'[^A-Za-z0-9_.]+', '_', str(arg)) for arg in args])
+    digest = hashlib.sha1(repr((func_name, args)).encode()).hexdigest()[:8]
+    return f"{readable}-{digest}.{fmt}"
+
+
+def figure_to_bytes(fig, fmt='png'):
+    """导出图片字节并关闭 figure，避免 pyplot 中累积未释放的图"""
+    buf = io.BytesIO()
+    with span('figure_encode', format=fmt):
+        fig.savefig(buf, format=fmt, **SAVEFIG_KWARGS)
+    plt.close(fig)
+    return buf.getvalue()
+
+
+class FigureCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _remember(self, key, data):
+        # 调用方需持有锁
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key))
+        if len(data) > self.max_bytes:
+            return
+        self._entries[key] = data
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                count('figure_cache', result='memory_hit')
+                return data
+        if self.disk_dir:
+            path = os.path.join(self.disk_dir, key)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                data = None
+            if data is not None:
+                with self._lock:
+                    self._remember(key, data)
+                    self.hits += 1
+                count('figure_cache', result='disk_hit')
+                return data
+        with self._lock:
+            self.misses += 1
+        count('figure_cache', result='miss')
+        return None
+
+    def put(self, key, data):
+        with self._lock:
+            self._remember(key, data)
+        if self.disk_dir:
+            # 先写临时文件再原子替换，其他进程不会读到写了一半的文件
+            path = os.path.join(self.disk_dir, key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                # 磁盘层只是加速手段，写入失败时保留内存层即可
+                print(f"Error writing figure cache file {path}: {str(e)}")
+
+    def get_or_render(self, key, build_figure, fmt='png'):
+        """返回缓存的图片字节；未命中时调用 build_figure() 绘图并写入缓存"""
+        data = self.get(key)
+        if data is None:
+            data = figure_to_bytes(build_figure(), fmt)
+            self.put(key, data)
+        return data
+
+    @property
+    def size_bytes(self):
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,123 @@
+"""基因名称检索索引：精确匹配、前缀匹配和子串匹配（n-gram 倒排表）
+
+索引在加载数据后构建一次，之后每次搜索只做字典查找和小集合求交，
+不再对整列执行 str.contains。系统名和标准名（如 YAL001C <-> TFC3）都会被索引，
+命中任一名称即返回对应的行。
+"""
+import os
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+ALIAS_FILE = "gene_aliases.csv"
+
+# 排名：精确 < 前缀 < 子串
+EXACT, PREFIX, SUBSTRING = 0, 1, 2
+MAX_GRAM = 3
+
+
+def load_aliases(path=ALIAS_FILE):
+    """读取别名表（列：gene, alias），返回 {gene: [alias, ...]}；文件不存在时返回空字典"""
+    if not os.path.exists(path):
+        return {}
+    alias_df = pd.read_csv(path, dtype=str).dropna()
+    aliases = {}
+    for gene, alias in zip(alias_df['gene'], alias_df['alias']):
+        aliases.setdefault(gene, []).append(alias)
+    return aliases
+
+
+class GeneSearchIndex:
+    def __init__(self, genes, aliases=None):
+        self.genes = list(genes)
+        aliases = aliases or {}
+
+        # 检索词（大写）-> 行号；一个基因可以有多个检索词（系统名 + 别名）
+        pairs = {}
+        for row, gene in enumerate(self.genes):
+            if not isinstance(gene, str):
+                continue
+            for term in [gene] + list(aliases.get(gene, [])):
+                pairs.setdefault(term.upper(), []).append(row)
+
+        # 检索词按（长度, 字母序）排序，倒排表天然有序，结果无需再排序
+        terms = sorted(pairs, key=lambda t: (len(t), t))
+        self._terms = terms
+        self._exact = {t: i for i, t in enumerate(terms)}
+        pair_term = np.array([i for i, t in enumerate(terms) for _ in pairs[t]], dtype=np.int32)
+        self._pair_row = np.array([row for t in terms for row in pairs[t]], dtype=np.int32)
+        self._pair_start = np.searchsorted(pair_term, np.arange(len(terms) + 1)).astype(np.int32)
+        self._unique_rows = len(np.unique(self._pair_row)) == len(self._pair_row)
+
+        # 前缀匹配：字母序检索词 + 二分查找；_alpha_pos 用于排除已在前缀阶段命中的词
+        alpha = sorted(range(len(terms)), key=lambda i: terms[i])
+        self._alpha = np.array(alpha, dtype=np.int32)
+        self._alpha_terms = [terms[i] for i in alpha]
+        self._alpha_pos = np.empty(len(terms), dtype=np.int32)
+        self._alpha_pos[self._alpha] = np.arange(len(terms), dtype=np.int32)
+
+        # 子串匹配：1~3 字符的 n-gram 倒排表
+        grams = {}
+        for term_id, term in enumerate(terms):
+            seen = set()
+            for n in range(1, MAX_GRAM + 1):
+                for start in range(len(term) - n + 1):
+                    gram = term[start:start + n]
+                    if gram not in seen:
+                        seen.add(gram)
+                        grams.setdefault(gram, []).append(term_id)
+        self._grams = {gram: np.array(ids, dtype=np.int32) for gram, ids in grams.items()}
+
+    def _substring_terms(self, query):
+        empty = np.empty(0, dtype=np.int32)
+        if len(query) <= MAX_GRAM:
+            return self._grams.get(query, empty)
+        # 先用最稀有的 n-gram 缩小候选，再逐个核对
+        postings = [self._grams.get(query[i:i + MAX_GRAM], empty) for i in range(len(query) - MAX_GRAM + 1)]
+        candidates = min(postings, key=len)
+        return np.array([t for t in candidates if query in self._terms[t]], dtype=np.int32)
+
+    def _rows_for_terms(self, term_ids):
+        if len(term_ids) == 0:
+            return np.empty(0, dtype=np.int32)
+        if self._unique_rows and len(self._pair_row) == len(self._terms):
+            return self._pair_row[term_ids]
+        return np.concatenate([self._pair_row[self._pair_start[t]:self._pair_start[t + 1]] for t in term_ids])
+
+    def search_ranked(self, query, limit=None):
+        """返回 (rows, ranks) 两个数组，按精确、前缀、子串排序；同级内较短的检索词在前"""
+        query = query.strip().upper()
+        if not query:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int8)
+
+        exact_id = self._exact.get(query)
+        lo = bisect_left(self._alpha_terms, query)
+        hi = bisect_left(self._alpha_terms, query + '\uffff', lo=lo)
+        prefix_ids = np.sort(self._alpha[lo:hi])
+        if exact_id is not None:
+            prefix_ids = prefix_ids[prefix_ids != exact_id]
+        # 以 query 开头的检索词已在前缀阶段返回
+        substring_ids = self._substring_terms(query)
+        positions = self._alpha_pos[substring_ids]
+        substring_ids = substring_ids[(positions < lo) | (positions >= hi)]
+
+        stages = [(EXACT, np.array([exact_id] if exact_id is not None else [], dtype=np.int32)),
+                  (PREFIX, prefix_ids),
+                  (SUBSTRING, substring_ids)]
+        rows = [self._rows_for_terms(ids) for _, ids in stages]
+        ranks = [np.full(len(r), rank, dtype=np.int8) for (rank, _), r in zip(stages, rows)]
+        rows = np.concatenate(rows)
+        ranks = np.concatenate(ranks)
+        if not self._unique_rows:
+            # 一个基因可能通过多个名称命中，保留排名最高的一次
+            _, first = np.unique(rows, return_index=True)
+            first.sort()
+            rows, ranks = rows[first], ranks[first]
+        if limit is not None:
+            rows, ranks = rows[:limit], ranks[:limit]
+        return rows, ranks
+
+    def search(self, query, limit=None):
+        """返回匹配的行号数组（可直接用于 DataFrame.iloc）"""
+        return self.search_ranked(query, limit)[0]
@@ -0,0 +1,411 @@
+"""增量导入新的条件（列）或基因（行），不重建 lu_web_v3.db
+
+    python ingest.py add [--store matrix_store] [--mass-fraction new_mf.csv] [--promass new_ratio.csv]
+                         [--annotation new_annotation.csv] [--metadata new_conditions.csv]
+    python ingest.py list [--store matrix_store]
+    python ingest.py activate <version> [--store matrix_store]
+
+输入为 CSV：质量分数表列为 gene + P<编号>...，ProMassRatio 表列为 compartment + P<编号>...，
+注释表列为 gene, compartment，元数据表与 physiology_collection 的列相同。可以追加新条件
+（新列，已有基因缺失的值留空），也可以追加新基因（新行）；已有基因在已有条件下的值不能修改，
+修改已有数据需要更新数据库后重新运行 matrix_store.py。
+
+每次导入在 <store>/snapshots/<版本>/ 写入一个新快照，已有快照中的文件从不修改：
+    - 矩阵为条件优先布局，只追加条件时复制原文件并在末尾写入新条件；追加基因时分块重写
+    - 未变化的表以硬链接引用上一个快照
+    - 相关系数、log 分布、累积表在上一个快照的结果上增量更新，只计算变化的部分
+    - 只与单个 / 两个条件有关且数据未变的缓存图片链接到新版本的缓存目录
+快照写完后原子地替换 <store>/CURRENT。运行中的应用每次请求都会解析 CURRENT，
+发现新版本时按新快照加载（内存映射，几乎没有加载开销）；正在处理的请求继续使用旧快照。
+默认保留最近 KEEP_SNAPSHOTS 个快照，可用 activate 切回其中任一版本。
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from compartment_tables import TABLES_FILE, load_cumulative_tables, update_cumulative_tables
+from condition_metadata import condition_id_column
+from correlation import CORRELATION_FILE, correlation_matrix, load_correlation_matrix, update_correlation_matrix
+from distributions import DISTRIBUTION_FILE, load_log_distributions, update_log_distributions
+from figure_cache import FIGURE_CACHE_DIR
+from matrix_store import (ANNOTATION_TABLE, CURRENT_FILE, MANIFEST_FILE, MATRIX_TABLES, METADATA_FILE,
+                          SNAPSHOT_DIR, STORE_DIR, _read_json, _write_json, active_store, is_condition,
+                          open_matrix, read_manifest)
+
+KEEP_SNAPSHOTS = 3
+CHUNK_CONDITIONS = 32
+
+# 缓存图片 -> 所依赖的数据；这些数据没有新增行（且 KDE 网格未变）时，已有条件的图片仍然有效
+FIGURE_DEPENDENCIES = {
+    'plot_cumulative_mass_fraction': ('mass_fraction_combine', ANNOTATION_TABLE),
+    'plot_distribution': ('ProMassRatio_across_compartment_combine',),
+    'plot_scatter': ('ProMassRatio_across_compartment_combine',),
+    'plot_distribution_5': ('mass_fraction_combine', DISTRIBUTION_FILE),
+    'plot_log_scatter_5': ('mass_fraction_combine',),
+    'plot_log_scatter_5_distributions': ('mass_fraction_combine', DISTRIBUTION_FILE),
+}
+
+
+class IngestError(ValueError):
+    pass
+
+
+def _link_or_copy(src, dst):
+    """未变化的文件用硬链接共享（跨文件系统时复制）"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _read_input(data):
+    if data is None or isinstance(data, pd.DataFrame):
+        return data
+    return pd.read_csv(data)
+
+
+def _snapshot_version(parent_version, inputs):
+    digest = hashlib.sha1(f"{parent_version}:{time.time_ns()}".encode())
+    for name, df in inputs.items():
+        if df is not None:
+            digest.update(name.encode())
+            digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def append_matrix(source_dir, target_dir, table, new_df):
+    """把 new_df 中的新条件 / 新行追加到 source_dir 的矩阵，写入 target_dir
+
+    返回 {'conditions': 新条件, 'rows': 新行标签, 'n_conditions': 原条件数, 'n_rows': 原行数}
+    """
+    label = MATRIX_TABLES[table]
+    if label not in new_df.columns:
+        raise IngestError(f"{table}: missing '{label}' column")
+    unknown = [c for c in new_df.columns if c != label and not is_condition(c)]
+    if unknown:
+        raise IngestError(f"{table}: columns are neither '{label}' nor conditions (P<number>): {', '.join(unknown)}")
+    labels = new_df[label].astype(str)
+    if labels.duplicated().any():
+        raise IngestError(f"{table}: duplicated {label} values: {', '.join(labels[labels.duplicated()].unique()[:10])}")
+
+    matrix, rows, conditions = open_matrix(table, source_dir)
+    n_conditions, n_rows = len(conditions), len(rows)
+    row_pos = {r: i for i, r in enumerate(rows)}
+    known_conditions = set(conditions)
+    given = [c for c in new_df.columns if is_condition(c)]
+    new_conditions = [c for c in given if c not in known_conditions]
+    old_given = [c for c in given if c in known_conditions]
+    existing = labels.isin(row_pos).to_numpy()
+    if old_given and existing.any() and new_df.loc[existing, old_given].notna().to_numpy().any():
+        raise IngestError(f"{table}: values for existing {label}s in existing conditions cannot be changed by "
+                          f"ingestion; update the database and rebuild the store instead")
+    new_rows = labels[~existing].tolist()
+    if not new_conditions and not new_rows:
+        raise IngestError(f"{table}: nothing new to append")
+
+    all_rows = rows + new_rows
+    positions = np.array([row_pos.get(r, -1) for r in labels])
+    positions[~existing] = n_rows + np.arange(len(new_rows))
+    values = new_df[given].to_numpy(dtype=np.float32, na_value=np.nan)
+    column_of = {c: k for k, c in enumerate(given)}
+
+    # 新条件的完整一列（已有行中没给出的值为缺失）
+    new_block = np.full((len(new_conditions), len(all_rows)), np.nan, dtype=np.float32)
+    for i, condition in enumerate(new_conditions):
+        new_block[i, positions] = values[:, column_of[condition]]
+
+    source_path = os.path.join(source_dir, f"{table}.f32")
+    target_path = os.path.join(target_dir, f"{table}.f32")
+    if not new_rows:
+        # 条件优先布局：新条件直接接在原文件末尾
+        shutil.copyfile(source_path, target_path)
+        with open(target_path, 'ab') as f:
+            f.write(new_block.tobytes())
+    else:
+        out = np.memmap(target_path, dtype=np.float32, mode='w+', shape=(len(new_conditions) + n_conditions,
+                                                                         max(len(all_rows), 1)))
+        added = ~existing
+        for start in range(0, n_conditions, CHUNK_CONDITIONS):
+            stop = min(start + CHUNK_CONDITIONS, n_conditions)
+            chunk = np.full((stop - start, len(new_rows)), np.nan, dtype=np.float32)
+            for i, condition in enumerate(conditions[start:stop]):
+                if condition in column_of:
+                    chunk[i] = values[added, column_of[condition]]
+            out[start:stop, :n_rows] = matrix[start:stop]
+            out[start:stop, n_rows:len(all_rows)] = chunk
+        out[n_conditions:, :len(all_rows)] = new_block
+        out.flush()
+        del out
+
+    _write_json(os.path.join(target_dir, f"{table}.json"), {
+        'label': label,
+        'rows': all_rows,
+        'conditions': conditions + new_conditions,
+        'dtype': 'float32',
+        'shape': [n_conditions + len(new_conditions), len(all_rows)],
+    })
+    return {'conditions': new_conditions, 'rows': new_rows, 'n_conditions': n_conditions, 'n_rows': n_rows}
+
+
+def _append_annotation(source_dir, target_dir, annotation):
+    """返回新增的 (gene, compartment) 对数"""
+    source_path = os.path.join(source_dir, f"{ANNOTATION_TABLE}.json")
+    target_path = os.path.join(target_dir, f"{ANNOTATION_TABLE}.json")
+    if annotation is None:
+        _link_or_copy(source_path, target_path)
+        return 0
+    missing = {'gene', 'compartment'} - set(annotation.columns)
+    if missing:
+        raise IngestError(f"{ANNOTATION_TABLE}: missing columns {', '.join(sorted(missing))}")
+    current = pd.DataFrame(_read_json(source_path))
+    added = annotation[['gene', 'compartment']].dropna().astype(str).drop_duplicates()
+    added = added.merge(current, how='left', indicator=True)
+    added = added.loc[added['_merge'] == 'left_only', ['gene', 'compartment']]
+    combined = pd.concat([current, added], ignore_index=True)
+    _write_json(target_path, {'gene': combined['gene'].tolist(), 'compartment': combined['compartment'].tolist()})
+    return len(added)
+
+
+def _append_metadata(source_dir, target_dir, metadata, new_conditions):
+    """新增条件的元数据行追加到快照内的 physiology_collection.json（数据库中的表不变）"""
+    source_path = os.path.join(source_dir, METADATA_FILE)
+    target_path = os.path.join(target_dir, METADATA_FILE)
+    if metadata is None:
+        if os.path.exists(source_path):
+            _link_or_copy(source_path, target_path)
+        return 0
+    id_column = condition_id_column(metadata)
+    if id_column is None:
+        raise IngestError("Condition metadata needs a column of condition ids (P<number>)")
+    unknown = sorted(set(metadata[id_column].astype(str)) - set(new_conditions))
+    if unknown:
+        raise IngestError(f"Metadata for conditions that are not being added: {', '.join(unknown[:10])}")
+    current = pd.DataFrame(_read_json(source_path)) if os.path.exists(source_path) else None
+    combined = pd.concat([current, metadata], ignore_index=True) if current is not None else metadata
+    _write_json(target_path, {col: combined[col].where(combined[col].notna(), None).tolist()
+                              for col in combined.columns})
+    return len(metadata)
+
+
+def update_artifacts(source_dir, target_dir, changes, version):
+    """在上一个快照的派生结果上增量更新；上一个快照没有的结果不生成（应用会按需计算）
+
+    返回失效的依赖集合，用于判断哪些缓存图片可以沿用。
+    """
+    matrix, genes, conditions = open_matrix('mass_fraction_combine', target_dir)
+    change = changes.get('mass_fraction_combine')
+    n_genes_old = change['n_rows'] if change else len(genes)
+    n_conditions_old = change['n_conditions'] if change else len(conditions)
+    invalidated = {table for table, c in changes.items() if c.get('rows')}
+
+    correlations = load_correlation_matrix(source_dir)
+    if correlations is not None:
+        updated = update_correlation_matrix(correlations, matrix, conditions, n_genes_old, version=version)
+        if updated is None:
+            updated = correlation_matrix(matrix, conditions, version=version)
+        updated.save(os.path.join(target_dir, CORRELATION_FILE))
+
+    distributions = load_log_distributions(source_dir)
+    if distributions is not None:
+        # 新条件，以及新增基因在其中有取值的已有条件
+        added = np.asarray(matrix[:n_conditions_old, n_genes_old:])
+        touched = [conditions[i] for i in np.flatnonzero((added > 0).any(axis=1))] if added.size else []
+        changed = list(conditions[n_conditions_old:]) + touched
+        updated = update_log_distributions(distributions, matrix, conditions, changed, version=version)
+        if not np.array_equal(updated.grid, distributions.grid):
+            invalidated.add(DISTRIBUTION_FILE)
+        updated.save(os.path.join(target_dir, DISTRIBUTION_FILE))
+    else:
+        invalidated.add(DISTRIBUTION_FILE)
+
+    tables = load_cumulative_tables(source_dir)
+    if tables is not None:
+        annotation = pd.DataFrame(_read_json(os.path.join(target_dir, f"{ANNOTATION_TABLE}.json")))
+        updated = update_cumulative_tables(tables, matrix, conditions, np.asarray(genes, dtype=object), annotation,
+                                           version=version)
+        updated.save(os.path.join(target_dir, TABLES_FILE))
+    return invalidated
+
+
+def carry_figures(figure_cache_dir, old_version, new_version, invalidated):
+    """把依赖数据未变化的缓存图片链接到新版本的目录，返回链接的文件数"""
+    old_dir = os.path.join(figure_cache_dir, old_version)
+    if not os.path.isdir(old_dir):
+        return 0
+    new_dir = os.path.join(figure_cache_dir, new_version)
+    os.makedirs(new_dir, exist_ok=True)
+    carried = 0
+    for name in os.listdir(old_dir):
+        dependencies = FIGURE_DEPENDENCIES.get(name.split('-', 1)[0])
+        if name.endswith('.tmp') or dependencies is None or invalidated & set(dependencies):
+            continue
+        target = os.path.join(new_dir, name)
+        if not os.path.exists(target):
+            _link_or_copy(os.path.join(old_dir, name), target)
+            carried += 1
+    return carried
+
+
+def set_current(store_dir, version):
+    """原子地切换当前快照；version 为 None 时回到 store_dir 本身的（完整构建的）存储"""
+    path = os.path.join(store_dir, CURRENT_FILE)
+    if version is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+
+
+def list_snapshots(store_dir=STORE_DIR):
+    """按创建时间排序的快照 manifest 列表（不含 store_dir 本身的完整构建）"""
+    root = os.path.join(store_dir, SNAPSHOT_DIR)
+    if not os.path.isdir(root):
+        return []
+    manifests = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name, MANIFEST_FILE)
+        if os.path.exists(path):
+            manifests.append(_read_json(path))
+    return sorted(manifests, key=lambda m: m.get('created', 0))
+
+
+def prune_snapshots(store_dir=STORE_DIR, keep=KEEP_SNAPSHOTS, figure_cache_dir=FIGURE_CACHE_DIR):
+    """删除较旧的快照（当前快照总是保留）；已映射旧文件的进程不受影响"""
+    current = read_manifest(store_dir)['version']
+    snapshots = list_snapshots(store_dir)
+    removed = []
+    for manifest in snapshots[:max(len(snapshots) - keep, 0)]:
+        version = manifest['version']
+        if version == current:
+            continue
+        shutil.rmtree(os.path.join(store_dir, SNAPSHOT_DIR, version), ignore_errors=True)
+        if figure_cache_dir:
+            shutil.rmtree(os.path.join(figure_cache_dir, version), ignore_errors=True)
+        removed.append(version)
+    return removed
+
+
+def ingest(store_dir=STORE_DIR, mass_fraction=None, promass=None, annotation=None, metadata=None,
+           figure_cache_dir=FIGURE_CACHE_DIR, keep=KEEP_SNAPSHOTS):
+    """写入新快照并设为当前版本，返回新快照的 manifest"""
+    parent = read_manifest(store_dir)
+    if parent is None:
+        raise IngestError(f"No matrix store in {store_dir}; run matrix_store.py first")
+    inputs = {
+        'mass_fraction_combine': _read_input(mass_fraction),
+        'ProMassRatio_across_compartment_combine': _read_input(promass),
+        ANNOTATION_TABLE: _read_input(annotation),
+        METADATA_FILE: _read_input(metadata),
+    }
+    if all(df is None for df in inputs.values()):
+        raise IngestError("Nothing to ingest")
+
+    source_dir = active_store(store_dir)
+    version = _snapshot_version(parent['version'], inputs)
+    target_dir = os.path.join(store_dir, SNAPSHOT_DIR, version)
+    tmp_dir = target_dir + ".tmp"
+    os.makedirs(tmp_dir)
+    try:
+        changes = {}
+        for table in MATRIX_TABLES:
+            if inputs[table] is None:
+                for ext in ('f32', 'json'):
+                    _link_or_copy(os.path.join(source_dir, f"{table}.{ext}"), os.path.join(tmp_dir, f"{table}.{ext}"))
+            else:
+                changes[table] = append_matrix(source_dir, tmp_dir, table, inputs[table])
+        added_annotations = _append_annotation(source_dir, tmp_dir, inputs[ANNOTATION_TABLE])
+        if added_annotations:
+            changes[ANNOTATION_TABLE] = {'rows': added_annotations}
+        new_conditions = {c for table in MATRIX_TABLES for c in changes.get(table, {}).get('conditions', [])}
+        added_metadata = _append_metadata(source_dir, tmp_dir, inputs[METADATA_FILE], new_conditions)
+
+        invalidated = update_artifacts(source_dir, tmp_dir, changes, version)
+        manifest = {
+            'version': version,
+            'source': parent.get('source', parent['version']),
+            'parent': parent['version'],
+            'tables': list(MATRIX_TABLES),
+            'created': time.time(),
+            'changes': {
+                table: {'conditions': change.get('conditions', []), 'rows': len(change['rows'])}
+                if isinstance(change.get('rows'), list) else change
+                for table, change in changes.items()
+            },
+            'metadata_rows': added_metadata,
+        }
+        # manifest 最后写入，存在即表示快照完整
+        _write_json(os.path.join(tmp_dir, MANIFEST_FILE), manifest)
+        os.rename(tmp_dir, target_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    if figure_cache_dir:
+        manifest['figures_carried'] = carry_figures(figure_cache_dir, parent['version'], version, invalidated)
+    set_current(store_dir, version)
+    prune_snapshots(store_dir, keep, figure_cache_dir)
+    return manifest
+
+
+def activate(store_dir, version):
+    """切换到已有快照；version 为完整构建的版本时回到 store_dir 本身"""
+    base = os.path.join(store_dir, MANIFEST_FILE)
+    if os.path.exists(base) and _read_json(base)['version'] == version:
+        set_current(store_dir, None)
+        return
+    if not os.path.exists(os.path.join(store_dir, SNAPSHOT_DIR, version, MANIFEST_FILE)):
+        raise IngestError(f"No snapshot {version} in {store_dir}")
+    set_current(store_dir, version)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Append conditions or genes to the matrix store as a new snapshot")
+    parser.add_argument("--store", default=STORE_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="ingest new data as a new snapshot and make it current")
+    add.add_argument("--mass-fraction", help="CSV with gene + P<number> columns")
+    add.add_argument("--promass", help="CSV with compartment + P<number> columns")
+    add.add_argument("--annotation", help="CSV with gene, compartment columns")
+    add.add_argument("--metadata", help="CSV with physiology_collection rows for the new conditions")
+    add.add_argument("--figure-cache", default=FIGURE_CACHE_DIR)
+    add.add_argument("--keep", type=int, default=KEEP_SNAPSHOTS)
+    commands.add_parser("list", help="list snapshots")
+    switch = commands.add_parser("activate", help="make an existing snapshot current")
+    switch.add_argument("version")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "add":
+            start = time.perf_counter()
+            manifest = ingest(args.store, args.mass_fraction, args.promass, args.annotation, args.metadata,
+                              figure_cache_dir=args.figure_cache, keep=args.keep)
+            print(f"Snapshot {manifest['version']} is now current ({time.perf_counter() - start:.1f}s)")
+            for table, change in manifest['changes'].items():
+                print(f"  {table}: {change}")
+            print(f"  cached figures carried over: {manifest.get('figures_carried', 0)}")
+        elif args.command == "list":
+            current = read_manifest(args.store)
+            for manifest in list_snapshots(args.store):
+                marker = "*" if current and manifest['version'] == current['version'] else " "
+                created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(manifest.get('created', 0)))
+                print(f"{marker} {manifest['version']}  {created}  parent {manifest.get('parent')}  "
+                      f"{manifest.get('changes', {})}")
+        else:
+            activate(args.store, args.version)
+            print(f"Snapshot {args.version} is now current")
+    except IngestError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""交互式 WebGL 散点图（plotly Scattergl），在浏览器端渲染
+
+坐标以 float32 数组传给 plotly，plotly 6 起序列化为二进制（base64 类型数组）而不是逐个数字的 JSON；
+鼠标悬停显示基因名，无需重新运行脚本。叠加多个条件时可按密度抽稀（见 analysis.density_downsample），
+稀疏区域和离群点全部保留。
+"""
+import numpy as np
+import plotly.graph_objects as go
+
+from analysis import density_downsample, log_pair_rows
+
+MARKER_SIZE = 4
+MARKER_OPACITY = 0.6
+
+
+def log_scatter_trace(df, column1, column2, max_points=None, label='gene'):
+    rows, x, y = log_pair_rows(df, column1, column2)
+    if max_points is not None:
+        keep = density_downsample(x, y, max_points)
+        rows, x, y = rows[keep], x[keep], y[keep]
+    return go.Scattergl(
+        x=x.astype(np.float32),
+        y=y.astype(np.float32),
+        mode='markers',
+        name=column2,
+        text=df[label].to_numpy()[rows],
+        hovertemplate=f'%{{text}}<br>Log({column1}) = %{{x:.3f}}<br>Log({column2}) = %{{y:.3f}}<extra></extra>',
+        marker=dict(size=MARKER_SIZE, opacity=MARKER_OPACITY),
+    )
+
+
+def log_scatter_figure(df, column1, column2, overlay=(), correlation=None, max_points=None):
+    """column1 为横轴；column2 及 overlay 中的条件各为一条曲线（同一横轴）"""
+    columns = list(dict.fromkeys([column2, *overlay]))
+    fig = go.Figure([log_scatter_trace(df, column1, column, max_points) for column in columns])
+    title = f'{column1} vs {column2} Log Scatter Plot' if len(columns) == 1 else f'Conditions vs {column1} (log)'
+    fig.update_layout(
+        title=title,
+        xaxis_title=f'Log({column1})',
+        yaxis_title=f'Log({column2})' if len(columns) == 1 else 'Log(mass fraction)',
+        showlegend=len(columns) > 1,
+        hovermode='closest',
+    )
+    if correlation is not None and len(columns) == 1:
+        fig.add_annotation(x=0.01, y=0.99, xref='paper', yref='paper', xanchor='left', yanchor='top',
+                           text=f'Correlation: {correlation:.3f}', showarrow=False,
+                           bgcolor='rgba(255,255,255,0.5)', bordercolor='gray')
+    return fig
@@ -0,0 +1,95 @@
+"""散点图标签的确定性放置：基于占用网格的碰撞检测，代替迭代式的 adjustText
+
+标签按优先级依次放置：在点周围 8 个方向、由近到远的候选位置中取第一个不与已放置的标签、
+数据点重叠且不超出绘图区的位置；放不下的标签被跳过。所有计算在像素坐标中进行，
+文字大小按字号估算，不需要先渲染图像，同样的输入总是得到同样的布局。
+"""
+import numpy as np
+
+MAX_LABELS = 40
+CHAR_WIDTH = 0.6      # 字符宽度 / 字号（等宽近似）
+LINE_HEIGHT = 1.2
+MARKER_PX = 6
+RINGS = 6
+
+# (dx, dy) 方向：右、左、上、下、右上、左上、右下、左下
+DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1)]
+
+
+def text_size(labels, fontsize, dpi):
+    """估算每个标签的 (宽, 高) 像素"""
+    scale = fontsize * dpi / 72
+    lengths = np.array([len(str(label)) for label in labels], dtype=np.float64)
+    return np.column_stack([lengths * CHAR_WIDTH * scale, np.full(len(lengths), LINE_HEIGHT * scale)])
+
+
+class OccupancyGrid:
+    def __init__(self, bounds, cell):
+        self.x0, self.y0, self.x1, self.y1 = bounds
+        self.cell = cell
+        self.cells = np.zeros((int(np.ceil((self.y1 - self.y0) / cell)) + 1,
+                               int(np.ceil((self.x1 - self.x0) / cell)) + 1), dtype=bool)
+
+    def _slice(self, left, bottom, width, height):
+        c0 = int((left - self.x0) // self.cell)
+        c1 = int(np.ceil((left + width - self.x0) / self.cell))
+        r0 = int((bottom - self.y0) // self.cell)
+        r1 = int(np.ceil((bottom + height - self.y0) / self.cell))
+        return slice(max(r0, 0), max(r1, 0)), slice(max(c0, 0), max(c1, 0))
+
+    def inside(self, left, bottom, width, height):
+        return (left >= self.x0 and bottom >= self.y0
+                and left + width <= self.x1 and bottom + height <= self.y1)
+
+    def free(self, left, bottom, width, height):
+        return not self.cells[self._slice(left, bottom, width, height)].any()
+
+    def mark(self, left, bottom, width, height):
+        self.cells[self._slice(left, bottom, width, height)] = True
+
+    def mark_points(self, points, size):
+        """批量标记以各点为中心、边长 size 的方块"""
+        half = size / 2
+        rows, cols = self.cells.shape
+        steps = np.arange(int(np.ceil(size / self.cell)) + 1)
+        c0 = np.floor((points[:, 0] - half - self.x0) / self.cell).astype(np.int64)
+        r0 = np.floor((points[:, 1] - half - self.y0) / self.cell).astype(np.int64)
+        r = (r0[:, None, None] + steps[None, :, None]).repeat(len(steps), axis=2).ravel()
+        c = (c0[:, None, None] + steps[None, None, :]).repeat(len(steps), axis=1).ravel()
+        keep = (r >= 0) & (r < rows) & (c >= 0) & (c < cols)
+        self.cells[r[keep], c[keep]] = True
+
+
+def place_labels(points, sizes, bounds, obstacles=None, marker=MARKER_PX, rings=RINGS):
+    """points / sizes 为 (n, 2) 像素坐标和标签宽高，按顺序（优先级从高到低）放置
+
+    obstacles: 其他需要避开的数据点像素坐标（默认只避开 points 本身）
+    返回 (n, 2) 标签左下角像素坐标，放不下的为 NaN。
+    """
+    points = np.asarray(points, dtype=np.float64)
+    sizes = np.asarray(sizes, dtype=np.float64)
+    result = np.full(points.shape, np.nan)
+    if len(points) == 0:
+        return result
+    cell = max(2.0, float(sizes[:, 1].min()) / 3)
+    grid = OccupancyGrid(bounds, cell)
+
+    markers = points if obstacles is None else np.vstack([points, np.asarray(obstacles, dtype=np.float64)])
+    grid.mark_points(markers[np.isfinite(markers).all(axis=1)], marker)
+
+    gap = marker / 2 + 2
+    for i, ((x, y), (w, h)) in enumerate(zip(points, sizes)):
+        placed = False
+        for ring in range(rings):
+            d = gap + ring * h
+            for dx, dy in DIRECTIONS:
+                left = x + d if dx > 0 else x - d - w if dx < 0 else x - w / 2
+                bottom = y + d if dy > 0 else y - d - h if dy < 0 else y - h / 2
+                if grid.inside(left, bottom, w, h) and grid.free(left, bottom, w, h):
+                    grid.mark(left, bottom, w, h)
+                    result[i] = left, bottom
+                    placed = True
+                    break
+            if placed:
+                break
+    return result
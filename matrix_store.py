@@ -0,0 +1,231 @@
+"""条件矩阵的列式存储：把 SQLite 宽表转换成 float32 内存映射矩阵
+
+构建（离线执行一次）:
+    python matrix_store.py [lu_web_v3.db] [matrix_store]
+
+矩阵按“条件优先”的顺序写盘（形状为 条件数 x 行数），读取单个条件列时只会触及
+一段连续的页面；所有 Streamlit 工作进程通过 np.memmap 共享同一份页缓存。
+
+增量导入（ingest.py）不修改已有文件，而是在 snapshots/<版本>/ 下写入新的完整快照，
+再原子地替换 CURRENT 指针；读取时先经 active_store 解析到当前快照。
+"""
+import functools
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+
+import numpy as np
+import pandas as pd
+
+from db import DB_PATH, get_pool
+
+STORE_DIR = "matrix_store"
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+SNAPSHOT_DIR = "snapshots"
+METADATA_FILE = "physiology_collection.json"
+
+CONDITION_PATTERN = re.compile(r'^P\d+$')
+
+# 宽表 -> 行标签列
+MATRIX_TABLES = {
+    'mass_fraction_combine': 'gene',
+    'ProMassRatio_across_compartment_combine': 'compartment',
+}
+ANNOTATION_TABLE = 'compartment_annotation_refine'
+
+CHUNK_ROWS = 2000
+
+
+def is_condition(column):
+    return bool(CONDITION_PATTERN.match(str(column)))
+
+
+def db_version(db_path=DB_PATH):
+    """用文件大小和修改时间标识数据库版本"""
+    stat = os.stat(db_path)
+    raw = f"{os.path.abspath(db_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def _write_json(path, obj):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+@functools.lru_cache(maxsize=64)
+def _read_index(path, mtime_ns, size):
+    """矩阵的 JSON 索引（行标签和条件名），按 (路径, 修改时间, 大小) 缓存；文件被重写后键随之变化"""
+    return _read_json(path)
+
+
+def _build_matrix(conn, table, label, store_dir):
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+    conditions = [col for col in columns if is_condition(col)]
+    n_rows = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+
+    matrix_path = os.path.join(store_dir, f"{table}.f32")
+    tmp_path = matrix_path + ".tmp"
+    matrix = np.memmap(tmp_path, dtype=np.float32, mode='w+', shape=(len(conditions), max(n_rows, 1)))
+
+    # 分块读取，避免构建时把整张宽表放进内存
+    select = ', '.join(f'"{col}"' for col in [label] + conditions)
+    rows = []
+    start = 0
+    for chunk in pd.read_sql(f'SELECT {select} FROM "{table}"', conn, chunksize=CHUNK_ROWS):
+        values = chunk[conditions].to_numpy(dtype=np.float32, na_value=np.nan)
+        matrix[:, start:start + len(chunk)] = values.T
+        rows.extend(chunk[label].tolist())
+        start += len(chunk)
+    matrix.flush()
+    del matrix
+    os.replace(tmp_path, matrix_path)
+
+    _write_json(os.path.join(store_dir, f"{table}.json"), {
+        'label': label,
+        'rows': rows,
+        'conditions': conditions,
+        'dtype': 'float32',
+        'shape': [len(conditions), n_rows],
+    })
+
+
+def build_store(db_path=DB_PATH, store_dir=STORE_DIR):
+    """把三张表转换为内存映射矩阵 + 索引文件"""
+    os.makedirs(store_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    try:
+        for table, label in MATRIX_TABLES.items():
+            _build_matrix(conn, table, label, store_dir)
+        annotation = pd.read_sql(f'SELECT gene, compartment FROM "{ANNOTATION_TABLE}"', conn)
+        _write_json(os.path.join(store_dir, f"{ANNOTATION_TABLE}.json"), {
+            'gene': annotation['gene'].tolist(),
+            'compartment': annotation['compartment'].tolist(),
+        })
+    finally:
+        conn.close()
+    # manifest 最后写入，存在即表示存储完整
+    _write_json(os.path.join(store_dir, MANIFEST_FILE), {
+        'version': db_version(db_path),
+        'tables': list(MATRIX_TABLES),
+    })
+    # 完整重建后以新写入的文件为准，不再指向之前增量导入的快照
+    if os.path.exists(os.path.join(store_dir, CURRENT_FILE)):
+        os.remove(os.path.join(store_dir, CURRENT_FILE))
+
+
+def active_store(store_dir=STORE_DIR):
+    """store_dir 下有 CURRENT 指针时返回其指向的快照目录，否则返回 store_dir 本身
+
+    同一次读取（例如 load_store）应只解析一次，保证各文件来自同一个快照。
+    """
+    try:
+        with open(os.path.join(store_dir, CURRENT_FILE), encoding='utf-8') as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return store_dir
+    return os.path.join(store_dir, SNAPSHOT_DIR, name)
+
+
+def read_manifest(store_dir=STORE_DIR):
+    path = os.path.join(active_store(store_dir), MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    return _read_json(path)
+
+
+def store_version(store_dir=STORE_DIR):
+    manifest = read_manifest(store_dir)
+    return manifest['version'] if manifest else None
+
+
+def store_is_current(db_path=DB_PATH, store_dir=STORE_DIR):
+    """存储存在且由当前数据库构建（部署时不带数据库也视为可用）
+
+    增量导入得到的快照版本与数据库不同，但记录了构建它的数据库版本（source）。
+    """
+    manifest = read_manifest(store_dir)
+    if manifest is None:
+        return False
+    if not os.path.exists(db_path):
+        return True
+    return manifest.get('source', manifest['version']) == db_version(db_path)
+
+
+def data_version(db_path=DB_PATH, store_dir=STORE_DIR):
+    """当前数据集版本，用于给缓存等派生结果加命名空间"""
+    if store_is_current(db_path, store_dir):
+        return store_version(store_dir)
+    if os.path.exists(db_path):
+        return db_version(db_path)
+    return None
+
+
+def open_matrix(table, store_dir=STORE_DIR):
+    """只读映射矩阵，返回 (matrix, rows, conditions)，matrix 形状为 (条件数, 行数)"""
+    store_dir = active_store(store_dir)
+    path = os.path.join(store_dir, f"{table}.json")
+    stat = os.stat(path)
+    index = _read_index(path, stat.st_mtime_ns, stat.st_size)
+    n_conditions, n_rows = index['shape']
+    matrix = np.memmap(os.path.join(store_dir, f"{table}.f32"), dtype=np.float32, mode='r',
+                       shape=(n_conditions, max(n_rows, 1)))[:, :n_rows]
+    # 缓存的索引在调用之间共享，返回副本，调用方可以随意修改
+    return matrix, list(index['rows']), list(index['conditions'])
+
+
+def matrix_frame(table, store_dir=STORE_DIR):
+    """包装成与 SELECT * 相同列布局的 DataFrame，数值列直接引用映射内存，不复制"""
+    matrix, rows, conditions = open_matrix(table, store_dir)
+    df = pd.DataFrame(matrix.T, columns=conditions, copy=False)
+    df.insert(0, MATRIX_TABLES[table], rows)
+    return df
+
+
+def load_annotation(store_dir=STORE_DIR):
+    return pd.DataFrame(_read_json(os.path.join(active_store(store_dir), f"{ANNOTATION_TABLE}.json")))
+
+
+def load_ingested_metadata(store_dir=STORE_DIR):
+    """增量导入的条件元数据（physiology_collection 的新增行），没有时返回 None"""
+    path = os.path.join(active_store(store_dir), METADATA_FILE)
+    if not os.path.exists(path):
+        return None
+    return pd.DataFrame(_read_json(path))
+
+
+def load_store(store_dir=STORE_DIR):
+    """返回 (mass_fraction_df, compartment_df, promass_df)，与 load_data 一致"""
+    store_dir = active_store(store_dir)
+    mass_fraction_df = matrix_frame('mass_fraction_combine', store_dir)
+    compartment_df = load_annotation(store_dir)
+    promass_df = matrix_frame('ProMassRatio_across_compartment_combine', store_dir)
+    return mass_fraction_df, compartment_df, promass_df
+
+
+def load_tables(db_path=DB_PATH, store_dir=STORE_DIR):
+    """优先读取内存映射存储，否则直接从数据库读取三张表"""
+    if store_is_current(db_path, store_dir):
+        return load_store(store_dir)
+    with get_pool(db_path).connection() as conn:
+        mass_fraction_df = pd.read_sql('SELECT * FROM mass_fraction_combine', conn)
+        compartment_df = pd.read_sql(f'SELECT * FROM {ANNOTATION_TABLE}', conn)
+        promass_df = pd.read_sql('SELECT * FROM ProMassRatio_across_compartment_combine', conn)
+    return mass_fraction_df, compartment_df, promass_df
+
+
+if __name__ == "__main__":
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    store_dir = sys.argv[2] if len(sys.argv) > 2 else STORE_DIR
+    build_store(db_path, store_dir)
+    print(f"Matrix store written to {store_dir} (version {store_version(store_dir)})")
@@ -0,0 +1,206 @@
+"""轻量的进程内性能计数：耗时区间（span）、计数器和缓存命中率
+
+    with span('search'):                      # 代码块耗时
+        ...
+
+    @timed('plot')                            # 函数耗时，标签 function=<函数名>
+    def plot_distribution(...): ...
+
+    @cached(st.cache_data)                    # 代替 @st.cache_data，同时统计命中 / 未命中
+    def get_columns(...): ...
+
+每个区间只记录两次 perf_counter 和一次加锁累加（几微秒），可以在生产环境常开；
+每次运行调用成百上千次的函数（如下拉框的 format_func）不宜计数。
+汇总结果按 Prometheus 文本格式输出（prometheus_text），也可以用 serve_metrics 在后台线程
+提供 /metrics 接口。start_trace 开始记录当前线程（Streamlit 的一次运行）的区间明细，
+供管理面板显示本次请求的耗时分解，或用 log_trace 追加到 JSON Lines 日志。
+"""
+import bisect
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = "yp_"
+
+
+class Metrics:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.started = time.time()
+        self._spans = {}       # (name, labels) -> [次数, 总耗时, 最大耗时, 各桶计数]
+        self._counters = {}    # (name, labels) -> 计数
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def observe(self, name, seconds, labels=()):
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            entry = self._spans.get((name, labels))
+            if entry is None:
+                entry = self._spans[(name, labels)] = [0, 0.0, 0.0, [0] * (len(self.buckets) + 1)]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            entry[3][bucket] += 1
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace.append((getattr(self._local, 'depth', 0), name, dict(labels), seconds))
+
+    @contextmanager
+    def span(self, name, **labels):
+        local = self._local
+        local.depth = getattr(local, 'depth', 0) + 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            local.depth -= 1
+            self.observe(name, time.perf_counter() - start, tuple(sorted(labels.items())))
+
+    def timed(self, name, **labels):
+        """函数耗时装饰器，标签 function 为函数名"""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name, function=func.__name__, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def count(self, name, n=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def cached(self, cache_decorator):
+        """包装 st.cache_data / st.cache_resource 等缓存装饰器，按函数名统计命中和未命中"""
+        def decorate(func):
+            @functools.wraps(func)
+            def compute(*args, **kwargs):
+                self._local.missed = True
+                return func(*args, **kwargs)
+            cached_func = cache_decorator(compute)
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                # 缓存函数可能嵌套调用（未命中时内部再调用其他缓存函数），结束后恢复外层的标记
+                outer = getattr(self._local, 'missed', False)
+                self._local.missed = False
+                try:
+                    return cached_func(*args, **kwargs)
+                finally:
+                    self.count('cache_requests', cache=func.__name__,
+                               result='miss' if self._local.missed else 'hit')
+                    self._local.missed = outer
+            wrapper.clear = getattr(cached_func, 'clear', None)
+            return wrapper
+        return decorate
+
+    # ---- 单次请求明细 ----
+
+    def start_trace(self):
+        """开始记录当前线程的区间明细（之前的明细丢弃）"""
+        self._local.trace = []
+        self._local.depth = 0
+
+    def trace(self):
+        """[(嵌套深度, 名称, 标签, 秒)]，按结束顺序"""
+        return list(getattr(self._local, 'trace', None) or [])
+
+    def log_trace(self, path, **fields):
+        """把当前线程的明细作为一行 JSON 追加到 path"""
+        record = dict(fields, time=time.time(),
+                      spans=[{'name': name, **labels, 'seconds': round(seconds, 6)}
+                             for _, name, labels, seconds in self.trace()])
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    # ---- 汇总 ----
+
+    def summary(self):
+        """返回 (spans, counters)：spans 为 [{name, 标签..., count, total, mean, max}]，按总耗时降序"""
+        with self._lock:
+            spans = [{'name': name, **dict(labels), 'count': entry[0], 'total': entry[1],
+                      'mean': entry[1] / entry[0], 'max': entry[2]}
+                     for (name, labels), entry in self._spans.items()]
+            counters = [{'name': name, **dict(labels), 'value': value}
+                        for (name, labels), value in self._counters.items()]
+        return sorted(spans, key=lambda s: -s['total']), counters
+
+    def prometheus_text(self, prefix=PREFIX):
+        """Prometheus 文本格式：区间为 <prefix>span_seconds 直方图，计数器为 <prefix><name>_total"""
+        def format_labels(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ''
+            return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+        with self._lock:
+            spans = sorted((key, (e[0], e[1], e[2], list(e[3]))) for key, e in self._spans.items())
+            counters = sorted(self._counters.items())
+        lines = [f'# TYPE {prefix}uptime_seconds gauge', f'{prefix}uptime_seconds {time.time() - self.started:.3f}',
+                 f'# TYPE {prefix}span_seconds histogram']
+        for (name, labels), (count, total, _, buckets) in spans:
+            labels = (('span', name),) + labels
+            cumulative = 0
+            for bound, n in zip(self.buckets, buckets):
+                cumulative += n
+                lines.append(f'{prefix}span_seconds_bucket{format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{prefix}span_seconds_bucket{format_labels(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{prefix}span_seconds_sum{format_labels(labels)} {total:.6f}')
+            lines.append(f'{prefix}span_seconds_count{format_labels(labels)} {count}')
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f'# TYPE {prefix}{name}_total counter')
+                declared.add(name)
+            lines.append(f'{prefix}{name}_total{format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+            self.started = time.time()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def serve_metrics(port, host="127.0.0.1", metrics=None):
+    """在后台守护线程中提供 GET /metrics（Prometheus 文本格式），返回 server"""
+    metrics = metrics or METRICS
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name='metrics-server').start()
+    return server
+
+
+# 进程内共用的默认实例
+METRICS = Metrics()
+span = METRICS.span
+timed = METRICS.timed
+count = METRICS.count
+cached = METRICS.cached
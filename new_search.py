@@ -6,7 +6,6 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import base64
 import os
-from functools import lru_cache
 from concurrent.futures import ThreadPoolExecutor
 from utils import plot_cumulative_mass_fraction, plot_distribution, plot_scatter, plot_distribution_5, plot_log_scatter_5
 # 设置页面标题和布局
@@ -27,7 +26,6 @@ def prepare_file():
 executor.submit(prepare_file)
 
 @st.cache_data
-@lru_cache(maxsize=5)
 def get_rar_download_link(rar_path):
     try:
         b64 = base64.b64encode(file_content).decode()
@@ -0,0 +1,134 @@
+"""离线批量渲染：预先生成所有单条件图片，写入应用使用的图片缓存目录
+
+    python render_all.py [--workers N] [--kinds distribution distribution_5 cumulative] [--force]
+
+单条件图的取值空间是固定的（P1-P275 以及细胞器 x 条件），用进程池并行渲染后，
+应用请求这些图时直接从磁盘读取 PNG，不再调用 matplotlib。
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+matplotlib.use("Agg")
+
+from matrix_store import DB_PATH, STORE_DIR, data_version, is_condition, load_tables  # noqa: E402
+from compartment_tables import build_cumulative_tables, load_cumulative_tables  # noqa: E402
+from figure_cache import FIGURE_CACHE_DIR, figure_key, figure_to_bytes  # noqa: E402
+from analysis import AnalysisError, compartment_cumulative  # noqa: E402
+from distributions import build_log_distributions, load_log_distributions  # noqa: E402
+from utils import cumulative_mass_fraction_figure, distribution_figure, distribution_5_figure  # noqa: E402
+
+PLOT_FUNCTIONS = {
+    "distribution": 'plot_distribution',
+    "distribution_5": 'plot_distribution_5',
+    "cumulative": 'plot_cumulative_mass_fraction',
+}
+KINDS = list(PLOT_FUNCTIONS)
+
+# 工作进程内的数据，由 _init_worker 加载一次
+_data = {}
+
+
+def _init_worker(db_path, store_dir, need_tables):
+    mass_fraction_df, compartment_df, promass_df = load_tables(db_path, store_dir)
+    _data['mass_fraction_df'] = mass_fraction_df
+    _data['compartment_df'] = compartment_df
+    _data['promass_df'] = promass_df
+    distributions = load_log_distributions(store_dir)
+    _data['distributions'] = distributions if distributions is not None else build_log_distributions(mass_fraction_df)
+    if need_tables:
+        tables = load_cumulative_tables(store_dir)
+        _data['tables'] = tables if tables is not None else build_cumulative_tables(mass_fraction_df, compartment_df)
+
+
+def task_key(kind, args):
+    """与 utils.py 中各 plot 函数使用的缓存键一致，应用可直接命中这些文件"""
+    return figure_key(PLOT_FUNCTIONS[kind], *args)
+
+
+def _render(kind, args):
+    if kind == "distribution":
+        return distribution_figure(_data['promass_df'], *args)
+    if kind == "distribution_5":
+        return distribution_5_figure(_data['mass_fraction_df'], *args, distributions=_data['distributions'])
+    compartment, cond = args
+    result = compartment_cumulative(compartment, cond, _data['mass_fraction_df'], _data['compartment_df'],
+                                    _data['tables'])
+    return cumulative_mass_fraction_figure(compartment, cond, result['top'], result['curve'])
+
+
+def _render_batch(out_dir, tasks, force):
+    """渲染一批任务并写入 out_dir，返回 (新写入的文件数, 跳过的任务)"""
+    written, skipped = 0, []
+    for kind, args in tasks:
+        path = os.path.join(out_dir, task_key(kind, args))
+        # 已存在的文件直接跳过，中断后可以续跑
+        if not force and os.path.exists(path):
+            continue
+        try:
+            figure = _render(kind, args)
+        except AnalysisError as e:
+            # 数据中缺少该条件 / 细胞器时应用同样无法出图，跳过即可，不中断整批渲染
+            skipped.append((kind, args, str(e)))
+            continue
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(figure_to_bytes(figure))
+        os.replace(tmp_path, path)
+        written += 1
+    return written, skipped
+
+
+def build_tasks(kinds, conditions, promass_conditions, compartments):
+    """conditions 为质量分数表的条件，promass_conditions 为细胞器比例表的条件，各类图只用所画表中的条件"""
+    tasks = []
+    if "distribution" in kinds:
+        tasks += [("distribution", (cond,)) for cond in promass_conditions]
+    if "distribution_5" in kinds:
+        tasks += [("distribution_5", (cond,)) for cond in conditions]
+    if "cumulative" in kinds:
+        tasks += [("cumulative", (compartment, cond)) for compartment in compartments for cond in conditions]
+    return tasks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-render single-condition plots into the figure cache")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--out", default=None, help="output directory (default: figure_cache/<data version>)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=KINDS)
+    parser.add_argument("--batch-size", type=int, default=25)
+    parser.add_argument("--force", action="store_true", help="re-render files that already exist")
+    args = parser.parse_args()
+
+    out_dir = args.out or os.path.join(FIGURE_CACHE_DIR, data_version(args.db, args.store) or "unversioned")
+    os.makedirs(out_dir, exist_ok=True)
+
+    mass_fraction_df, compartment_df, promass_df = load_tables(args.db, args.store)
+    conditions = [col for col in mass_fraction_df.columns if is_condition(col)]
+    promass_conditions = [col for col in promass_df.columns if is_condition(col)]
+    compartments = list(compartment_df['compartment'].dropna().unique())
+    tasks = build_tasks(args.kinds, conditions, promass_conditions, compartments)
+    batches = [tasks[i:i + args.batch_size] for i in range(0, len(tasks), args.batch_size)]
+    del mass_fraction_df, compartment_df, promass_df
+
+    start = time.perf_counter()
+    written, skipped = 0, []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.db, args.store, "cumulative" in args.kinds)) as pool:
+        futures = [pool.submit(_render_batch, out_dir, batch, args.force) for batch in batches]
+        for done, future in enumerate(as_completed(futures), 1):
+            batch_written, batch_skipped = future.result()
+            written += batch_written
+            skipped += batch_skipped
+            print(f"\r{done}/{len(batches)} batches", end="", flush=True)
+    print(f"\nRendered {written} of {len(tasks)} plots into {out_dir} in {time.perf_counter() - start:.1f}s")
+    for kind, plot_args, message in skipped:
+        print(f"  skipped {kind}{plot_args!r}: {message}")
+
+
+if __name__ == "__main__":
+    main()
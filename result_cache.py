@@ -0,0 +1,253 @@
+"""跨进程共享的分析结果缓存（SQLite），以及部署时的预热命令
+
+    python result_cache.py warm [--top 20] [--store matrix_store] [--cache result_cache.sqlite]
+    python result_cache.py stats
+    python result_cache.py prune [--keep 3]
+
+st.cache_data 只在单个进程内有效，重启后全部失效。这里把计算结果（pickle）保存在一个
+SQLite 文件中，键为 (数据版本, 结果名, 参数) 的内容哈希：同一数据版本下各工作进程和重启后的
+进程直接读取，导入新数据后版本变化，自然使用新的键。另有一张与版本无关的请求计数表：
+应用在进程内缓存之外调用 record_request，命中进程内缓存的请求也计数；warm 按它为每个结果取出请求最多的
+参数组合（加上 WARM_DEFAULTS），在部署后为当前版本预先计算，重启后的第一批用户不必等待计算。
+
+可缓存的结果在 RESULTS 中登记，应用和 warm 调用同一个函数，保证键一致。缓存只是加速手段，
+读写出错时直接计算。
+"""
+import argparse
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from matrix_store import DB_PATH, STORE_DIR, active_store, data_version
+from metrics import count, span
+
+RESULT_CACHE_PATH = "result_cache.sqlite"
+KEEP_VERSIONS = 3
+WARM_TOP = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    value BLOB NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS requests (
+    name TEXT NOT NULL,
+    params BLOB NOT NULL,
+    count INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (name, params)
+);
+"""
+
+
+def result_key(version, name, params):
+    """(数据版本, 结果名, 参数) 的内容哈希；参数由字符串、数字、None 和元组组成，repr 稳定"""
+    return hashlib.sha256(repr((version, name, params)).encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, path=RESULT_CACHE_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # 每次操作单独连接（开销约 0.1 ms），不在线程间共享连接；WAL 模式下读写互不阻塞。
+        # 正常结束时提交，出错时回滚，最后关闭连接
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        """返回 (是否命中, 结果)"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+        return (True, pickle.loads(row[0])) if row is not None else (False, None)
+
+    def put(self, key, name, version, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                         (key, name, version, data, time.time()))
+
+    def record_request(self, name, params):
+        with self._connect() as conn:
+            conn.execute('INSERT INTO requests VALUES (?, ?, 1, ?) ON CONFLICT (name, params) '
+                         'DO UPDATE SET count = count + 1, last_used = excluded.last_used',
+                         (name, pickle.dumps(params), time.time()))
+
+    def get_or_compute(self, name, version, params, compute):
+        """命中时返回缓存结果，否则调用 compute() 并写入缓存；请求计数由调用方用 record_request 记录"""
+        key = result_key(version, name, params)
+        try:
+            found, value = self.get(key)
+        except (sqlite3.Error, pickle.UnpicklingError, EOFError) as e:
+            print(f"Error reading result cache {self.path}: {str(e)}")
+            found, value = False, None
+        count('result_cache', result='hit' if found else 'miss')
+        if not found:
+            with span('result_compute', result=name):
+                value = compute()
+        if not found:
+            try:
+                self.put(key, name, version, value)
+            except (sqlite3.Error, pickle.PicklingError) as e:
+                print(f"Error writing result cache {self.path}: {str(e)}")
+        return value
+
+    def contains(self, name, version, params):
+        with self._connect() as conn:
+            return conn.execute('SELECT 1 FROM results WHERE key = ?',
+                                (result_key(version, name, params),)).fetchone() is not None
+
+    def most_requested(self, n=WARM_TOP, name=None):
+        """请求次数最多的 n 个 (结果名, 参数, 次数)，不分数据版本；给出 name 时只看该结果"""
+        where, args = ('WHERE name = ? ', (name,)) if name is not None else ('', ())
+        with self._connect() as conn:
+            rows = conn.execute(f'SELECT name, params, count FROM requests {where}'
+                                'ORDER BY count DESC, last_used DESC LIMIT ?', (*args, n)).fetchall()
+        return [(name, pickle.loads(params), n_requests) for name, params, n_requests in rows]
+
+    def stats(self):
+        """各数据版本的 (版本, 结果数, 字节数, 最近写入时间)，最近的在前"""
+        with self._connect() as conn:
+            return conn.execute('SELECT version, COUNT(*), SUM(LENGTH(value)), MAX(created) FROM results '
+                                'GROUP BY version ORDER BY MAX(created) DESC').fetchall()
+
+    def prune(self, keep=KEEP_VERSIONS):
+        """只保留最近写入的 keep 个数据版本的结果（请求计数保留），返回删除的结果数"""
+        versions = [row[0] for row in self.stats()]
+        stale = versions[keep:]
+        if not stale:
+            return 0
+        with self._connect() as conn:
+            removed = conn.execute(f'DELETE FROM results WHERE version IN ({",".join("?" * len(stale))})',
+                                   stale).rowcount
+        with self._connect() as conn:
+            conn.execute('VACUUM')
+        return removed
+
+
+# ---- 可缓存的结果：参数为 (db_path, store, *params)，params 须可 repr / pickle ----
+
+def differential_abundance_result(db_path, store, group_a, group_b, test):
+    from analysis import differential_abundance
+    from data_loader import load_columns
+
+    df = load_columns('mass_fraction_combine', [*group_a, *group_b], db_path, store)
+    return differential_abundance(df, group_a, group_b, test)
+
+
+def ratio_table_result(db_path, store, gene_sets=None, split_shared=False):
+    """gene_sets 为 ((名称, (基因...)), ...)；None 时按数据库中的细胞器注释重新计算"""
+    from compartment_engine import compartment_ratio_table
+    from data_loader import load_columns, load_compartment_annotation, load_conditions
+
+    conditions = load_conditions('mass_fraction_combine', db_path, store)
+    mass_fraction_df = load_columns('mass_fraction_combine', conditions, db_path, store)
+    if gene_sets is not None:
+        return compartment_ratio_table(mass_fraction_df, conditions=conditions,
+                                       gene_sets={name: list(genes) for name, genes in gene_sets},
+                                       split_shared=split_shared)
+    return compartment_ratio_table(mass_fraction_df, load_compartment_annotation(db_path, store), conditions,
+                                   split_shared=split_shared)
+
+
+RESULTS = {
+    'differential_abundance': differential_abundance_result,
+    'ratio_table': ratio_table_result,
+}
+# 无论请求记录如何都预先计算的结果
+WARM_DEFAULTS = [
+    ('ratio_table', (None, False)),
+    ('ratio_table', (None, True)),
+]
+
+
+def record_request(cache, name, *params):
+    """记录一次 RESULTS[name] 的请求；在进程内缓存（st.cache_data）之外调用，命中进程内缓存的请求也计数"""
+    if cache is None:
+        return
+    try:
+        cache.record_request(name, params)
+    except (sqlite3.Error, pickle.PicklingError) as e:
+        print(f"Error writing result cache {cache.path}: {str(e)}")
+
+
+def shared_result(cache, name, store, *params, db_path=DB_PATH):
+    """RESULTS[name] 的结果，经共享缓存；cache 为 None 或没有可用的数据版本时直接计算"""
+    compute = RESULTS[name]
+    version = data_version(db_path, store)
+    if cache is None or version is None:
+        return compute(db_path, store, *params)
+    return cache.get_or_compute(name, version, params, lambda: compute(db_path, store, *params))
+
+
+def warm(cache, db_path=DB_PATH, store_dir=STORE_DIR, top=WARM_TOP):
+    """为当前数据版本预先计算 RESULTS 中每个结果请求最多的 top 组参数和 WARM_DEFAULTS，返回 [(结果名, 参数, 秒)]"""
+    store = active_store(store_dir)
+    version = data_version(db_path, store)
+    if version is None:
+        raise FileNotFoundError(f"No data found at {db_path} or {store_dir}")
+    requested = [(name, params) for result in RESULTS for name, params, _ in cache.most_requested(top, result)]
+    tasks = list(dict.fromkeys(requested + WARM_DEFAULTS))
+    computed = []
+    for name, params in tasks:
+        if name not in RESULTS or cache.contains(name, version, params):
+            continue
+        start = time.perf_counter()
+        try:
+            value = RESULTS[name](db_path, store, *params)
+        except Exception as e:
+            # 请求记录中的参数可能对新数据无效（如条件已不存在），跳过即可
+            print(f"Skipping {name}{params!r}: {str(e)}")
+            continue
+        cache.put(result_key(version, name, params), name, version, value)
+        computed.append((name, params, time.perf_counter() - start))
+    return computed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared on-disk cache for computed analysis results")
+    parser.add_argument("--cache", default=os.environ.get("RESULT_CACHE_PATH", RESULT_CACHE_PATH))
+    commands = parser.add_subparsers(dest="command", required=True)
+    warm_cmd = commands.add_parser("warm", help="precompute the most requested parameters of each result "
+                                                "for the current data version")
+    warm_cmd.add_argument("--db", default=DB_PATH)
+    warm_cmd.add_argument("--store", default=STORE_DIR)
+    warm_cmd.add_argument("--top", type=int, default=WARM_TOP)
+    commands.add_parser("stats", help="show cached results per data version and the most requested results")
+    prune_cmd = commands.add_parser("prune", help="drop results of old data versions")
+    prune_cmd.add_argument("--keep", type=int, default=KEEP_VERSIONS)
+    args = parser.parse_args()
+
+    cache = ResultCache(args.cache)
+    if args.command == "warm":
+        start = time.perf_counter()
+        computed = warm(cache, args.db, args.store, args.top)
+        for name, params, seconds in computed:
+            print(f"  {name}{params!r:.80}  {seconds:.2f}s")
+        print(f"Computed {len(computed)} results ({time.perf_counter() - start:.1f}s)")
+    elif args.command == "stats":
+        for version, n, size, created in cache.stats():
+            created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created))
+            print(f"{version}  {n} results  {size / 1024:.0f} KB  last written {created}")
+        for name, params, n in cache.most_requested():
+            print(f"  {n:6d}  {name}{params!r:.80}")
+    else:
+        print(f"Removed {cache.prune(args.keep)} results")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,45 +2,71 @@ import sqlite3
 import pandas as pd
 import matplotlib.pyplot as plt
 import streamlit as st
-import seaborn as sns
 import numpy as np
-from adjustText import adjust_text
-
-def plot_cumulative_mass_fraction(compartment, cond, mass_fraction_df, compartment_df):
-    if compartment in compartment_df['compartment'].unique() and cond in mass_fraction_df.columns:
-        nucleus_proteins = compartment_df[compartment_df['compartment'] == compartment]['gene']
-        nucleus_mass_fractions = mass_fraction_df[mass_fraction_df['gene'].isin(nucleus_proteins)]
-        total_mass_P = nucleus_mass_fractions[cond].sum()
-        sorted_nucleus_mass_fractions = nucleus_mass_fractions[['gene', cond]].sort_values(by=cond, ascending=False)
-        top_10_proteins = sorted_nucleus_mass_fractions.head(10)
-        sorted_nucleus_mass_fractions['cumulative_mass'] = sorted_nucleus_mass_fractions[cond].cumsum()
-        nucleus_filtered_genes = sorted_nucleus_mass_fractions[sorted_nucleus_mass_fractions['gene'].isin(nucleus_proteins)]
-
-        # Display the total mass and top 10 proteins
-        st.write(f'Total mass of proteins in the nucleus for {cond}: {total_mass_P}')
-        st.write(f'Top 10 proteins by mass fraction in {cond}:')
-        st.write(top_10_proteins)
-
-        fig, axs = plt.subplots(1, 2, figsize=(15, 6))
-        # First subplot: Bar chart of the top 10 proteins by mass fraction in 'P1'
-        axs[0].bar(top_10_proteins['gene'], top_10_proteins[cond], color='skyblue')
-        axs[0].set_title(f'Top 10 {compartment}-Related Proteins by Mass Fraction in {cond}')
-        axs[0].set_xlabel(f'Gene(Top-10 proteins in {cond} mass fraction)')
-        axs[0].set_ylabel(f'Mass Fraction ({cond})')
-        axs[0].tick_params(axis='x', rotation=45, labelsize=8)  # Rotate gene labels for better visibility
-
-        # Second subplot: Cumulative mass fraction plot for all nucleus-related proteins
-        axs[1].plot(nucleus_filtered_genes['gene'], nucleus_filtered_genes['cumulative_mass'], marker='o', linestyle='-', color='yellow')
-        axs[1].set_title(f'Cumulative Mass Fraction of Nucleus-Related Proteins in {cond}')
-        axs[1].set_xlabel(f'Gene (sorted by {cond} mass fraction)')
-        axs[1].set_ylabel('Cumulative Mass Fraction')
-        axs[1].tick_params(axis='x', which='both', bottom=True, labelbottom=False)  # Rotate gene labels for better visibility
-        axs[1].grid(True,which='major', linestyle='--', linewidth=0.5)
-        plt.tight_layout()
-        # plt.show()
-        st.pyplot(fig)
+from figure_cache import figure_key
+from metrics import span, timed
+from distributions import column_distribution
+from label_placement import MAX_LABELS, place_labels, text_size
+from analysis import (AnalysisError, compartment_cumulative, compartment_totals, correlation_view, group_comparison,
+                      group_key, labeled_compartments, log_correlation, log_pair, significant, top_compartments)
+
+# seaborn / scipy 导入较慢，只在真正绘制对应图时才导入
+
+
+def show_figure(cache, key, build_figure):
+    """有缓存时显示缓存的图片字节（未命中才绘图），否则直接 st.pyplot"""
+    plot = key.split('-', 1)[0]
+
+    def build():
+        with span('figure_build', plot=plot):
+            return build_figure()
+
+    if cache is None:
+        fig = build()
+        with span('st_pyplot', plot=plot):
+            st.pyplot(fig)
     else:
-        print(f"{compartment}或{cond}列不存在")
+        st.image(cache.get_or_render(key, build))
+
+
+@timed('plot')
+def plot_cumulative_mass_fraction(compartment, cond, mass_fraction_df, compartment_df, tables=None, cache=None):
+    # 计算部分见 analysis.py，有预计算的累积表时直接查表
+    try:
+        result = compartment_cumulative(compartment, cond, mass_fraction_df, compartment_df, tables)
+    except AnalysisError as e:
+        print(e)
+        return
+    total_mass_P, top_10_proteins, nucleus_filtered_genes = result['total'], result['top'], result['curve']
+
+    # Display the total mass and top 10 proteins
+    st.write(f'Total mass of proteins in the nucleus for {cond}: {total_mass_P}')
+    st.write(f'Top 10 proteins by mass fraction in {cond}:')
+    st.write(top_10_proteins)
+
+    show_figure(cache, figure_key('plot_cumulative_mass_fraction', compartment, cond),
+                lambda: cumulative_mass_fraction_figure(compartment, cond, top_10_proteins, nucleus_filtered_genes))
+
+
+def cumulative_mass_fraction_figure(compartment, cond, top_10_proteins, nucleus_filtered_genes):
+    fig, axs = plt.subplots(1, 2, figsize=(15, 6))
+    # First subplot: Bar chart of the top 10 proteins by mass fraction in 'P1'
+    axs[0].bar(top_10_proteins['gene'], top_10_proteins[cond], color='skyblue')
+    axs[0].set_title(f'Top 10 {compartment}-Related Proteins by Mass Fraction in {cond}')
+    axs[0].set_xlabel(f'Gene(Top-10 proteins in {cond} mass fraction)')
+    axs[0].set_ylabel(f'Mass Fraction ({cond})')
+    axs[0].tick_params(axis='x', rotation=45, labelsize=8)  # Rotate gene labels for better visibility
+
+    # Second subplot: Cumulative mass fraction plot for all nucleus-related proteins
+    axs[1].plot(nucleus_filtered_genes['gene'], nucleus_filtered_genes['cumulative_mass'], marker='o', linestyle='-', color='yellow')
+    axs[1].set_title(f'Cumulative Mass Fraction of Nucleus-Related Proteins in {cond}')
+    axs[1].set_xlabel(f'Gene (sorted by {cond} mass fraction)')
+    axs[1].set_ylabel('Cumulative Mass Fraction')
+    axs[1].tick_params(axis='x', which='both', bottom=True, labelbottom=False)  # Rotate gene labels for better visibility
+    axs[1].grid(True,which='major', linestyle='--', linewidth=0.5)
+    plt.tight_layout()
+    # plt.show()
+    return fig
 
 
 # def plot_distribution(data, column):
@@ -60,125 +86,343 @@ def plot_cumulative_mass_fraction(compartment, cond, mass_fraction_df, compartme
 #     else:
 #         print(column+"列不存在")
 
-def plot_distribution(data, column):
+def distribution_figure(data, column):
+    # Select column and sort it for the top 20 compartments
+    sorted_data_p = top_compartments(data, column)
+
+    # Create a figure and axis
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    # Create a bar plot for the top 20 compartments by protein mass ratio
+    ax.barh(sorted_data_p['compartment'], sorted_data_p[column], color='skyblue')
+    ax.set_xlabel(f'Protein Mass Ratio ({column})')
+    ax.set_ylabel('Compartment')
+    ax.set_title(f'Top 20 Compartments by Protein Mass Ratio ({column})')
+    ax.invert_yaxis()  # To reverse the order of compartments
+    plt.tight_layout()
+    return fig
+
+@timed('plot')
+def plot_distribution(data, column, cache=None):
     if column in data.columns:
-        # Select column and sort it for the top 20 compartments
-        sorted_data_p = data[['compartment', column]].sort_values(by=column, ascending=False).head(20)
-        
-        # Create a figure and axis
-        fig, ax = plt.subplots(figsize=(10, 6))
-        
-        # Create a bar plot for the top 20 compartments by protein mass ratio
-        ax.barh(sorted_data_p['compartment'], sorted_data_p[column], color='skyblue')
-        ax.set_xlabel(f'Protein Mass Ratio ({column})')
-        ax.set_ylabel('Compartment')
-        ax.set_title(f'Top 20 Compartments by Protein Mass Ratio ({column})')
-        ax.invert_yaxis()  # To reverse the order of compartments
-        plt.tight_layout()
-        
         # Display the plot in Streamlit
-        st.pyplot(fig)
+        show_figure(cache, figure_key('plot_distribution', column), lambda: distribution_figure(data, column))
     else:
         st.error(f"The column '{column}' does not exist.")
 
-def plot_scatter(data, column1, column2):
-    if column1 in data.columns and column2 in data.columns:
-        # Create a figure and axis
-        fig, ax = plt.subplots(figsize=(8, 6))
-        
-        # Create a scatter plot between the two columns
-        ax.scatter(data[column1], data[column2], color='blue', alpha=0.5)
-
-        max_val = max(data[column1].max(), data[column2].max())
-        ax.plot([0, max_val], [0, max_val], color='red', linestyle='--', label='y = x')
-        ax.legend()
-
-        # 准备标注的标签
-        texts = []  # 用于存储标签
-        for i, row in data.iterrows():
-            if row[column1] >= 0.05 and row[column2] >= 0.05:
-                texts.append(ax.text(row[column1], row[column2], row['compartment'], fontsize=8, color='green'))
-
-        # 使用 adjust_text 自动调整标签
-        adjust_text(
-            texts, 
-            arrowprops=dict(arrowstyle='-', color='gray', lw=0.5)  # 为调整的标签添加箭头
-        )
+def annotate_points(ax, names, xs, ys, obstacles=None, fontsize=8, color='green'):
+    """在不重叠的位置标注各点（见 label_placement.py），放不下的标签跳过"""
+    # 固定坐标范围，之后数据坐标与像素坐标的换算不再变化
+    ax.set_xlim(ax.get_xlim())
+    ax.set_ylim(ax.get_ylim())
+    to_pixels = ax.transData
+    points = to_pixels.transform(np.column_stack([xs, ys]))
+    sizes = text_size(names, fontsize, ax.figure.dpi)
+    extent = ax.get_window_extent()
+    if obstacles is not None:
+        obstacles = to_pixels.transform(obstacles)
+    with span('label_placement'):
+        positions = place_labels(points, sizes, (extent.x0, extent.y0, extent.x1, extent.y1), obstacles)
+
+    from_pixels = to_pixels.inverted()
+    for name, point, position, size in zip(names, points, positions, sizes):
+        if np.isnan(position[0]):
+            continue
+        # 标签离点较远时画一条连线
+        nearest = np.clip(point, position, position + size)
+        far = np.hypot(*(nearest - point)) > 10
+        ax.annotate(name, xy=from_pixels.transform(point), xytext=from_pixels.transform(position),
+                    ha='left', va='bottom', fontsize=fontsize, color=color,
+                    arrowprops=dict(arrowstyle='-', color='gray', lw=0.5) if far else None)
+
+def scatter_figure(data, column1, column2):
+    # Create a figure and axis
+    fig, ax = plt.subplots(figsize=(8, 6))
+
+    # Create a scatter plot between the two columns
+    ax.scatter(data[column1], data[column2], color='blue', alpha=0.5)
+
+    max_val = max(data[column1].max(), data[column2].max())
+    ax.plot([0, max_val], [0, max_val], color='red', linestyle='--', label='y = x')
+    ax.legend()
 
-        ax.set_xlabel(f'Protein Mass Ratio ({column1})')
-        ax.set_ylabel(f'Protein Mass Ratio ({column2})')
-        ax.set_title(f'Scatter Plot of Protein Mass Ratios between {column1} and {column2}')
-        ax.grid(True)
-        plt.tight_layout()
-        
+    ax.set_xlabel(f'Protein Mass Ratio ({column1})')
+    ax.set_ylabel(f'Protein Mass Ratio ({column2})')
+    ax.set_title(f'Scatter Plot of Protein Mass Ratios between {column1} and {column2}')
+    ax.grid(True)
+    plt.tight_layout()
+
+    # 准备标注的标签：只标注比例最高的 MAX_LABELS 个，布局确定后再放置
+    labels = labeled_compartments(data, column1, column2, max_labels=MAX_LABELS)
+    annotate_points(ax, labels['compartment'].tolist(), labels[column1], labels[column2],
+                    obstacles=np.column_stack([data[column1], data[column2]]))
+    return fig
+
+@timed('plot')
+def plot_scatter(data, column1, column2, cache=None):
+    if column1 in data.columns and column2 in data.columns:
         # Display the plot in Streamlit
-        st.pyplot(fig)
+        show_figure(cache, figure_key('plot_scatter', column1, column2),
+                    lambda: scatter_figure(data, column1, column2))
     else:
         st.error(f"The columns '{column1}' or '{column2}' do not exist.")
 
 # plot_distribution(df, column)
 # plot_scatter(df, column1, column2)
 
-def plot_distribution_5(df, column):
+def log_histogram(df, column, distributions=None):
+    """预计算的直方图 + KDE 曲线（见 distributions.py）；没有时只对这一列即时计算"""
+    if distributions is not None and column in distributions:
+        return distributions.lookup(column)
+    with span('kde'):
+        return column_distribution(df[column], column)
+
+def draw_log_histogram(ax, distribution):
+    if distribution['n'] == 0:
+        ax.text(0.5, 0.5, "No data", transform=ax.transAxes, ha='center', va='center')
+        return
+    # 与 seaborn.histplot(kde=True) 的默认样式一致
+    edges = distribution['edges']
+    ax.bar(edges[:-1], distribution['counts'], width=np.diff(edges), align='edge',
+           color='C0', alpha=0.5, edgecolor='black')
+    ax.plot(distribution['grid'], distribution['curve'], color='C0', linewidth=1.5)
+
+def distribution_5_figure(df, column, distributions=None):
+    # Create a figure and axis
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    # Create a histogram with KDE
+    draw_log_histogram(ax, log_histogram(df, column, distributions))
+    ax.set_title(f'{column} Log Distribution')
+    ax.set_xlabel(f'Log({column})')
+    ax.set_ylabel('Frequency')
+    return fig
+
+@timed('plot')
+def plot_distribution_5(df, column, cache=None, distributions=None):
     if column in df.columns:
-        P1_log = np.log(df[column])
-        
-        # Create a figure and axis
-        fig, ax = plt.subplots(figsize=(10, 6))
-        
-        # Create a histogram with KDE
-        sns.histplot(P1_log, kde=True, ax=ax)
-        ax.set_title(f'{column} Log Distribution')
-        ax.set_xlabel(f'Log({column})')
-        ax.set_ylabel('Frequency')
-        
         # Display the plot in Streamlit
-        st.pyplot(fig)
+        show_figure(cache, figure_key('plot_distribution_5', column),
+                    lambda: distribution_5_figure(df, column, distributions))
     else:
         st.error(f"The column '{column}' does not exist.")
 
 # 选中P1和P2列，取出所有数值，对这些数值取log
-def plot_log_scatter_5(df, column1, column2):
+def log_scatter_5_figure(df, column1, column2, correlation=None):
+    import seaborn as sns
+
+    P1_log, P2_log = log_pair(df, column1, column2)
+    if correlation is None:
+        correlation = np.corrcoef(P1_log, P2_log)[0, 1]
+
+    # Create scatter plot
+    fig1, ax1 = plt.subplots(figsize=(10, 6))
+    sns.scatterplot(x=P1_log, y=P2_log, ax=ax1)
+    ax1.set_title(f'{column1} vs {column2} Log Scatter Plot')
+    ax1.set_xlabel(f'Log({column1})')
+    ax1.set_ylabel(f'Log({column2})')
+    ax1.text(
+            x=P1_log.min() + 0.1,  # Adjust text position
+            y=P2_log.max() - 0.1,
+            s=f'Correlation: {correlation:.3f}',
+            fontsize=12,
+            color='black',
+            bbox=dict(facecolor='white', alpha=0.5, edgecolor='gray')
+        )
+    return fig1
+
+def log_distributions_5_figure(df, column1, column2, distributions=None):
+    # Create distribution plots
+    fig2, axes = plt.subplots(1, 2, figsize=(15, 6))
+    draw_log_histogram(axes[0], log_histogram(df, column1, distributions))
+    axes[0].set_title(f'{column1} Log Distribution')
+    axes[0].set_xlabel(f'Log({column1})')
+    axes[0].set_ylabel('Frequency')
+
+    draw_log_histogram(axes[1], log_histogram(df, column2, distributions))
+    axes[1].set_title(f'{column2} Log Distribution')
+    axes[1].set_xlabel(f'Log({column2})')
+    axes[1].set_ylabel('Frequency')
+
+    plt.tight_layout()
+    return fig2
+
+@timed('plot')
+def plot_log_scatter_5(df, column1, column2, cache=None, correlations=None, distributions=None):
     if column1 in df.columns and column2 in df.columns:
-        P1_log = np.log(df[column1])#.dropna()
-        P2_log = np.log(df[column2])#.dropna()
-        valid_mask = np.isfinite(P1_log) & np.isfinite(P2_log)    
-        P1_log, P2_log = P1_log.align(P2_log, join='inner')
-        correlation = np.corrcoef(P1_log[valid_mask], P2_log[valid_mask])[0, 1]
-
-        # Create scatter plot
-        fig1, ax1 = plt.subplots(figsize=(10, 6))
-        sns.scatterplot(x=P1_log, y=P2_log, ax=ax1)
-        ax1.set_title(f'{column1} vs {column2} Log Scatter Plot')
-        ax1.set_xlabel(f'Log({column1})')
-        ax1.set_ylabel(f'Log({column2})')
-        ax1.text(
-                x=min(P1_log) + 0.1,  # Adjust text position
-                y=max(P2_log) - 0.1,
-                s=f'Correlation: {correlation:.3f}',
-                fontsize=12,
-                color='black',
-                bbox=dict(facecolor='white', alpha=0.5, edgecolor='gray')
-            )
-        
+        # 有预先计算的相关系数矩阵时直接查表（见 correlation.py）
+        correlation = log_correlation(df, column1, column2, correlations)
+
         # Display the scatter plot in Streamlit
-        st.pyplot(fig1)
-
-        # Create distribution plots
-        fig2, axes = plt.subplots(1, 2, figsize=(15, 6))
-        sns.histplot(P1_log, kde=True, ax=axes[0])
-        axes[0].set_title(f'{column1} Log Distribution')
-        axes[0].set_xlabel(f'Log({column1})')
-        axes[0].set_ylabel('Frequency')
-
-        sns.histplot(P2_log, kde=True, ax=axes[1])
-        axes[1].set_title(f'{column2} Log Distribution')
-        axes[1].set_xlabel(f'Log({column2})')
-        axes[1].set_ylabel('Frequency')
-
-        plt.tight_layout()
-        
+        show_figure(cache, figure_key('plot_log_scatter_5', column1, column2),
+                    lambda: log_scatter_5_figure(df, column1, column2, correlation))
+
         # Display the distribution plots in Streamlit
-        st.pyplot(fig2)
+        show_figure(cache, figure_key('plot_log_scatter_5_distributions', column1, column2),
+                    lambda: log_distributions_5_figure(df, column1, column2, distributions))
     else:
-        st.error(f"The columns '{column1}' or '{column2}' do not exist.")
\ No newline at end of file
+        st.error(f"The columns '{column1}' or '{column2}' do not exist.")
+
+@timed('plot')
+def plot_log_scatter_5_interactive(df, column1, column2, overlay=(), max_points=None, cache=None, correlations=None,
+                                   distributions=None):
+    """WebGL 散点图在浏览器端渲染（见 interactive.py）；分布图仍为缓存的静态图片"""
+    missing = [col for col in (column1, column2, *overlay) if col not in df.columns]
+    if missing:
+        st.error(f"The columns {', '.join(repr(col) for col in missing)} do not exist.")
+        return
+    from interactive import log_scatter_figure
+
+    correlation = log_correlation(df, column1, column2, correlations)
+    fig = log_scatter_figure(df, column1, column2, overlay, correlation, max_points)
+    with span('st_plotly_chart'):
+        st.plotly_chart(fig)
+
+    show_figure(cache, figure_key('plot_log_scatter_5_distributions', column1, column2),
+                lambda: log_distributions_5_figure(df, column1, column2, distributions))
+
+def group_bar_figure(stats, label, title, top=20):
+    """各组均值（误差线为标准差）最高的 top 行，stats 为 {组名: group_statistics 结果}"""
+    first = next(iter(stats.values()))
+    order = np.argsort(-np.nan_to_num(first['mean'].to_numpy(), nan=-np.inf), kind='stable')[:top]
+    names = first[label].to_numpy()[order]
+    height = 0.8 / len(stats)
+    positions = np.arange(len(names))
+
+    fig, ax = plt.subplots(figsize=(10, max(4, 0.35 * len(names) + 1)))
+    for k, (group, group_stats) in enumerate(stats.items()):
+        ax.barh(positions + k * height, group_stats['mean'].to_numpy()[order], height=height,
+                xerr=np.nan_to_num(group_stats['std'].to_numpy()[order]), capsize=2, label=group, alpha=0.8)
+    ax.set_yticks(positions + height * (len(stats) - 1) / 2)
+    ax.set_yticklabels(names, fontsize=8)
+    ax.invert_yaxis()
+    ax.set_xlabel('Mean across conditions (error bar: SD)')
+    ax.set_title(title)
+    ax.legend()
+    plt.tight_layout()
+    return fig
+
+@timed('plot')
+def plot_group_comparison(df, label, group_a, group_b=(), compartment_df=None, cache=None):
+    """多条件比较：每行的均值 / CV，两组时的倍数变化；质量分数表另外给出各细胞器总量"""
+    if not group_a:
+        st.warning("Select at least one condition for Group A.")
+        return
+    missing = [col for col in (*group_a, *group_b) if col not in df.columns]
+    if missing:
+        st.error(f"The columns {', '.join(repr(col) for col in missing)} do not exist.")
+        return
+    key = group_key(group_a, group_b)
+    noun = 'Proteins' if label == 'gene' else 'Compartments'
+
+    table, stats = group_comparison(df, label, group_a, group_b)
+    sort_by = 'log2_fold_change' if group_b else 'mean'
+    st.write(f'{noun} across {len(group_a)}' + (f' vs {len(group_b)}' if group_b else '') + ' conditions:')
+    st.dataframe(table.sort_values(sort_by, ascending=False, key=np.abs if group_b else None))
+    title = f"Top {noun} by Mean {'Mass Fraction' if label == 'gene' else 'Protein Mass Ratio'}"
+    show_figure(cache, figure_key('plot_group_comparison', label, len(group_a), len(group_b), key),
+                lambda: group_bar_figure(stats, label, title))
+
+    if compartment_df is not None:
+        totals = compartment_totals(df, compartment_df, [*group_a, *group_b])
+        table, stats = group_comparison(totals, 'compartment', group_a, group_b)
+        st.write('Total mass fraction of annotated proteins per compartment:')
+        st.dataframe(table.sort_values(sort_by, ascending=False, key=np.abs if group_b else None))
+        show_figure(cache, figure_key('plot_group_comparison_totals', len(group_a), len(group_b), key),
+                    lambda: group_bar_figure(stats, 'compartment', 'Compartment Totals of Protein Mass Fraction'))
+
+def volcano_figure(result, fdr=0.05, min_log2_fold_change=1.0, top=20):
+    """x 为 log2 倍数变化（B / A），y 为 -log10 p；显著上调 / 下调分别标色，标注 p 值最小的 top 个显著基因"""
+    result = result[np.isfinite(result['p_value']) & np.isfinite(result['log2_fold_change'])]
+    x = result['log2_fold_change'].to_numpy()
+    y = -np.log10(np.clip(result['p_value'].to_numpy(), 1e-300, None))
+    hits = significant(result, fdr, min_log2_fold_change).to_numpy()
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    ax.scatter(x[~hits], y[~hits], s=6, color='gray', alpha=0.4, label='Not significant')
+    ax.scatter(x[hits & (x > 0)], y[hits & (x > 0)], s=10, color='red', alpha=0.7, label='Higher in group B')
+    ax.scatter(x[hits & (x < 0)], y[hits & (x < 0)], s=10, color='blue', alpha=0.7, label='Higher in group A')
+    for threshold in (-min_log2_fold_change, min_log2_fold_change):
+        ax.axvline(threshold, color='black', linestyle='--', lw=0.8)
+    ax.set_xlabel('log2 Fold Change (B / A)')
+    ax.set_ylabel('-log10 p-value')
+    ax.set_title(f'Volcano Plot ({int(hits.sum())} proteins at FDR {fdr:g})')
+    # 火山图顶部中间通常没有点，图例放在这里并留出标注空间
+    if len(y):
+        ax.set_ylim(0, y.max() * 1.15)
+    ax.legend(loc='upper center')
+    ax.grid(True)
+    plt.tight_layout()
+
+    # result 已按 p 值排序
+    labels = np.flatnonzero(hits)[:top]
+    annotate_points(ax, result['gene'].to_numpy()[labels].tolist(), x[labels], y[labels],
+                    obstacles=np.column_stack([x, y]), color='black')
+    return fig
+
+@timed('plot')
+def plot_differential_abundance(result, group_a, group_b, test, fdr=0.05, min_log2_fold_change=1.0, cache=None):
+    """差异丰度结果（见 analysis.differential_abundance）：排序后的表格和火山图"""
+    hits = significant(result, fdr, min_log2_fold_change)
+    st.write(f'{int(hits.sum())} of {len(result)} proteins with q <= {fdr:g} and |log2 fold change| >= '
+             f'{min_log2_fold_change:g} ({len(group_b)} vs {len(group_a)} conditions):')
+    st.dataframe(result.assign(significant=hits))
+    show_figure(cache, figure_key('plot_differential_abundance', test, fdr, min_log2_fold_change,
+                                  group_key(group_a, group_b)),
+                lambda: volcano_figure(result, fdr, min_log2_fold_change))
+
+def correlation_heatmap_figure(correlations, clustered=False, conditions=None):
+    values, labels = correlation_view(correlations, clustered, conditions)
+
+    fig, ax = plt.subplots(figsize=(12, 10))
+    image = ax.imshow(values, cmap='RdBu_r', vmin=-1, vmax=1, interpolation='nearest')
+    fig.colorbar(image, ax=ax, label='Pearson correlation (log mass fraction)')
+    # 275 个条件只标注一部分刻度
+    step = max(1, len(labels) // 30)
+    ticks = np.arange(0, len(labels), step)
+    ax.set_xticks(ticks)
+    ax.set_xticklabels(labels[ticks], rotation=90, fontsize=7)
+    ax.set_yticks(ticks)
+    ax.set_yticklabels(labels[ticks], fontsize=7)
+    ax.set_title('Clustered Condition Correlation' if clustered else 'Condition Correlation')
+    plt.tight_layout()
+    return fig
+
+@timed('plot')
+def plot_correlation_heatmap(correlations, clustered=False, cache=None, conditions=None):
+    """conditions 为按元数据筛选出的条件子集时，只画这些条件之间的相关性"""
+    subset = () if conditions is None else (len(conditions), group_key(sorted(conditions)))
+    show_figure(cache, figure_key('plot_correlation_heatmap', 'clustered' if clustered else 'ordered', *subset),
+                lambda: correlation_heatmap_figure(correlations, clustered, conditions))
+
+def coexpression_figure(gene, profiles_df, neighbors, lines=5):
+    """gene 与前 lines 个共表达蛋白质在各条件下的 log10 质量分数，条件按 gene 的取值排序"""
+    conditions = [col for col in profiles_df.columns if col.startswith('P')]
+    values = profiles_df.set_index('gene')[conditions].astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = np.log10(values.where(values > 0))
+    order = np.argsort(logs.loc[gene].to_numpy(), kind='stable')
+    positions = np.arange(len(conditions))
+
+    fig, ax = plt.subplots(figsize=(12, 5))
+    for name, r in zip(neighbors['gene'][:lines], neighbors['correlation'][:lines]):
+        ax.plot(positions, logs.loc[name].to_numpy()[order], linewidth=0.8, alpha=0.7, label=f'{name} (r={r:.2f})')
+    ax.plot(positions, logs.loc[gene].to_numpy()[order], color='black', linewidth=2, label=gene)
+    ax.set_xlabel(f'Conditions (sorted by {gene})')
+    ax.set_ylabel('log10(Mass Fraction)')
+    ax.set_title(f'Proteins Co-varying with {gene}')
+    ax.legend(fontsize=8)
+    plt.tight_layout()
+    return fig
+
+@timed('plot')
+def plot_coexpression(gene, neighbors, profiles_df, cache=None):
+    """共表达查询结果（见 coexpression.CoexpressionIndex）：近邻表和谱线图"""
+    if neighbors.empty:
+        st.info(f"{gene} is quantified in too few conditions for a co-expression lookup.")
+        return
+    st.write(f'Top {len(neighbors)} proteins co-varying with {gene} (Pearson correlation of log mass fraction '
+             f'across conditions):')
+    st.dataframe(neighbors)
+    show_figure(cache, figure_key('plot_coexpression', gene, len(neighbors)),
+                lambda: coexpression_figure(gene, profiles_df, neighbors))